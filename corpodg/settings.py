@@ -59,6 +59,8 @@ MIDDLEWARE = [
 
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', cast=Csv())
+# Cabeceras de la busqueda de vuelos que el frontend necesita leer
+CORS_EXPOSE_HEADERS = ['X-Cache', 'X-Search-Session']
 
 # Django REST Framework Configuration
 REST_FRAMEWORK = {
@@ -111,6 +113,19 @@ else:
     })
 
 
+# Cache
+# Por defecto memoria local (por proceso). En produccion con varios workers
+# conviene un backend compartido, p. ej.:
+#   CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+#   CACHE_LOCATION=redis://localhost:6379/1
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='corpodg-default'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -175,6 +190,26 @@ SEATMAP_SANDBOX = config('SEATMAP_SANDBOX', default=True, cast=bool)
 BOOKING_SANDBOX = config('BOOKING_SANDBOX', default=True, cast=bool)
 # Enviar voucher (boletos + PDF) por correo al confirmar la reserva
 BOOKING_SEND_EMAIL = config('BOOKING_SEND_EMAIL', default=True, cast=bool)
+# Intentos de reserva (cache + BD): segundos entre purgas de los vencidos
+BOOKING_INTENT_PURGE_INTERVAL = config('BOOKING_INTENT_PURGE_INTERVAL', default=3600, cast=int)
+# Confirmacion idempotente: duracion del bloqueo y espera maxima de las peticiones concurrentes
+BOOKING_CONFIRM_LOCK_SECONDS = config('BOOKING_CONFIRM_LOCK_SECONDS', default=120, cast=int)
+BOOKING_CONFIRM_WAIT = config('BOOKING_CONFIRM_WAIT', default=30, cast=int)
+
+# Cache de respuestas del catalogo (GET de destinos, vuelos, paquetes, regiones...):
+# TTL en segundos de cada version; 0 la desactiva
+CATALOGO_CACHE_TTL = config('CATALOGO_CACHE_TTL', default=3600, cast=int)
+# Arbol geografico cacheado (/api/regiones/arbol/): TTL en segundos de cada version
+ARBOL_GEOGRAFICO_TTL = config('ARBOL_GEOGRAFICO_TTL', default=86400, cast=int)
+
+# Cola de tareas en segundo plano (worker: python manage.py procesar_tareas)
+TAREAS_WORKERS = config('TAREAS_WORKERS', default=2, cast=int)
+TAREAS_LOTE = config('TAREAS_LOTE', default=10, cast=int)
+TAREAS_MAX_INTENTOS = config('TAREAS_MAX_INTENTOS', default=5, cast=int)
+TAREAS_BACKOFF_BASE = config('TAREAS_BACKOFF_BASE', default=30, cast=int)
+TAREAS_BACKOFF_MAX = config('TAREAS_BACKOFF_MAX', default=3600, cast=int)
+TAREAS_LEASE_SECONDS = config('TAREAS_LEASE_SECONDS', default=300, cast=int)
+TAREAS_RETENCION_DIAS = config('TAREAS_RETENCION_DIAS', default=7, cast=int)
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
@@ -196,6 +231,52 @@ CLIENT_ID = config('CLIENT_ID', default='')
 CLIENT_SECRET = config('CLIENT_SECRET', default='')
 SABRE_AUTH_URL = config('SABRE_AUTH_URL', default='https://api.cert.platform.sabre.com/v2/auth/token')
 SABRE_TOKEN_REFRESH_MARGIN = config('SABRE_TOKEN_REFRESH_MARGIN', default=60, cast=int)
+# Hilo por proceso que renueva el token antes de entrar en el margen
+SABRE_TOKEN_BACKGROUND_REFRESH = config('SABRE_TOKEN_BACKGROUND_REFRESH', default=True, cast=bool)
+# Espera maxima por la renovacion que hace otro worker (candado en la cache)
+SABRE_TOKEN_LOCK_TIMEOUT = config('SABRE_TOKEN_LOCK_TIMEOUT', default=35, cast=int)
+# Cache de busquedas (segundos): frescas durante TTL, luego se sirven "viejas"
+# durante STALE mientras se refrescan en segundo plano. TTL=0 desactiva la cache.
+SABRE_SEARCH_CACHE_TTL = config('SABRE_SEARCH_CACHE_TTL', default=300, cast=int)
+SABRE_SEARCH_CACHE_STALE = config('SABRE_SEARCH_CACHE_STALE', default=600, cast=int)
+# Cache de revalidaciones por huella del itinerario (segundos, 0 la desactiva)
+SABRE_REVALIDATE_CACHE_TTL = config('SABRE_REVALIDATE_CACHE_TTL', default=60, cast=int)
+# Revalidacion en lote: itinerarios maximos por llamada e hilos en paralelo
+SABRE_REVALIDATE_BATCH_MAX = config('SABRE_REVALIDATE_BATCH_MAX', default=10, cast=int)
+SABRE_REVALIDATE_BATCH_WORKERS = config('SABRE_REVALIDATE_BATCH_WORKERS', default=4, cast=int)
+# Mapas de asientos: cache por vuelo/cabina y vida de las versiones para deltas
+SEATMAP_CACHE_TTL = config('SEATMAP_CACHE_TTL', default=60, cast=int)
+SEATMAP_VERSION_TTL = config('SEATMAP_VERSION_TTL', default=900, cast=int)
+# Calendario de tarifas (busqueda flexible): +/- dias maximos e hilos en paralelo
+SABRE_FLEX_MAX_DAYS = config('SABRE_FLEX_MAX_DAYS', default=3, cast=int)
+SABRE_FLEX_MAX_WORKERS = config('SABRE_FLEX_MAX_WORKERS', default=4, cast=int)
+# Max. segundos que una peticion identica espera a la que ya esta en vuelo
+SABRE_SINGLE_FLIGHT_TIMEOUT = config('SABRE_SINGLE_FLIGHT_TIMEOUT', default=35, cast=int)
+# Circuit breaker por endpoint (ver servicios/circuitoSabre.py): se abre si en
+# WINDOW segundos hay MIN_CALLS llamadas y ERROR_RATE de ellas fallan; abierto
+# durante OPEN_SECONDS responde 503 sin llamar a Sabre.
+SABRE_CIRCUIT_WINDOW = config('SABRE_CIRCUIT_WINDOW', default=60, cast=int)
+SABRE_CIRCUIT_MIN_CALLS = config('SABRE_CIRCUIT_MIN_CALLS', default=10, cast=int)
+SABRE_CIRCUIT_ERROR_RATE = config('SABRE_CIRCUIT_ERROR_RATE', default=0.5, cast=float)
+SABRE_CIRCUIT_OPEN_SECONDS = config('SABRE_CIRCUIT_OPEN_SECONDS', default=30, cast=int)
+# Timeout de lectura adaptativo: p99 observado * FACTOR, entre MIN y HTTP_TIMEOUT_SABRE
+SABRE_ADAPTIVE_TIMEOUT_FACTOR = config('SABRE_ADAPTIVE_TIMEOUT_FACTOR', default=1.5, cast=float)
+SABRE_ADAPTIVE_TIMEOUT_MIN = config('SABRE_ADAPTIVE_TIMEOUT_MIN', default=5, cast=int)
+
+# HTTP SALIENTE (pool keep-alive compartido, ver LlamadosAPIS/Cliente_HTTP.py)
+# Timeouts (connect, read) en segundos por integracion.
+HTTP_TIMEOUTS = {
+    'sabre': (config('HTTP_CONNECT_TIMEOUT', default=5, cast=float),
+              config('HTTP_TIMEOUT_SABRE', default=30, cast=float)),
+    'sabre_auth': (config('HTTP_CONNECT_TIMEOUT', default=5, cast=float),
+                   config('HTTP_TIMEOUT_SABRE_AUTH', default=30, cast=float)),
+    'whatsapp': (config('HTTP_CONNECT_TIMEOUT', default=5, cast=float),
+                 config('HTTP_TIMEOUT_WHATSAPP', default=15, cast=float)),
+    'recursos': (config('HTTP_CONNECT_TIMEOUT', default=3, cast=float),
+                 config('HTTP_TIMEOUT_RECURSOS', default=8, cast=float)),
+}
+HTTP_POOL_MAXSIZE = config('HTTP_POOL_MAXSIZE', default=20, cast=int)
+HTTP_MAX_RETRIES = config('HTTP_MAX_RETRIES', default=2, cast=int)
 
 # CHATBOT AI CONFIGURATION (Groq)
 GROQ_API_KEY = config('GROQ_API_KEY', default='')
@@ -0,0 +1,171 @@
+"""Sesiones HTTP compartidas para las integraciones externas.
+
+Cada integracion (Sabre, autenticacion de Sabre, WhatsApp, recursos del PDF)
+tiene su propia ``requests.Session`` con un pool de conexiones keep-alive por
+host, de modo que las llamadas sucesivas reutilizan la conexion TCP+TLS en
+lugar de repetir el handshake.
+
+Reintentos: urllib3 reintenta con backoff exponencial los fallos de conexion
+(la peticion nunca salio) y, solo en metodos idempotentes (GET/HEAD/OPTIONS),
+tambien las lecturas fallidas y las respuestas 502/503/504. Los POST no se
+reintentan una vez enviados.
+
+Timeouts: ``(connect, read)`` por integracion, configurables con la setting
+``HTTP_TIMEOUTS`` (ver settings.py).
+
+Para las vistas async (ASGI) existe ``cliente_http_async``: un
+``httpx.AsyncClient`` por integracion y por event loop, con los mismos
+limites de pool y timeouts. httpx es opcional; si no esta instalado la
+funcion devuelve None y los llamadores usan la sesion sincrona en un hilo.
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings as django_settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+INTEGRACION_SABRE = "sabre"
+INTEGRACION_SABRE_AUTH = "sabre_auth"
+INTEGRACION_WHATSAPP = "whatsapp"
+INTEGRACION_RECURSOS = "recursos"
+
+TIMEOUTS_POR_DEFECTO = {
+    INTEGRACION_SABRE: (5, 30),
+    INTEGRACION_SABRE_AUTH: (5, 30),
+    INTEGRACION_WHATSAPP: (5, 15),
+    INTEGRACION_RECURSOS: (3, 8),
+}
+_TIMEOUT_GENERICO = (5, 30)
+
+# Excepciones de red que deben capturar los llamadores (sync y async).
+ERRORES_HTTP = (requests.RequestException,) + ((httpx.HTTPError,) if httpx else ())
+
+_SESIONES_LOCK = threading.Lock()
+_SESIONES = {}
+# event loop -> {integracion: httpx.AsyncClient}
+_CLIENTES_ASYNC = weakref.WeakKeyDictionary()
+
+
+def _get_setting(name, default):
+    if django_settings.configured:
+        return getattr(django_settings, name, default)
+    return os.getenv(name, default)
+
+
+def _get_int_setting(name, default):
+    try:
+        return max(int(_get_setting(name, default)), 0)
+    except (TypeError, ValueError):
+        return default
+
+
+def timeout_http(integracion):
+    """Timeout ``(connect, read)`` configurado para ``integracion``."""
+    configurados = _get_setting("HTTP_TIMEOUTS", None) or {}
+    valor = configurados.get(integracion) or TIMEOUTS_POR_DEFECTO.get(
+        integracion, _TIMEOUT_GENERICO
+    )
+    if isinstance(valor, (list, tuple)):
+        return tuple(valor)
+    return valor
+
+
+def _crear_sesion():
+    reintentos = _get_int_setting("HTTP_MAX_RETRIES", 2)
+    retry = Retry(
+        total=reintentos,
+        connect=reintentos,
+        read=reintentos,
+        status=reintentos,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=_get_int_setting("HTTP_POOL_CONNECTIONS", 10),
+        pool_maxsize=_get_int_setting("HTTP_POOL_MAXSIZE", 20),
+        max_retries=retry,
+    )
+    sesion = requests.Session()
+    sesion.mount("https://", adapter)
+    sesion.mount("http://", adapter)
+    return sesion
+
+
+def sesion_http(integracion):
+    """Sesion compartida (creada una vez por proceso) para ``integracion``."""
+    sesion = _SESIONES.get(integracion)
+    if sesion is not None:
+        return sesion
+    with _SESIONES_LOCK:
+        sesion = _SESIONES.get(integracion)
+        if sesion is None:
+            sesion = _SESIONES[integracion] = _crear_sesion()
+        return sesion
+
+
+def cerrar_sesiones_http():
+    """Cierra los pools abiertos (util en tests o al reconfigurar)."""
+    with _SESIONES_LOCK:
+        for sesion in _SESIONES.values():
+            sesion.close()
+        _SESIONES.clear()
+
+
+def _timeout_httpx(integracion):
+    valor = timeout_http(integracion)
+    if isinstance(valor, tuple):
+        connect, read = valor
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(valor)
+
+
+def cliente_http_async(integracion):
+    """``httpx.AsyncClient`` compartido dentro del event loop actual.
+
+    Devuelve None si httpx no esta instalado. Debe llamarse desde una
+    corrutina (usa el loop en ejecucion para aislar los clientes).
+    """
+    if httpx is None:
+        return None
+    loop = asyncio.get_running_loop()
+    clientes = _CLIENTES_ASYNC.setdefault(loop, {})
+    cliente = clientes.get(integracion)
+    if cliente is None or cliente.is_closed:
+        limites = httpx.Limits(
+            max_connections=_get_int_setting("HTTP_ASYNC_MAX_CONNECTIONS", 200),
+            max_keepalive_connections=_get_int_setting("HTTP_POOL_MAXSIZE", 20),
+        )
+        transporte = httpx.AsyncHTTPTransport(
+            retries=_get_int_setting("HTTP_MAX_RETRIES", 2)  # solo fallos de conexion
+        )
+        cliente = clientes[integracion] = httpx.AsyncClient(
+            timeout=_timeout_httpx(integracion), limits=limites, transport=transporte,
+        )
+    return cliente
+
+
+async def post_async(integracion, url, **kwargs):
+    """POST no bloqueante; sin httpx delega en la sesion sincrona en un hilo."""
+    cliente = cliente_http_async(integracion)
+    if cliente is None:
+        kwargs.setdefault("timeout", timeout_http(integracion))
+        return await sync_to_async(sesion_http(integracion).post, thread_sensitive=False)(
+            url, **kwargs
+        )
+    if isinstance(kwargs.get("timeout"), tuple):
+        connect, read = kwargs["timeout"]
+        kwargs["timeout"] = httpx.Timeout(read, connect=connect)
+    return await cliente.post(url, **kwargs)
@@ -1,16 +1,39 @@
 import base64
+import logging
 import os
 import threading
 import time
 
 import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings as django_settings
 
+from .Cliente_HTTP import INTEGRACION_SABRE_AUTH, sesion_http, timeout_http
+
 DEFAULT_SABRE_AUTH_URL = "https://api.cert.platform.sabre.com/v2/auth/token"
 DEFAULT_TOKEN_DURATION_SECONDS = 604800
 
+# Cache compartida entre workers (ver obtener_token_sabre)
+CLAVE_TOKEN = "sabre_token"
+CLAVE_TOKEN_CANDADO = "sabre_token:lock"
+
+# Se descartan tokens a menos de esto de caducar en Sabre
+_MARGEN_SEGURIDAD = 5
+# Un 401 no renueva un token emitido hace menos de esto (evita estampidas)
+_INTERVALO_MINIMO_FORZADO = 30
+_ESPERA_SONDEO = 0.1
+_ESPERA_MINIMA_REFRESCO = 5
+_ESPERA_MAXIMA_REFRESCO = 300
+_ESPERA_REINTENTO_REFRESCO = 30
+
 _TOKEN_LOCK = threading.Lock()
-_TOKEN_CACHE = {"value": "", "expires_at": 0.0}
+_TOKEN_RENOVACION_LOCK = threading.Lock()
+_RENOVACION_EN_FONDO = threading.Lock()
+_TOKEN_VACIO = {"value": "", "obtained_at": 0.0, "refresh_at": 0.0, "expires_at": 0.0}
+_TOKEN_CACHE = dict(_TOKEN_VACIO)
+_REFRESCADOR = None
+
+logger = logging.getLogger(__name__)
 
 
 class SabreAuthError(RuntimeError):
@@ -57,7 +80,10 @@ def _solicitar_token_sabre():
     data = {"grant_type": "client_credentials"}
 
     try:
-        response = requests.post(auth_url, headers=headers, data=data, timeout=30)
+        response = sesion_http(INTEGRACION_SABRE_AUTH).post(
+            auth_url, headers=headers, data=data,
+            timeout=timeout_http(INTEGRACION_SABRE_AUTH),
+        )
     except requests.RequestException as error:
         raise SabreAuthError(f"No se pudo conectar con Sabre Auth: {error}") from error
 
@@ -82,37 +108,228 @@ def _solicitar_token_sabre():
     return access_token, expires_in
 
 
-def obtener_token_sabre(force_refresh=False):
-    current_time = time.time()
-    if (
-        not force_refresh
-        and _TOKEN_CACHE["value"]
-        and current_time < _TOKEN_CACHE["expires_at"]
-    ):
-        return _TOKEN_CACHE["value"]
+def _cache_compartida():
+    """Cache de Django (compartida entre workers con Redis/Memcached), si hay."""
+    if not django_settings.configured:
+        return None
+    from django.core.cache import cache
+
+    return cache
+
+
+def _get_int_setting(name, default):
+    try:
+        return max(int(_get_setting(name, default)), 0)
+    except (TypeError, ValueError):
+        return default
+
 
+def _entrada_vigente(entrada, ahora):
+    return bool(entrada and entrada.get("value") and ahora < entrada.get("expires_at", 0))
+
+
+def _publicar(entrada):
+    """Copia ``entrada`` al cache local del proceso."""
+    with _TOKEN_LOCK:
+        _TOKEN_CACHE.update(entrada)
+    return entrada["value"]
+
+
+def _leer_compartida():
+    cache = _cache_compartida()
+    if cache is None:
+        return None
+    try:
+        return cache.get(CLAVE_TOKEN)
+    except Exception:  # cache caida: seguimos con el token local
+        logger.warning("No se pudo leer el token de Sabre de la cache", exc_info=True)
+        return None
+
+
+def _solicitar_y_guardar():
+    """Pide un token a Sabre y lo deja en la cache compartida y en la local.
+
+    ``expires_at`` es la caducidad real (menos un margen de seguridad) y
+    ``refresh_at`` el momento a partir del cual se renueva en segundo plano
+    (``SABRE_TOKEN_REFRESH_MARGIN`` antes de caducar).
+    """
+    token, expires_in = _solicitar_token_sabre()
+    ahora = time.time()
+    margen = min(_get_refresh_margin_seconds(), max(expires_in // 2, 1))
+    entrada = {
+        "value": token,
+        "obtained_at": ahora,
+        "refresh_at": ahora + max(expires_in - margen, 1),
+        "expires_at": ahora + max(expires_in - _MARGEN_SEGURIDAD, 1),
+    }
+    cache = _cache_compartida()
+    if cache is not None:
+        try:
+            cache.set(CLAVE_TOKEN, entrada, max(int(expires_in - _MARGEN_SEGURIDAD), 1))
+        except Exception:
+            logger.warning("No se pudo guardar el token de Sabre en la cache", exc_info=True)
+    return _publicar(entrada)
+
+
+def _renovar(valor_rechazado=None):
+    """Renueva el token coordinado entre workers (un solo POST a Sabre Auth).
+
+    Quien obtiene el candado pide el token; el resto espera a que aparezca
+    en la cache compartida uno distinto de ``valor_rechazado``. Si el
+    candado no se libera a tiempo (worker caido) se pide igualmente.
+    """
+    cache = _cache_compartida()
+    if cache is None:
+        with _TOKEN_RENOVACION_LOCK:
+            return _solicitar_y_guardar()
+
+    espera = _get_int_setting("SABRE_TOKEN_LOCK_TIMEOUT", 35)
+    with _TOKEN_RENOVACION_LOCK:  # un solo hilo por proceso compite por el candado
+        entrada = _leer_compartida()
+        if _entrada_vigente(entrada, time.time()) and entrada["value"] != valor_rechazado:
+            return _publicar(entrada)
+
+        if cache.add(CLAVE_TOKEN_CANDADO, 1, espera):
+            try:
+                return _solicitar_y_guardar()
+            finally:
+                cache.delete(CLAVE_TOKEN_CANDADO)
+
+        limite = time.time() + espera
+        while time.time() < limite:
+            time.sleep(_ESPERA_SONDEO)
+            entrada = _leer_compartida()
+            if _entrada_vigente(entrada, time.time()) and entrada["value"] != valor_rechazado:
+                return _publicar(entrada)
+        return _solicitar_y_guardar()
+
+
+def _renovar_en_fondo():
+    """Dispara una renovacion en un hilo si no hay otra en curso en el proceso."""
+    if not _RENOVACION_EN_FONDO.acquire(blocking=False):
+        return
+
+    def _worker():
+        try:
+            entrada = _leer_compartida()
+            if entrada and time.time() < entrada.get("refresh_at", 0):
+                _publicar(entrada)  # otro worker ya lo renovo
+                return
+            _renovar(valor_rechazado=_TOKEN_CACHE["value"])
+        except (SabreAuthError, ValueError):
+            logger.exception("Fallo la renovacion en segundo plano del token de Sabre")
+        finally:
+            _RENOVACION_EN_FONDO.release()
+
+    threading.Thread(target=_worker, daemon=True).start()
+
+
+def _bucle_refresco():
+    """Hilo del proceso que renueva el token antes de que entre en el margen.
+
+    Solo mantiene vivo un token que ya existe: no pide uno nuevo si el
+    proceso nunca obtuvo ninguno.
+    """
+    espera = _ESPERA_MINIMA_REFRESCO
+    while True:
+        time.sleep(espera)
+        entrada = _leer_compartida()
+        if entrada:
+            _publicar(entrada)
+        refresh_at = _TOKEN_CACHE.get("refresh_at", 0)
+        if not _TOKEN_CACHE["value"] or time.time() < refresh_at:
+            espera = min(max(refresh_at - time.time(), _ESPERA_MINIMA_REFRESCO),
+                         _ESPERA_MAXIMA_REFRESCO)
+            continue
+        try:
+            _renovar(valor_rechazado=_TOKEN_CACHE["value"])
+            espera = _ESPERA_MINIMA_REFRESCO
+        except (SabreAuthError, ValueError):
+            logger.exception("Fallo la renovacion programada del token de Sabre")
+            espera = _ESPERA_REINTENTO_REFRESCO
+
+
+def iniciar_refresco_token():
+    """Arranca (una vez por proceso) el hilo de renovacion proactiva.
+
+    Se desactiva con ``SABRE_TOKEN_BACKGROUND_REFRESH=False``; en ese caso
+    la renovacion la dispara la primera peticion que entra en el margen,
+    igualmente en segundo plano.
+    """
+    global _REFRESCADOR
+    if not _get_setting("SABRE_TOKEN_BACKGROUND_REFRESH", True):
+        return
     with _TOKEN_LOCK:
-        current_time = time.time()
-        if (
-            not force_refresh
-            and _TOKEN_CACHE["value"]
-            and current_time < _TOKEN_CACHE["expires_at"]
+        if _REFRESCADOR is not None and _REFRESCADOR.is_alive():
+            return
+        _REFRESCADOR = threading.Thread(
+            target=_bucle_refresco, name="sabre-token-refresh", daemon=True
+        )
+        _REFRESCADOR.start()
+
+
+def obtener_token_sabre(force_refresh=False):
+    """Token vigente de Sabre, compartido entre workers via la cache de Django.
+
+    Flujo normal sin bloqueo: cache local del proceso -> cache compartida.
+    Cuando el token entra en ``SABRE_TOKEN_REFRESH_MARGIN`` se sigue
+    sirviendo (aun es valido) mientras se renueva en segundo plano. Solo se
+    espera a Sabre Auth si no hay ningun token vigente.
+
+    ``force_refresh`` (tras un 401) no pide otro token si la cache ya tiene
+    uno distinto al local o recien emitido: asi N peticiones rechazadas a la
+    vez provocan una sola renovacion.
+    """
+    ahora = time.time()
+    if not force_refresh and _entrada_vigente(_TOKEN_CACHE, ahora):
+        token = _TOKEN_CACHE["value"]
+        if ahora >= _TOKEN_CACHE.get("refresh_at", 0):
+            _renovar_en_fondo()
+        return token
+
+    iniciar_refresco_token()
+    entrada = _leer_compartida()
+    if force_refresh:
+        rechazado = _TOKEN_CACHE["value"]
+        if _entrada_vigente(entrada, ahora) and (
+            entrada["value"] != rechazado
+            or ahora - entrada.get("obtained_at", 0) < _INTERVALO_MINIMO_FORZADO
         ):
-            return _TOKEN_CACHE["value"]
+            return _publicar(entrada)
+        return _renovar(valor_rechazado=rechazado)
+
+    if _entrada_vigente(entrada, ahora):
+        _publicar(entrada)
+        if ahora >= entrada.get("refresh_at", 0):
+            _renovar_en_fondo()
+        return entrada["value"]
+    return _renovar()
 
-        token, expires_in = _solicitar_token_sabre()
-        refresh_margin = _get_refresh_margin_seconds()
-        cache_ttl = max(expires_in - refresh_margin, 1)
 
-        _TOKEN_CACHE["value"] = token
-        _TOKEN_CACHE["expires_at"] = time.time() + cache_ttl
+async def obtener_token_sabre_async(force_refresh=False):
+    """Variante para vistas async: el token cacheado se devuelve sin bloquear.
+
+    Renovarlo (algo que ocurre pocas veces) se hace en un hilo para compartir
+    el mismo candado y cache que ``obtener_token_sabre``.
+    """
+    ahora = time.time()
+    if (
+        not force_refresh
+        and _entrada_vigente(_TOKEN_CACHE, ahora)
+        and ahora < _TOKEN_CACHE.get("refresh_at", 0)
+    ):
         return _TOKEN_CACHE["value"]
+    return await sync_to_async(obtener_token_sabre, thread_sensitive=False)(
+        force_refresh=force_refresh
+    )
 
 
 def limpiar_cache_token_sabre():
     with _TOKEN_LOCK:
-        _TOKEN_CACHE["value"] = ""
-        _TOKEN_CACHE["expires_at"] = 0.0
+        _TOKEN_CACHE.update(_TOKEN_VACIO)
+    cache = _cache_compartida()
+    if cache is not None:
+        cache.delete(CLAVE_TOKEN)
 
 
 def obtener_token_sabre_v1():
@@ -525,6 +525,12 @@ class PaqueteTuristicoAdmin(admin.ModelAdmin):
     autocomplete_fields = ['aerolinea']
     date_hierarchy = 'fecha_creacion'
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Aplicar la vigencia al editar (p. ej. 'precio_aplica_hasta' movida a
+        # una fecha futura); las lecturas de la API ya no escriben.
+        PaqueteTuristico.sincronizar_vigencia()
+
     def get_search_results(self, request, queryset, search_term):
         queryset, may_have_duplicates = super().get_search_results(
             request, queryset, search_term,
@@ -1041,3 +1047,42 @@ class ReservaPaqueteAdmin(ReservaAdminBase):
             'classes': ('collapse',),
         }),
     )
+
+
+# =====================================================
+# TAREAS EN SEGUNDO PLANO (cola del worker procesar_tareas)
+# =====================================================
+from .models import TareaFondo
+
+COLORES_TAREA = {'PENDIENTE': '#2980b9', 'EN_PROCESO': '#f39c12',
+                 'COMPLETADA': '#27ae60', 'FALLIDA': '#c0392b'}
+
+
+@admin.register(TareaFondo)
+class TareaFondoAdmin(admin.ModelAdmin):
+    """Estado de la cola: pendientes, reintentos y fallidas (solo lectura)."""
+    list_display = ['tipo', 'clave', 'estado_coloreado', 'intentos', 'max_intentos',
+                    'disponible_en', 'fecha_actualizacion']
+    list_filter = ['estado', 'tipo', 'fecha_creacion']
+    search_fields = ['clave', 'ultimo_error']
+    date_hierarchy = 'fecha_creacion'
+    readonly_fields = ['tipo', 'clave', 'payload', 'estado', 'intentos', 'max_intentos',
+                       'disponible_en', 'bloqueada_hasta', 'ultimo_error',
+                       'fecha_creacion', 'fecha_actualizacion']
+    actions = ['reintentar']
+
+    def has_add_permission(self, request):
+        return False
+
+    def estado_coloreado(self, obj):
+        return format_html('<b style="color:{}">{}</b>', COLORES_TAREA.get(obj.estado, '#333'),
+                           obj.get_estado_display())
+    estado_coloreado.short_description = 'Estado'
+    estado_coloreado.admin_order_field = 'estado'
+
+    @admin.action(description='Reintentar ahora')
+    def reintentar(self, request, queryset):
+        n = queryset.exclude(estado='EN_PROCESO').update(
+            estado='PENDIENTE', intentos=0, disponible_en=timezone.now(), bloqueada_hasta=None,
+        )
+        self.message_user(request, f"{n} tarea(s) vuelven a la cola.", messages.SUCCESS)
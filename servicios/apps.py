@@ -10,6 +10,11 @@ class ServiciosConfig(AppConfig):
     def ready(self):
         """Se ejecuta cuando la app está lista - crea datos iniciales si no existen"""
         import sys
+
+        from servicios.cacheCatalogo import conectar_senales
+
+        # Invalidación de la cache del catálogo (en todos los procesos)
+        conectar_senales()
         
         # Solo ejecutar con runserver, no con migrate u otros comandos
         if 'runserver' not in sys.argv:
@@ -0,0 +1,80 @@
+"""Arbol geografico region -> pais -> ciudad para ``/api/regiones/arbol/``.
+
+El detalle de ``RegionSerializer`` anida paises y ciudades a traves de
+serializers y relaciones; para el catalogo completo eso son cientos de
+consultas (o decenas de prefetch) por peticion. El arbol se arma aqui con
+tres consultas planas (regiones, paises y ciudades, cada una con su
+``cantidad_paquetes`` vigentes anotada) y se enlaza en memoria.
+
+El resultado se guarda ya serializado (``bytes`` JSON) en la cache bajo la
+version del catalogo (``cacheCatalogo.clave_catalogo``): guardar o borrar
+una Region, PaisRegion, Ciudad o PaqueteTuristico la sube, y la fecha va en
+la clave porque la vigencia de los paquetes depende del dia.
+"""
+
+from .cacheCatalogo import clave_catalogo
+from .cacheSabre import _cache, _setting_int
+from .jsonRapido import dumps
+
+_CAMPOS_REGION = ("id", "nombre", "descripcion", "imagen_url", "orden")
+_CAMPOS_PAIS = ("id", "region_id", "nombre", "nombre_en", "codigo_iso", "capital",
+                "bandera_png", "bandera_svg")
+_CAMPOS_CIUDAD = ("id", "pais_id", "nombre", "codigo_ciudad", "latitud", "longitud",
+                  "es_capital", "imagen_url")
+
+
+def _conteo_vigentes():
+    from django.db.models import Count
+
+    from .models import PaqueteTuristico
+
+    return Count("paquetes", filter=PaqueteTuristico.objects.condicion_vigente("paquetes__"))
+
+
+def construir_arbol():
+    """Regiones activas con sus paises y ciudades activos (tres consultas)."""
+    from .models import Ciudad, PaisRegion, Region
+
+    regiones = list(Region.objects.filter(activo=True).order_by("orden", "nombre")
+                    .annotate(cantidad_paquetes=_conteo_vigentes())
+                    .values(*_CAMPOS_REGION, "cantidad_paquetes"))
+    paises = list(PaisRegion.objects.filter(activo=True, region__activo=True)
+                  .order_by("nombre")
+                  .annotate(cantidad_paquetes=_conteo_vigentes())
+                  .values(*_CAMPOS_PAIS, "cantidad_paquetes"))
+    ciudades = (Ciudad.objects.filter(activo=True, pais__activo=True, pais__region__activo=True)
+                .order_by("-es_capital", "nombre")
+                .annotate(cantidad_paquetes=_conteo_vigentes())
+                .values(*_CAMPOS_CIUDAD, "cantidad_paquetes"))
+
+    nombres = dict(Region.REGIONES_CHOICES)
+    por_pais = {p["id"]: [] for p in paises}
+    for ciudad in ciudades:
+        por_pais[ciudad.pop("pais_id")].append(ciudad)
+    por_region = {r["id"]: [] for r in regiones}
+    for pais in paises:
+        pais["bandera_url"] = pais["bandera_svg"] or pais["bandera_png"]
+        pais["ciudades"] = por_pais[pais["id"]]
+        pais["cantidad_ciudades"] = len(pais["ciudades"])
+        por_region[pais.pop("region_id")].append(pais)
+    for region in regiones:
+        region["nombre_display"] = nombres.get(region["nombre"], region["nombre"])
+        region["paises"] = por_region[region["id"]]
+        region["cantidad_paises"] = len(region["paises"])
+    return regiones
+
+
+def arbol_geografico(version=None):
+    """``(bytes JSON del arbol, estado)`` con estado 'hit' o 'miss'.
+
+    ``version`` evita volver a leer la version del catalogo si la vista ya la tiene.
+    """
+    clave = clave_catalogo("arbol_geografico", version=version)
+    if _cache is not None:
+        contenido = _cache.get(clave)
+        if contenido is not None:
+            return contenido, "hit"
+    contenido = dumps(construir_arbol())
+    if _cache is not None:
+        _cache.set(clave, contenido, _setting_int("ARBOL_GEOGRAFICO_TTL", 60 * 60 * 24))
+    return contenido, "miss"
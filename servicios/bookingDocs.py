@@ -564,8 +564,10 @@ def _link_callback(uri, rel):
         return uri
     if uri.startswith("http://") or uri.startswith("https://"):
         try:
-            import requests
-            resp = requests.get(uri, timeout=8)
+            from .LlamadosAPIS.Cliente_HTTP import INTEGRACION_RECURSOS, sesion_http, timeout_http
+            resp = sesion_http(INTEGRACION_RECURSOS).get(
+                uri, timeout=timeout_http(INTEGRACION_RECURSOS)
+            )
             if resp.status_code == 200 and resp.content:
                 ctype = resp.headers.get("Content-Type", "")
                 ext = ".png"
@@ -2,9 +2,9 @@
 
 Flujo:
   1) POST /booking/checkout/   -> crea Stripe Checkout Session.
-                                  Guarda en cache el "intent" (opcion, pax,
-                                  asientos, contacto) con la session_id de
-                                  Stripe como key.
+                                  Guarda el "intent" (opcion, pax, asientos,
+                                  contacto) en cache + BD (IntentoReserva)
+                                  con la session_id de Stripe como key.
   2) Usuario paga en Stripe (test mode con tarjetas 4242 4242 4242 4242).
   3) POST /booking/confirm/    -> { session_id }
                                   Verifica que el pago haya sido exitoso,
@@ -20,6 +20,7 @@ Modo SANDBOX:
 
 import datetime as _dt
 import json
+import logging
 import os
 import random
 import string
@@ -46,6 +47,8 @@ except ImportError:  # pragma: no cover
     _django_settings = None
     _cache = None
 
+from .intentosReserva import TIPO_VUELO, confirmar_una_vez, guardar_intent, recuperar_intent
+from .tareasFondo import TAREA_VOUCHER_VUELO, encolar
 
 # ---------------------------------------------------------------------------
 # Helpers
@@ -202,7 +205,7 @@ def crear_checkout(datos):
     except Exception as e:  # noqa: BLE001
         return {"error": f"Stripe rechazo la sesion: {e}", "code": 502}
 
-    # Guardar intento en cache (24h) para poder confirmar luego
+    # Guardar intento (cache + BD, 24h) para poder confirmar luego
     intent = {
         "booking_ref": booking_ref,
         "stripe_session_id": session.id,
@@ -214,8 +217,7 @@ def crear_checkout(datos):
         "total": total,
         "creado": _dt.datetime.utcnow().isoformat() + "Z",
     }
-    if _cache is not None:
-        _cache.set(f"booking_intent:{session.id}", json.dumps(intent), 60 * 60 * 24)
+    guardar_intent(TIPO_VUELO, session.id, intent)
 
     return {
         "checkout_url": session.url,
@@ -229,12 +231,7 @@ def crear_checkout(datos):
 
 
 def _recuperar_intent(session_id):
-    if _cache is None:
-        return None
-    raw = _cache.get(f"booking_intent:{session_id}")
-    if not raw:
-        return None
-    return json.loads(raw)
+    return recuperar_intent(TIPO_VUELO, session_id)
 
 
 # ---------------------------------------------------------------------------
@@ -242,9 +239,13 @@ def _recuperar_intent(session_id):
 # ---------------------------------------------------------------------------
 
 def confirmar_reserva(session_id):
+    """Confirma la reserva de ``session_id`` (idempotente, ver ``confirmar_una_vez``)."""
     if not session_id:
         return {"error": "Falta 'session_id'", "code": 400}
+    return confirmar_una_vez(session_id, obtener_reserva_guardada, _confirmar_reserva)
+
 
+def _confirmar_reserva(session_id):
     try:
         _set_stripe_key()
         session = stripe.checkout.Session.retrieve(session_id)
@@ -312,7 +313,7 @@ def _guardar_reserva_bd(session_id, reserva, intent):
     Idempotente por stripe_session_id (confirm puede llamarse más de una vez).
     Nunca rompe el flujo de confirmación: los errores solo se loguean.
     """
-    import logging
+    obj = creada = None
     try:
         from .models import Cliente, ReservaVuelo
 
@@ -341,21 +342,6 @@ def _guardar_reserva_bd(session_id, reserva, intent):
             },
         )
 
-        # Avisar al correo configurado en el admin (solo la primera vez)
-        if creada:
-            from .notifications import notificar_nueva_reserva_async
-            notificar_nueva_reserva_async(
-                tipo="vuelo",
-                codigo=obj.pnr,
-                email_cliente=email,
-                telefono_cliente=telefono,
-                monto=obj.monto,
-                moneda=obj.moneda,
-                detalle=obj.ruta,
-                detalle_extra={"Pasajeros": obj.n_pasajeros,
-                               "Referencia": obj.booking_ref},
-            )
-
         # Registrar/actualizar también al cliente para su gestión
         if email:
             pax = (intent.get("pasajeros") or [{}])[0]
@@ -373,6 +359,28 @@ def _guardar_reserva_bd(session_id, reserva, intent):
             "No se pudo persistir la reserva de vuelo %s en la BD", session_id
         )
 
+    # Avisar al correo configurado en el admin (solo la primera vez). Va aparte
+    # y después del cliente: si no se puede encolar no afecta a lo demás.
+    if creada:
+        try:
+            from .notifications import notificar_nueva_reserva_async
+            notificar_nueva_reserva_async(
+                tipo="vuelo",
+                codigo=obj.pnr,
+                email_cliente=obj.email,
+                telefono_cliente=obj.telefono,
+                monto=obj.monto,
+                moneda=obj.moneda,
+                detalle=obj.ruta,
+                detalle_extra={"Pasajeros": obj.n_pasajeros,
+                               "Referencia": obj.booking_ref},
+                session_id=session_id,
+            )
+        except Exception:
+            logging.getLogger(__name__).exception(
+                "No se pudo encolar el aviso de la reserva de vuelo %s", session_id
+            )
+
 
 def _enviar_correo_activo():
     val = _setting("BOOKING_SEND_EMAIL", "1")
@@ -398,17 +406,40 @@ def _guardar_reserva(session_id, reserva):
 
 
 def obtener_reserva_guardada(clave):
-    """Recupera una reserva confirmada por session_id o por PNR."""
-    if _cache is None or not clave:
-        return None
-    raw = (_cache.get(f"booking_result:{clave}")
-           or _cache.get(f"booking_result_pnr:{clave}"))
-    if not raw:
+    """Recupera una reserva confirmada por session_id o por PNR.
+
+    Si la cache no la tiene (otro worker, reinicio, TTL vencido) se lee de
+    ``ReservaVuelo`` y se vuelve a cachear.
+    """
+    if not clave:
         return None
+    if _cache is not None:
+        raw = (_cache.get(f"booking_result:{clave}")
+               or _cache.get(f"booking_result_pnr:{clave}"))
+        if raw:
+            try:
+                return json.loads(raw)
+            except Exception:  # noqa: BLE001
+                return _reserva_desde_bd(clave)
+    return _reserva_desde_bd(clave)
+
+
+def _reserva_desde_bd(clave):
     try:
-        return json.loads(raw)
+        from django.db.models import Q
+
+        from .models import ReservaVuelo
+
+        obj = (ReservaVuelo.objects
+               .filter(Q(stripe_session_id=clave) | Q(pnr=clave))
+               .only("stripe_session_id", "datos")
+               .first())
     except Exception:  # noqa: BLE001
         return None
+    if obj is None or not obj.datos:
+        return None
+    _guardar_reserva(obj.stripe_session_id, obj.datos)
+    return obj.datos
 
 
 def _enviar_voucher_email(reserva, intent):
@@ -434,31 +465,39 @@ def _enviar_voucher_email(reserva, intent):
 
 
 def _enviar_voucher_email_async(session_id, reserva, intent):
-    """Genera PDFs + envía el correo en un hilo de fondo.
+    """Encola la generación de PDFs + envío del correo (tarea ``voucher_vuelo``).
 
     Así ``confirmar_reserva`` responde de inmediato y el usuario no espera a
-    que se generen los PDF ni a que el SMTP termine. Cuando el correo se
-    envía, se actualiza la reserva en cache para que la vista de estado
-    pueda reflejarlo.
+    que se generen los PDF ni a que el SMTP termine. El worker
+    ``procesar_tareas`` la ejecuta y la reintenta si falla.
     """
     if not _enviar_correo_activo():
         return
+    try:
+        encolar(TAREA_VOUCHER_VUELO,
+                {"session_id": session_id, "reserva": reserva, "intent": intent},
+                clave=f"{TAREA_VOUCHER_VUELO}:{session_id}")
+    except Exception:
+        logging.getLogger(__name__).exception(
+            "No se pudo encolar el voucher de la reserva %s", session_id
+        )
 
-    def _worker():
-        try:
-            _enviar_voucher_email(reserva, intent)
-        except Exception:  # noqa: BLE001
-            pass
-        # Refrescar la cache con el estado final del correo
-        try:
-            _guardar_reserva(session_id, reserva)
-        except Exception:  # noqa: BLE001
-            pass
 
-    import threading
-    t = threading.Thread(target=_worker, daemon=True)
-    t.start()
+def tarea_voucher(session_id, reserva, intent):
+    """Manejador de la tarea ``voucher_vuelo``.
+
+    Envía el correo y guarda su estado en la cache y en ``ReservaVuelo``;
+    lanza RuntimeError si no se envió para que la cola lo reintente.
+    """
+    if not _enviar_correo_activo():
+        return
+    from .models import ReservaVuelo
 
+    _enviar_voucher_email(reserva, intent)
+    _guardar_reserva(session_id, reserva)
+    ReservaVuelo.objects.filter(stripe_session_id=session_id).update(datos=reserva)
+    if not reserva["correo"].get("enviado"):
+        raise RuntimeError(reserva["correo"].get("mensaje") or "No se pudo enviar el voucher")
 
 
 def _stripe_receipt_url(session):
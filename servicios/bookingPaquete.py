@@ -3,9 +3,9 @@
 Espejo del flujo de vuelos (``bookingFlight.py``) pero para paquetes:
 
   1) POST /paquetes/booking/checkout/  -> crea Stripe Checkout Session.
-                                          Guarda en cache el "intent"
-                                          (paquete, viajeros, contacto,
-                                          n_personas) con la session_id.
+                                          Guarda el "intent" (paquete,
+                                          viajeros, contacto, n_personas)
+                                          en cache + BD con la session_id.
   2) Usuario paga en Stripe (test mode 4242 4242 4242 4242).
   3) POST /paquetes/booking/confirm/   -> { session_id }
                                           Verifica el pago, genera la
@@ -20,6 +20,7 @@ externo, sólo confirma el pago Stripe y arma la reserva.
 
 import datetime as _dt
 import json
+import logging
 import random
 import string
 
@@ -42,13 +43,13 @@ from .bookingFlight import (
     _stripe_receipt_url,
     _ahora_ecuador,
 )
+from .intentosReserva import TIPO_PAQUETE, confirmar_una_vez, guardar_intent, recuperar_intent
+from .tareasFondo import TAREA_VOUCHER_PAQUETE, encolar
 
 
 # Cache keys / TTL
-_INTENT_KEY = "paquete_intent:{sid}"
 _RESULT_KEY = "paquete_result:{sid}"
 _RESULT_LOC_KEY = "paquete_result_loc:{loc}"
-_INTENT_TTL = 60 * 60 * 24          # 24 h
 _RESULT_TTL = 60 * 60 * 24 * 7      # 7 días
 
 
@@ -233,9 +234,7 @@ def crear_checkout_paquete(datos):
         "total": total,
         "creado": _dt.datetime.utcnow().isoformat() + "Z",
     }
-    if _cache is not None:
-        _cache.set(_INTENT_KEY.format(sid=session.id),
-                   json.dumps(intent), _INTENT_TTL)
+    guardar_intent(TIPO_PAQUETE, session.id, intent)
 
     return {
         "checkout_url": session.url,
@@ -250,12 +249,7 @@ def crear_checkout_paquete(datos):
 
 
 def _recuperar_intent(session_id):
-    if _cache is None:
-        return None
-    raw = _cache.get(_INTENT_KEY.format(sid=session_id))
-    if not raw:
-        return None
-    return json.loads(raw)
+    return recuperar_intent(TIPO_PAQUETE, session_id)
 
 
 # ---------------------------------------------------------------------------
@@ -263,9 +257,13 @@ def _recuperar_intent(session_id):
 # ---------------------------------------------------------------------------
 
 def confirmar_reserva_paquete(session_id):
+    """Confirma la reserva de ``session_id`` (idempotente, ver ``confirmar_una_vez``)."""
     if not session_id:
         return {"error": "Falta 'session_id'", "code": 400}
+    return confirmar_una_vez(session_id, obtener_reserva_paquete_guardada, _confirmar_reserva_paquete)
+
 
+def _confirmar_reserva_paquete(session_id):
     try:
         _set_stripe_key()
         session = stripe.checkout.Session.retrieve(session_id)
@@ -323,7 +321,7 @@ def _guardar_reserva_bd(session_id, reserva, intent):
     Idempotente por stripe_session_id. Nunca rompe el flujo de confirmación:
     los errores solo se loguean.
     """
-    import logging
+    obj = creada = None
     try:
         from .models import Cliente, PaqueteTuristico, ReservaPaquete
 
@@ -356,21 +354,6 @@ def _guardar_reserva_bd(session_id, reserva, intent):
             },
         )
 
-        # Avisar al correo configurado en el admin (solo la primera vez)
-        if creada:
-            from .notifications import notificar_nueva_reserva_async
-            notificar_nueva_reserva_async(
-                tipo="paquete",
-                codigo=obj.localizador,
-                email_cliente=email,
-                telefono_cliente=telefono,
-                monto=obj.monto,
-                moneda=obj.moneda,
-                detalle=obj.paquete_titulo,
-                detalle_extra={"Personas": obj.n_personas,
-                               "Fecha de viaje": obj.fecha_viaje or "No indicada"},
-            )
-
         # Registrar/actualizar también al cliente para su gestión
         if email:
             viajeros = reserva.get("viajeros") or [{}]
@@ -385,6 +368,28 @@ def _guardar_reserva_bd(session_id, reserva, intent):
             "No se pudo persistir la reserva de paquete %s en la BD", session_id
         )
 
+    # Avisar al correo configurado en el admin (solo la primera vez). Va aparte
+    # y después del cliente: si no se puede encolar no afecta a lo demás.
+    if creada:
+        try:
+            from .notifications import notificar_nueva_reserva_async
+            notificar_nueva_reserva_async(
+                tipo="paquete",
+                codigo=obj.localizador,
+                email_cliente=obj.email,
+                telefono_cliente=obj.telefono,
+                monto=obj.monto,
+                moneda=obj.moneda,
+                detalle=obj.paquete_titulo,
+                detalle_extra={"Personas": obj.n_personas,
+                               "Fecha de viaje": obj.fecha_viaje or "No indicada"},
+                session_id=session_id,
+            )
+        except Exception:
+            logging.getLogger(__name__).exception(
+                "No se pudo encolar el aviso de la reserva de paquete %s", session_id
+            )
+
 
 def _armar_reserva_paquete(intent):
     """Construye la reserva normalizada del paquete a partir del intent."""
@@ -451,17 +456,39 @@ def _guardar_reserva(session_id, reserva):
 
 
 def obtener_reserva_paquete_guardada(clave):
-    """Recupera una reserva de paquete por session_id o por localizador."""
-    if _cache is None or not clave:
-        return None
-    raw = (_cache.get(_RESULT_KEY.format(sid=clave))
-           or _cache.get(_RESULT_LOC_KEY.format(loc=clave)))
-    if not raw:
+    """Recupera una reserva de paquete por session_id o por localizador.
+
+    Si la cache no la tiene se lee de ``ReservaPaquete`` y se vuelve a cachear.
+    """
+    if not clave:
         return None
+    if _cache is not None:
+        raw = (_cache.get(_RESULT_KEY.format(sid=clave))
+               or _cache.get(_RESULT_LOC_KEY.format(loc=clave)))
+        if raw:
+            try:
+                return json.loads(raw)
+            except Exception:  # noqa: BLE001
+                return _reserva_desde_bd(clave)
+    return _reserva_desde_bd(clave)
+
+
+def _reserva_desde_bd(clave):
     try:
-        return json.loads(raw)
+        from django.db.models import Q
+
+        from .models import ReservaPaquete
+
+        obj = (ReservaPaquete.objects
+               .filter(Q(stripe_session_id=clave) | Q(localizador=clave))
+               .only("stripe_session_id", "datos")
+               .first())
     except Exception:  # noqa: BLE001
         return None
+    if obj is None or not obj.datos:
+        return None
+    _guardar_reserva(obj.stripe_session_id, obj.datos)
+    return obj.datos
 
 
 # ---------------------------------------------------------------------------
@@ -491,19 +518,27 @@ def _enviar_voucher_email(reserva, intent):
 
 
 def _enviar_voucher_email_async(session_id, reserva, intent):
-    """Genera el PDF + envía el correo en un hilo de fondo."""
+    """Encola el PDF + correo del paquete (tarea ``voucher_paquete``)."""
     if not _enviar_correo_activo():
         return
+    try:
+        encolar(TAREA_VOUCHER_PAQUETE,
+                {"session_id": session_id, "reserva": reserva, "intent": intent},
+                clave=f"{TAREA_VOUCHER_PAQUETE}:{session_id}")
+    except Exception:
+        logging.getLogger(__name__).exception(
+            "No se pudo encolar el voucher del paquete %s", session_id
+        )
 
-    def _worker():
-        try:
-            _enviar_voucher_email(reserva, intent)
-        except Exception:  # noqa: BLE001
-            pass
-        try:
-            _guardar_reserva(session_id, reserva)
-        except Exception:  # noqa: BLE001
-            pass
 
-    import threading
-    threading.Thread(target=_worker, daemon=True).start()
+def tarea_voucher(session_id, reserva, intent):
+    """Manejador de la tarea ``voucher_paquete`` (ver ``bookingFlight.tarea_voucher``)."""
+    if not _enviar_correo_activo():
+        return
+    from .models import ReservaPaquete
+
+    _enviar_voucher_email(reserva, intent)
+    _guardar_reserva(session_id, reserva)
+    ReservaPaquete.objects.filter(stripe_session_id=session_id).update(datos=reserva)
+    if not reserva["correo"].get("enviado"):
+        raise RuntimeError(reserva["correo"].get("mensaje") or "No se pudo enviar el voucher")
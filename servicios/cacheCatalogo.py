@@ -0,0 +1,237 @@
+"""Cache de respuestas del catalogo (viewsets de solo lectura publica).
+
+Destinos, vuelos, paquetes, regiones, paises, ciudades, aerolineas y
+aeropuertos solo cambian cuando el staff los edita en el admin, pero cada
+GET volvia a consultar la BD y a serializar. ``CatalogoCacheMixin`` guarda
+la respuesta ya renderizada (``bytes``) de cada GET exitoso bajo una clave
+que incluye la version del catalogo:
+
+    catalogo:v<version>:<fecha>:<digest de ruta + query + Accept>
+
+  * La version es una fila de la BD (``VersionCatalogo``), no una clave de
+    la cache: con la cache en memoria de cada worker (el default) todos ven
+    igual el cambio. Leerla es la unica consulta de un HIT.
+  * ``invalidar_catalogo`` sube la version; esta conectada a post_save y
+    post_delete de los modelos de ``MODELOS_CATALOGO`` (``conectar_senales``),
+    asi un cambio en el admin deja viejas todas las respuestas a la vez y
+    las entradas anteriores simplemente expiran (``CATALOGO_CACHE_TTL``).
+  * Los ``queryset.update()`` no disparan senales: quien los use sobre estos
+    modelos debe llamar a ``invalidar_catalogo`` (p. ej. ``sincronizar_vigencia``).
+  * La fecha va en la clave porque la vigencia de los paquetes depende del dia.
+  * Cada respuesta lleva un ETag fuerte y Last-Modified; con
+    ``If-None-Match`` / ``If-Modified-Since`` se responde 304 sin cuerpo.
+    ``Cache-Control: no-cache`` permite a navegadores y CDN guardarla siempre
+    que revaliden.
+  * En los modelos con ``fecha_actualizacion`` (destinos, vuelos, paquetes)
+    el ETag de ``list``/``retrieve`` se calcula antes de serializar: version
+    + dia + ``fecha_actualizacion`` del objeto (o max + conteo del listado).
+    Asi, aunque la respuesta no este en la cache de este worker, un cliente
+    al dia recibe el 304 con una consulta y sin pasar por los serializers.
+    En el resto el ETag es el hash del contenido.
+
+La version arranca en el reloj (ms) y no en 1, para que si se borra la
+fila no se repitan ETags de versiones anteriores.
+
+``CATALOGO_CACHE_TTL=0`` desactiva la cache (las cabeceras se siguen enviando).
+"""
+
+import hashlib
+import json
+import time
+
+from .cacheSabre import _cache, _setting_int
+
+_CLAVE_RESPUESTA = "catalogo:v{version}:{fecha}:{digest}"
+
+# app_label.Modelo cuyos cambios invalidan el catalogo
+MODELOS_CATALOGO = (
+    "servicios.Destino", "servicios.Vuelo", "servicios.Region", "servicios.PaisRegion",
+    "servicios.Ciudad", "servicios.Aerolinea", "servicios.Aeropuerto",
+    "servicios.PaqueteTuristico", "servicios.TipoPaquete", "servicios.Temporada",
+    "servicios.TipoViaje", "servicios.ConfiguracionDestacados",
+    "servicios.OrdenVueloDestacado", "servicios.OrdenPaqueteDestacado",
+    "servicios.OrdenDestinoDestacado",
+)
+
+
+def version_catalogo():
+    """Version actual del catalogo (la fila se crea en la primera lectura)."""
+    from .models import VersionCatalogo
+
+    version = VersionCatalogo.objects.filter(pk=1).values_list("version", flat=True).first()
+    if version is None:
+        version = VersionCatalogo.objects.get_or_create(
+            pk=1, defaults={"version": int(time.time() * 1000)})[0].version
+    return version
+
+
+def invalidar_catalogo(**kwargs):
+    """Sube la version del catalogo (se puede usar directamente como receptor de senales)."""
+    from django.db.models import F
+
+    from .models import VersionCatalogo
+
+    if not VersionCatalogo.objects.filter(pk=1).update(version=F("version") + 1):
+        version_catalogo()
+
+
+def conectar_senales():
+    """Conecta ``invalidar_catalogo`` a post_save/post_delete de ``MODELOS_CATALOGO``."""
+    from django.apps import apps
+    from django.db.models.signals import post_delete, post_save
+
+    for nombre in MODELOS_CATALOGO:
+        modelo = apps.get_model(nombre)
+        for senal in (post_save, post_delete):
+            senal.connect(invalidar_catalogo, sender=modelo, dispatch_uid=f"catalogo:{nombre}")
+
+
+def clave_catalogo(*partes, version=None):
+    """Clave de cache de ``partes`` para la version (la actual si no se pasa) y el dia."""
+    from django.utils import timezone
+
+    digest = hashlib.sha256("\n".join(map(str, partes)).encode("utf-8")).hexdigest()[:32]
+    if version is None:
+        version = version_catalogo()
+    return _CLAVE_RESPUESTA.format(version=version,
+                                   fecha=timezone.localdate().isoformat(), digest=digest)
+
+
+def etag_fuerte(*partes):
+    """ETag fuerte (entre comillas) a partir de ``partes`` serializables a JSON."""
+    raw = json.dumps(partes, sort_keys=True, separators=(",", ":"), default=str)
+    return f'"{hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def no_modificado(request, etag, privado=False):
+    """``HttpResponseNotModified`` si ``If-None-Match`` coincide con ``etag``; si no, None."""
+    from django.utils.cache import get_conditional_response
+
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        marcar_etag(response, etag, privado)
+    return response
+
+
+def marcar_etag(response, etag, privado=False):
+    """Pone ``ETag`` y ``Cache-Control`` (``private`` para datos de un cliente)."""
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache" if privado else "no-cache"
+    return response
+
+
+def _entrada(response):
+    contenido = response.content
+    return {
+        "contenido": contenido,
+        "content_type": response["Content-Type"],
+        "etag": response.get("ETag") or f'"{hashlib.sha256(contenido).hexdigest()[:32]}"',
+        "modificado": int(time.time()),
+    }
+
+
+def _condicional(request, response, entrada):
+    """Agrega ETag/Last-Modified y responde 304 si el cliente ya tiene la version."""
+    from django.utils.cache import get_conditional_response, patch_vary_headers
+    from django.utils.http import http_date
+
+    marcar_etag(response, entrada["etag"])
+    response["Last-Modified"] = http_date(entrada["modificado"])
+    patch_vary_headers(response, ("Accept",))
+    return get_conditional_response(request, etag=entrada["etag"],
+                                    last_modified=entrada["modificado"], response=response)
+
+
+class CatalogoCacheMixin:
+    """Sirve los GET del viewset desde la cache versionada del catalogo.
+
+    La busqueda se hace en ``initial``, despues de la autenticacion, los
+    permisos, el throttling y la negociacion de contenido de DRF: un HIT
+    reemplaza al handler de la accion y no pasa por los serializers. Las
+    respuestas se guardan en ``finalize_response``; solo las 200 en JSON (la
+    API navegable de DRF pasa siempre por la vista).
+    """
+
+    _version = None
+    _clave_cache = None
+    _entrada_cache = None
+
+    def _version_catalogo(self):
+        # Una lectura por peticion (la instancia de la vista es por peticion)
+        if self._version is None:
+            self._version = version_catalogo()
+        return self._version
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in ("GET", "HEAD") or _cache is None \
+                or not _setting_int("CATALOGO_CACHE_TTL", 3600):
+            return
+        self._clave_cache = clave_catalogo(request.path, request.GET.urlencode(),
+                                           request.accepted_media_type,
+                                           version=self._version_catalogo())
+        self._entrada_cache = _cache.get(self._clave_cache)
+        if self._entrada_cache is not None:
+            # DRF busca el handler despues de initial(): se sirve la copia
+            setattr(self, request.method.lower(), self._respuesta_cacheada)
+
+    def _respuesta_cacheada(self, request, *args, **kwargs):
+        from django.http import HttpResponse
+
+        entrada = self._entrada_cache
+        response = HttpResponse(entrada["contenido"], content_type=entrada["content_type"])
+        response["X-Cache"] = "HIT"
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in ("GET", "HEAD") or response.status_code != 200 \
+                or response.streaming:
+            return response
+        entrada = self._entrada_cache
+        if entrada is None:
+            if hasattr(response, "render"):
+                response.render()
+            if not response["Content-Type"].startswith("application/json"):
+                return response
+            entrada = _entrada(response)
+            if self._clave_cache is not None:
+                _cache.set(self._clave_cache, entrada, _setting_int("CATALOGO_CACHE_TTL", 3600))
+            response.setdefault("X-Cache", "MISS")
+        return _condicional(request, response, entrada)
+
+    def _tiene_fecha_actualizacion(self):
+        from django.core.exceptions import FieldDoesNotExist
+
+        try:
+            self.queryset.model._meta.get_field("fecha_actualizacion")
+        except FieldDoesNotExist:
+            return False
+        return True
+
+    def _etag_modelo(self, request, *partes):
+        from django.utils import timezone
+
+        return etag_fuerte(self._version_catalogo(), timezone.localdate(), request.get_full_path(),
+                           request.META.get("HTTP_ACCEPT", ""), *partes)
+
+    def list(self, request, *args, **kwargs):
+        if not self._tiene_fecha_actualizacion():
+            return super().list(request, *args, **kwargs)
+        from django.db.models import Count, Max
+
+        resumen = self.filter_queryset(self.get_queryset()).aggregate(
+            ultima=Max("fecha_actualizacion"), total=Count("pk"))
+        etag = self._etag_modelo(request, resumen["ultima"], resumen["total"])
+        return no_modificado(request, etag) or marcar_etag(
+            super().list(request, *args, **kwargs), etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self._tiene_fecha_actualizacion():
+            return super().retrieve(request, *args, **kwargs)
+        from rest_framework.response import Response
+
+        instancia = self.get_object()
+        etag = self._etag_modelo(request, instancia.pk, instancia.fecha_actualizacion)
+        return no_modificado(request, etag) or marcar_etag(
+            Response(self.get_serializer(instancia).data), etag)
@@ -0,0 +1,408 @@
+"""Cache compartida de respuestas de Sabre sobre el backend de cache de Django.
+
+Los resultados ya normalizados se guardan bajo una clave estable construida a
+partir de los parametros de la consulta (no del payload crudo), asi dos
+visitantes que buscan la misma ruta/fecha comparten la misma entrada.
+
+Cada entrada tiene dos ventanas:
+  * fresca (``ttl`` segundos)  -> se sirve directamente (HIT).
+  * vieja  (``stale`` segundos) -> se sirve de inmediato (STALE) mientras UN
+    solo hilo la refresca en segundo plano (stale-while-revalidate). El
+    refresco se coordina con ``cache.add`` para que, aunque haya varios
+    workers de gunicorn, solo uno vuelva a consultar a Sabre.
+
+Los contadores de hit/miss/stale se guardan en la misma cache para que sean
+visibles desde cualquier worker (ver ``obtener_metricas``).
+
+Las variantes ``*_async`` sirven a las vistas ASGI con la misma cache y los
+mismos contadores; el refresco de fondo de una entrada vieja sigue usando
+un hilo con la version sincrona de la consulta.
+
+``llamada_unica`` implementa single-flight para las llamadas HTTP a Sabre:
+si ya hay una peticion identica en vuelo, las demas esperan su respuesta en
+lugar de abrir otra conexion. Dentro del proceso se coordina con un
+``threading.Event``; entre workers, con un candado en la cache (requiere un
+backend compartido como Redis para que aplique entre procesos).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+
+try:
+    from django.conf import settings as _django_settings
+    from django.core.cache import cache as _cache
+except ImportError:  # pragma: no cover
+    _django_settings = None
+    _cache = None
+
+from .jsonRapido import loads as json_loads
+
+logger = logging.getLogger(__name__)
+
+_PREFIJO = "sabre_cache"
+METRICAS = ("hit", "miss", "stale", "refresh_error", "coalesced")
+
+
+def _setting_int(name, default):
+    valor = default
+    if _django_settings is not None:
+        valor = getattr(_django_settings, name, default)
+    try:
+        return max(int(valor), 0)
+    except (TypeError, ValueError):
+        return default
+
+
+def construir_clave(namespace, partes):
+    """Clave de cache estable para ``partes`` (dict/lista serializable a JSON)."""
+    raw = json.dumps(partes, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+    return f"{_PREFIJO}:{namespace}:{digest}"
+
+
+def digest_de_clave(clave):
+    """Parte publicable de una clave (p. ej. id de sesion de busqueda)."""
+    return clave.rsplit(":", 1)[-1]
+
+
+def clave_de_digest(namespace, digest):
+    """Inversa de ``digest_de_clave``; None si ``digest`` no tiene el formato."""
+    if not isinstance(digest, str) or len(digest) != 32:
+        return None
+    try:
+        int(digest, 16)
+    except ValueError:
+        return None
+    return f"{_PREFIJO}:{namespace}:{digest.lower()}"
+
+
+def _clave_metrica(namespace, metrica):
+    return f"{_PREFIJO}:metricas:{namespace}:{metrica}"
+
+
+def _incrementar(namespace, metrica):
+    if _cache is None:
+        return
+    clave = _clave_metrica(namespace, metrica)
+    try:
+        try:
+            _cache.incr(clave)
+        except ValueError:
+            # La clave aun no existe: add() evita pisar a otro worker que la
+            # haya creado entre medio.
+            if not _cache.add(clave, 1, None):
+                _cache.incr(clave)
+    except Exception:  # cache caida: las metricas no rompen nada
+        logger.debug("No se pudo actualizar la metrica %s", clave, exc_info=True)
+
+
+def obtener_metricas(namespace):
+    """Contadores acumulados de la cache para ``namespace``."""
+    if _cache is None:
+        return {m: 0 for m in METRICAS}
+    claves = {m: _clave_metrica(namespace, m) for m in METRICAS}
+    valores = _cache.get_many(list(claves.values()))
+    metricas = {m: int(valores.get(k) or 0) for m, k in claves.items()}
+    consultas = metricas["hit"] + metricas["stale"] + metricas["miss"]
+    metricas["hit_ratio"] = (
+        round((metricas["hit"] + metricas["stale"]) / consultas, 4) if consultas else 0.0
+    )
+    return metricas
+
+
+def _guardar(clave, valor, ttl, stale):
+    entrada = {"valor": valor, "fresco_hasta": time.time() + ttl}
+    _cache.set(clave, entrada, ttl + stale)
+
+
+def leer_entrada(clave):
+    """Devuelve el valor guardado (fresco o viejo) o None, sin tocar metricas."""
+    if _cache is None:
+        return None
+    entrada = _cache.get(clave)
+    return entrada["valor"] if entrada else None
+
+
+def _refrescar_en_fondo(namespace, clave, calcular, ttl, stale, cacheable):
+    """Lanza un unico refresco de ``clave`` (coordinado entre workers)."""
+    candado = f"{clave}:refresh"
+    if not _cache.add(candado, 1, max(ttl, 30)):
+        return  # otro hilo/worker ya esta refrescando
+
+    def _worker():
+        try:
+            valor = calcular()
+            if cacheable(valor):
+                _guardar(clave, valor, ttl, stale)
+            else:
+                _incrementar(namespace, "refresh_error")
+        except Exception:
+            _incrementar(namespace, "refresh_error")
+            logger.exception("Fallo el refresco en segundo plano de %s", clave)
+        finally:
+            _cache.delete(candado)
+
+    threading.Thread(target=_worker, daemon=True).start()
+
+
+def _siempre_cacheable(_valor):
+    return True
+
+
+def _servir_entrada(namespace, clave, entrada, refrescar, ttl, stale, cacheable):
+    """HIT/STALE de una entrada existente; None si no hay entrada."""
+    if entrada is None:
+        return None
+    if time.time() < entrada["fresco_hasta"]:
+        _incrementar(namespace, "hit")
+        return entrada["valor"], "hit"
+    _incrementar(namespace, "stale")
+    _refrescar_en_fondo(namespace, clave, refrescar, ttl, stale, cacheable)
+    return entrada["valor"], "stale"
+
+
+def buscar_en_cache(namespace, clave, refrescar, ttl, stale=0, cacheable=None):
+    """Paso de lectura de ``obtener_con_cache`` para quien arma el valor por su cuenta.
+
+    Devuelve ``(valor, estado)`` en HIT/STALE (lanzando el refresco de fondo
+    con ``refrescar``) o None en MISS; en ese caso el llamador debe guardar
+    el resultado con ``guardar_en_cache``.
+    """
+    if _cache is None or ttl <= 0:
+        return None
+    servido = _servir_entrada(
+        namespace, clave, _cache.get(clave), refrescar, ttl, stale,
+        cacheable or _siempre_cacheable,
+    )
+    if servido is None:
+        _incrementar(namespace, "miss")
+    return servido
+
+
+def guardar_en_cache(clave, valor, ttl, stale=0):
+    if _cache is not None and ttl > 0:
+        _guardar(clave, valor, ttl, stale)
+
+
+def obtener_con_cache(namespace, clave, calcular, ttl, stale=0, cacheable=None):
+    """Devuelve ``(valor, estado)`` con estado ``'hit' | 'stale' | 'miss'``.
+
+    ``calcular`` se invoca solo en un MISS (o en el refresco de fondo de una
+    entrada vieja). ``cacheable(valor)`` decide si el resultado se guarda;
+    por defecto se guarda todo. Con ``ttl=0`` la cache queda desactivada.
+    """
+    if _cache is None or ttl <= 0:
+        return calcular(), "miss"
+    cacheable = cacheable or _siempre_cacheable
+
+    servido = _servir_entrada(
+        namespace, clave, _cache.get(clave), calcular, ttl, stale, cacheable
+    )
+    if servido is not None:
+        return servido
+
+    _incrementar(namespace, "miss")
+    valor = calcular()
+    if cacheable(valor):
+        _guardar(clave, valor, ttl, stale)
+    return valor, "miss"
+
+
+async def obtener_con_cache_async(namespace, clave, calcular, refrescar, ttl, stale=0,
+                                  cacheable=None):
+    """Igual que ``obtener_con_cache`` pero ``calcular`` es una corrutina.
+
+    ``refrescar`` es la version sincrona de la consulta, usada por el hilo
+    que refresca una entrada vieja (una tarea del event loop podria morir
+    con el request).
+    """
+    if _cache is None or ttl <= 0:
+        return await calcular(), "miss"
+    cacheable = cacheable or _siempre_cacheable
+
+    servido = _servir_entrada(
+        namespace, clave, await _cache.aget(clave), refrescar, ttl, stale, cacheable
+    )
+    if servido is not None:
+        return servido
+
+    _incrementar(namespace, "miss")
+    valor = await calcular()
+    if cacheable(valor):
+        await _cache.aset(clave, {"valor": valor, "fresco_hasta": time.time() + ttl},
+                          ttl + stale)
+    return valor, "miss"
+
+
+# =====================================================
+# SINGLE-FLIGHT DE LLAMADAS HTTP
+# =====================================================
+
+# Cuanto vive la respuesta del lider en la cache para los workers que esperan.
+_RESPUESTA_COMPARTIDA_TTL = 10
+_INTERVALO_ESPERA = 0.05
+
+
+class RespuestaCompartida:
+    """Copia serializable de una respuesta HTTP.
+
+    Expone lo que usan los llamadores (``status_code``, ``text`` y ``json()``)
+    y se puede guardar en la cache para entregarla a otros workers. Guarda
+    el cuerpo crudo tal como llego (``bytes``) y lo decodifica con orjson si
+    esta disponible, sin pasar antes por ``str``.
+    """
+
+    def __init__(self, status_code, contenido):
+        self.status_code = status_code
+        self.contenido = contenido
+
+    @classmethod
+    def desde(cls, response):
+        if isinstance(response, cls):
+            return response
+        return cls(response.status_code, response.content)
+
+    @property
+    def content(self):
+        if isinstance(self.contenido, str):
+            return self.contenido.encode("utf-8")
+        return self.contenido
+
+    @property
+    def text(self):
+        if isinstance(self.contenido, bytes):
+            return self.contenido.decode("utf-8", errors="replace")
+        return self.contenido
+
+    def json(self):
+        return json_loads(self.contenido)
+
+
+class _Vuelo:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.respuesta = None
+        self.error = None
+
+
+_VUELOS_LOCK = threading.Lock()
+_VUELOS = {}
+
+
+def _esperar_otro_worker(namespace, clave, llamar, espera):
+    # El candado guarda un token por vuelo y la respuesta se publica bajo ese
+    # token: un worker que llega cuando el vuelo ya termino no recibe una
+    # respuesta vieja, sino que hace su propia llamada.
+    candado = f"{clave}:lock"
+    token = uuid.uuid4().hex
+
+    if _cache.add(candado, token, max(int(espera), 1)):
+        try:
+            respuesta = RespuestaCompartida.desde(llamar())
+            # Solo se comparten las exitosas: un 401/5xx no se reparte a otros workers
+            if 200 <= respuesta.status_code < 300:
+                _cache.set(f"{clave}:respuesta:{token}", respuesta, _RESPUESTA_COMPARTIDA_TTL)
+            return respuesta
+        finally:
+            if _cache.get(candado) == token:  # si vencio, puede ser de otro lider
+                _cache.delete(candado)
+
+    lider = _cache.get(candado)
+    if lider is None:
+        # El vuelo termino entre el add y la lectura: consultar de nuevo.
+        return RespuestaCompartida.desde(llamar())
+
+    # Otro worker ya esta consultando: esperar su respuesta.
+    _incrementar(namespace, "coalesced")
+    clave_respuesta = f"{clave}:respuesta:{lider}"
+    limite = time.monotonic() + espera
+    while time.monotonic() < limite:
+        respuesta = _cache.get(clave_respuesta)
+        if respuesta is not None:
+            return respuesta
+        if _cache.get(candado) != lider:
+            # El lider termino sin publicar (error o respuesta no 2xx).
+            respuesta = _cache.get(clave_respuesta)
+            if respuesta is not None:
+                return respuesta
+            break
+        time.sleep(_INTERVALO_ESPERA)
+    return RespuestaCompartida.desde(llamar())
+
+
+def llamada_unica(namespace, partes, llamar, espera=None):
+    """Ejecuta ``llamar()`` una sola vez por cada ``partes`` en vuelo.
+
+    Devuelve una ``RespuestaCompartida``. Las excepciones del lider se
+    propagan a los hilos que esperaban en el mismo proceso; los workers de
+    otros procesos, si no llega respuesta en ``espera`` segundos, hacen su
+    propia llamada.
+    """
+    if espera is None:
+        espera = _setting_int("SABRE_SINGLE_FLIGHT_TIMEOUT", 35)
+    clave = construir_clave(f"{namespace}:vuelo", partes)
+
+    with _VUELOS_LOCK:
+        vuelo = _VUELOS.get(clave)
+        lider = vuelo is None
+        if lider:
+            vuelo = _VUELOS[clave] = _Vuelo()
+
+    if not lider:
+        _incrementar(namespace, "coalesced")
+        if vuelo.evento.wait(espera):
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.respuesta
+        return RespuestaCompartida.desde(llamar())
+
+    try:
+        if _cache is None:
+            vuelo.respuesta = RespuestaCompartida.desde(llamar())
+        else:
+            vuelo.respuesta = _esperar_otro_worker(namespace, clave, llamar, espera)
+        return vuelo.respuesta
+    except Exception as exc:
+        vuelo.error = exc
+        raise
+    finally:
+        with _VUELOS_LOCK:
+            _VUELOS.pop(clave, None)
+        vuelo.evento.set()
+
+
+# event loop -> {clave: asyncio.Task}
+_VUELOS_ASYNC = {}
+
+
+async def llamada_unica_async(namespace, partes, llamar):
+    """Single-flight para corrutinas dentro del event loop actual.
+
+    ``llamar`` es una funcion sin argumentos que devuelve una corrutina con
+    la respuesta HTTP. Las peticiones identicas concurrentes esperan la
+    misma tarea en lugar de abrir otra conexion.
+    """
+    clave = construir_clave(f"{namespace}:vuelo", partes)
+    loop = asyncio.get_running_loop()
+    vuelos = _VUELOS_ASYNC.setdefault(id(loop), {})
+
+    tarea = vuelos.get(clave)
+    if tarea is not None:
+        _incrementar(namespace, "coalesced")
+        return await asyncio.shield(tarea)
+
+    async def _ejecutar():
+        try:
+            return RespuestaCompartida.desde(await llamar())
+        finally:
+            vuelos.pop(clave, None)
+            if not vuelos:
+                _VUELOS_ASYNC.pop(id(loop), None)
+
+    tarea = vuelos[clave] = loop.create_task(_ejecutar())
+    return await asyncio.shield(tarea)
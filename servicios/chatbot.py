@@ -267,7 +267,7 @@ def tool_get_paquetes(region=None, pais=None, solo_destacados=False):
     if isinstance(solo_destacados, str):
         solo_destacados = solo_destacados.lower() in ("true", "1", "yes")
 
-    qs = PaqueteTuristico.objects.filter(activo=True).select_related(
+    qs = PaqueteTuristico.objects.vigentes().select_related(
         'region', 'pais_destino', 'ciudad_destino', 'aerolinea', 'tipo_paquete'
     )
 
@@ -338,16 +338,16 @@ def tool_get_detalle_paquete(paquete_id):
     try:
         paquete_id = int(paquete_id)
     except (ValueError, TypeError):
-        qs = PaqueteTuristico.objects.filter(activo=True, titulo__icontains=str(paquete_id))
+        qs = PaqueteTuristico.objects.vigentes().filter(titulo__icontains=str(paquete_id))
         if qs.exists():
             return _formatear_detalle_paquete(qs.first())
         return {"error": f"No se encontró un paquete con nombre o ID '{paquete_id}'"}
 
     try:
-        p = PaqueteTuristico.objects.select_related(
+        p = PaqueteTuristico.objects.vigentes().select_related(
             'region', 'pais_destino', 'ciudad_destino', 'aerolinea',
             'tipo_paquete', 'temporada', 'tipo_viaje'
-        ).get(id=paquete_id, activo=True)
+        ).get(id=paquete_id)
     except PaqueteTuristico.DoesNotExist:
         return {"error": f"No se encontró el paquete con ID {paquete_id}"}
 
@@ -0,0 +1,267 @@
+"""Circuit breaker y timeouts adaptativos por endpoint de Sabre.
+
+Cuando Sabre (cert) esta degradado cada llamada esperaba el timeout completo
+y los workers se acumulaban. Cada endpoint (shop, revalidate, seatmap,
+createBooking) tiene un ``Circuito`` que lleva una ventana deslizante de las
+ultimas llamadas (resultado y latencia):
+
+  * CERRADO: las llamadas pasan. Si en ``SABRE_CIRCUIT_WINDOW`` segundos hay
+    al menos ``SABRE_CIRCUIT_MIN_CALLS`` llamadas y la tasa de error llega a
+    ``SABRE_CIRCUIT_ERROR_RATE``, el circuito se abre.
+  * ABIERTO: durante ``SABRE_CIRCUIT_OPEN_SECONDS`` las llamadas fallan de
+    inmediato con ``CircuitoAbiertoError`` (los llamadores responden 503
+    "degradado"; la busqueda sigue sirviendo lo que haya en su cache). La
+    apertura se publica en la cache de Django para que los demas workers
+    tambien corten.
+  * SEMIABIERTO: pasado ese tiempo se deja pasar UNA llamada de prueba; si
+    va bien se cierra, si falla se vuelve a abrir. La prueba usa el timeout
+    configurado completo: si Sabre se volvio mas lento, con el adaptativo
+    (calculado con latencias anteriores) fallaria siempre.
+
+Son errores las excepciones de red/timeout y las respuestas 5xx; un 4xx es
+una respuesta valida de Sabre.
+
+Timeout adaptativo: con suficientes muestras el timeout de lectura es
+``p99 * SABRE_ADAPTIVE_TIMEOUT_FACTOR`` de las llamadas exitosas, acotado
+entre ``SABRE_ADAPTIVE_TIMEOUT_MIN`` y el timeout configurado en
+``HTTP_TIMEOUTS`` (que sigue siendo el maximo). Solo cuentan las muestras
+de la ventana ``SABRE_CIRCUIT_WINDOW``.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from .cacheSabre import _cache, _setting_int
+from .LlamadosAPIS.Cliente_HTTP import ERRORES_HTTP, INTEGRACION_SABRE, timeout_http
+
+logger = logging.getLogger(__name__)
+
+ENDPOINT_BUSQUEDA = "shop"
+ENDPOINT_REVALIDACION = "revalidate"
+ENDPOINT_SEATMAP = "seatmap"
+ENDPOINT_RESERVA = "create_booking"
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+_MUESTRAS_MAXIMAS = 500
+_MUESTRAS_MINIMAS_TIMEOUT = 20
+
+MENSAJE_DEGRADADO = "Sabre no esta disponible temporalmente; intente de nuevo en unos segundos"
+
+
+def _setting_float(name, default):
+    from django.conf import settings
+
+    try:
+        return float(getattr(settings, name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class CircuitoAbiertoError(RuntimeError):
+    """La llamada no se hizo porque el circuito del endpoint esta abierto."""
+
+    def __init__(self, endpoint, reintentar_en):
+        super().__init__(f"Circuito de Sabre '{endpoint}' abierto")
+        self.endpoint = endpoint
+        self.reintentar_en = reintentar_en
+
+
+def respuesta_degradada(error, **extra):
+    """Dict de error estandar (503) para un ``CircuitoAbiertoError``."""
+    return {"error": MENSAJE_DEGRADADO, "code": 503, "degradado": True,
+            "reintentar_en": error.reintentar_en, **extra}
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(int(len(ordenados) * p), len(ordenados) - 1)
+    return ordenados[indice]
+
+
+class Circuito:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.estado = CERRADO
+        self.abierto_hasta = 0.0
+        self.prueba_en_curso = False
+        self._muestras = deque(maxlen=_MUESTRAS_MAXIMAS)  # (instante, ok, latencia)
+        self._lock = threading.Lock()
+
+    @property
+    def _clave_compartida(self):
+        return f"sabre_circuito:{self.endpoint}"
+
+    def _podar(self, ahora):
+        limite = ahora - _setting_int("SABRE_CIRCUIT_WINDOW", 60)
+        while self._muestras and self._muestras[0][0] < limite:
+            self._muestras.popleft()
+
+    def _abrir(self, ahora):
+        segundos = _setting_int("SABRE_CIRCUIT_OPEN_SECONDS", 30)
+        self.estado = ABIERTO
+        self.abierto_hasta = ahora + segundos
+        self.prueba_en_curso = False
+        logger.warning("Circuito de Sabre '%s' abierto por %ss", self.endpoint, segundos)
+        if _cache is not None:
+            _cache.set(self._clave_compartida, self.abierto_hasta, segundos)
+
+    def _abierto_en_otro_worker(self):
+        if _cache is None:
+            return 0.0
+        return _cache.get(self._clave_compartida) or 0.0
+
+    def permitir(self):
+        """Lanza ``CircuitoAbiertoError`` si la llamada no debe hacerse.
+
+        Devuelve True si la llamada es la prueba del estado semiabierto.
+        """
+        ahora = time.time()
+        with self._lock:
+            if self.estado == CERRADO:
+                hasta = self._abierto_en_otro_worker()
+                if hasta <= ahora:
+                    return False
+                self.estado, self.abierto_hasta = ABIERTO, hasta
+            if self.estado == ABIERTO and ahora >= self.abierto_hasta:
+                self.estado = SEMIABIERTO
+            if self.estado == SEMIABIERTO and not self.prueba_en_curso:
+                self.prueba_en_curso = True
+                return True
+            raise CircuitoAbiertoError(self.endpoint, max(round(self.abierto_hasta - ahora), 1))
+
+    def liberar_prueba(self):
+        """Suelta la prueba del semiabierto sin registrar resultado (la siguiente llamada prueba)."""
+        with self._lock:
+            self.prueba_en_curso = False
+
+    def registrar(self, ok, latencia, es_prueba=False):
+        ahora = time.time()
+        with self._lock:
+            self._muestras.append((ahora, ok, latencia))
+            self._podar(ahora)
+            if es_prueba or self.estado == SEMIABIERTO:
+                if ok:
+                    self.estado = CERRADO
+                    self.prueba_en_curso = False
+                    self._muestras.clear()  # la ventana anterior ya no representa a Sabre
+                    if _cache is not None:
+                        _cache.delete(self._clave_compartida)
+                else:
+                    self._abrir(ahora)
+                return
+            total = len(self._muestras)
+            if total < _setting_int("SABRE_CIRCUIT_MIN_CALLS", 10):
+                return
+            errores = sum(1 for _, exito, _ in self._muestras if not exito)
+            if errores / total >= _setting_float("SABRE_CIRCUIT_ERROR_RATE", 0.5):
+                self._abrir(ahora)
+
+    def timeout(self, es_prueba=False):
+        """``(connect, read)`` con el read ajustado al p99 observado (el maximo en la prueba)."""
+        configurado = timeout_http(INTEGRACION_SABRE)
+        connect, maximo = configurado if isinstance(configurado, tuple) else (configurado,) * 2
+        if es_prueba:
+            return connect, maximo
+        with self._lock:
+            self._podar(time.time())
+            latencias = [lat for _, ok, lat in self._muestras if ok]
+        if len(latencias) < _MUESTRAS_MINIMAS_TIMEOUT:
+            return connect, maximo
+        adaptativo = _percentil(latencias, 0.99) * _setting_float("SABRE_ADAPTIVE_TIMEOUT_FACTOR", 1.5)
+        minimo = min(_setting_int("SABRE_ADAPTIVE_TIMEOUT_MIN", 5), maximo)
+        return connect, round(min(max(adaptativo, minimo), maximo), 2)
+
+    def resumen(self):
+        ahora = time.time()
+        with self._lock:
+            self._podar(ahora)
+            muestras = list(self._muestras)
+        latencias = [lat for _, ok, lat in muestras if ok]
+        return {
+            "estado": self.estado,
+            "abierto_hasta": self.abierto_hasta if self.estado != CERRADO else None,
+            "llamadas": len(muestras),
+            "errores": sum(1 for _, ok, _ in muestras if not ok),
+            "p50": round(_percentil(latencias, 0.5), 3) if latencias else None,
+            "p99": round(_percentil(latencias, 0.99), 3) if latencias else None,
+            "timeout": self.timeout(),
+        }
+
+
+_CIRCUITOS = {}
+_CIRCUITOS_LOCK = threading.Lock()
+
+
+def circuito(endpoint):
+    """``Circuito`` del proceso para ``endpoint`` (se crea la primera vez)."""
+    with _CIRCUITOS_LOCK:
+        if endpoint not in _CIRCUITOS:
+            _CIRCUITOS[endpoint] = Circuito(endpoint)
+        return _CIRCUITOS[endpoint]
+
+
+def reiniciar_circuitos():
+    """Olvida el estado de todos los circuitos (util en tests o al reconfigurar)."""
+    with _CIRCUITOS_LOCK:
+        for endpoint in _CIRCUITOS:
+            if _cache is not None:
+                _cache.delete(f"sabre_circuito:{endpoint}")
+        _CIRCUITOS.clear()
+
+
+def estado_circuitos():
+    return {
+        endpoint: circuito(endpoint).resumen()
+        for endpoint in (ENDPOINT_BUSQUEDA, ENDPOINT_REVALIDACION, ENDPOINT_SEATMAP, ENDPOINT_RESERVA)
+    }
+
+
+def _es_exito(response):
+    return getattr(response, "status_code", 500) < 500
+
+
+def llamada_protegida(endpoint, llamar):
+    """Ejecuta ``llamar(timeout)`` a traves del circuito de ``endpoint``."""
+    c = circuito(endpoint)
+    es_prueba = c.permitir()
+    inicio = time.monotonic()
+    try:
+        response = llamar(c.timeout(es_prueba))
+    except ERRORES_HTTP:
+        c.registrar(False, time.monotonic() - inicio, es_prueba)
+        raise
+    except BaseException:
+        # Error ajeno a Sabre (JSON invalido, cliente desconectado/cancelacion...):
+        # no cuenta como fallo, pero la prueba del semiabierto debe liberarse o
+        # el circuito quedaria abierto para siempre en este proceso.
+        if es_prueba:
+            c.liberar_prueba()
+        raise
+    c.registrar(_es_exito(response), time.monotonic() - inicio, es_prueba)
+    return response
+
+
+async def llamada_protegida_async(endpoint, llamar):
+    """Variante async de ``llamada_protegida`` (``llamar`` es una corrutina)."""
+    c = circuito(endpoint)
+    es_prueba = c.permitir()
+    inicio = time.monotonic()
+    try:
+        response = await llamar(c.timeout(es_prueba))
+    except ERRORES_HTTP:
+        c.registrar(False, time.monotonic() - inicio, es_prueba)
+        raise
+    except BaseException:
+        # Error ajeno a Sabre (JSON invalido, cliente desconectado/cancelacion...):
+        # no cuenta como fallo, pero la prueba del semiabierto debe liberarse o
+        # el circuito quedaria abierto para siempre en este proceso.
+        if es_prueba:
+            c.liberar_prueba()
+        raise
+    c.registrar(_es_exito(response), time.monotonic() - inicio, es_prueba)
+    return response
@@ -0,0 +1,219 @@
+"""Representacion columnar de los resultados de busqueda de vuelos.
+
+Ordenar, filtrar y rankear itinerarios obliga a recorrer los ``tramos`` de
+cada opcion una y otra vez. ``Columnas`` extrae una sola vez, al normalizar,
+lo que esas operaciones necesitan en arreglos paralelos (``array``) indexados
+por posicion:
+
+  * ``precio``        precio_total como float (``inf`` si falta).
+  * ``duracion``      minutos totales sumando todos los tramos.
+  * ``escalas``       escalas totales; ``escalas_max`` el maximo por tramo.
+  * ``salida_ida`` / ``salida_vuelta``  minuto del dia de salida (``SIN_HORA`` si falta).
+  * ``aerolineas``    tupla de codigos (marketing) por opcion.
+
+``ResultadosVuelos`` es la lista de opciones que devuelve
+``procesar_respuesta``: se serializa a JSON como una lista normal y lleva sus
+columnas en ``.columnas``, asi viajan juntas a la cache (pickle) y las
+consultas posteriores (``resultadosBusqueda``) trabajan solo con enteros y
+floats en bucles cerrados.
+"""
+
+import math
+from array import array
+
+SIN_HORA = -1
+
+# Peso de cada escala en el ranking "mejor" (ver ``puntajes``).
+PESO_ESCALA = 0.25
+
+
+def _minutos(hora):
+    """'HH:MM[:SS...]' -> minuto del dia, o ``SIN_HORA``."""
+    try:
+        return int(hora[0:2]) * 60 + int(hora[3:5])
+    except (TypeError, ValueError):
+        return SIN_HORA
+
+
+def _precio(opcion):
+    try:
+        return float(opcion.get("precio_total"))
+    except (TypeError, ValueError):
+        return math.inf
+
+
+class Columnas:
+    """Arreglos paralelos con las claves de orden/filtro de cada opcion."""
+
+    __slots__ = ("aerolineas", "duracion", "escalas", "escalas_max", "precio",
+                 "salida_ida", "salida_vuelta")
+
+    def __init__(self):
+        self.precio = array("d")
+        self.duracion = array("l")
+        self.escalas = array("l")
+        self.escalas_max = array("l")
+        self.salida_ida = array("l")
+        self.salida_vuelta = array("l")
+        self.aerolineas = []
+
+    @classmethod
+    def desde_opciones(cls, opciones):
+        columnas = cls()
+        for opcion in opciones:
+            columnas.agregar(opcion)
+        return columnas
+
+    def agregar(self, opcion):
+        tramos = opcion.get("tramos") or []
+        escalas = [t.get("numero_escalas") or 0 for t in tramos]
+        resumen = opcion.get("resumen") or {}
+
+        self.precio.append(_precio(opcion))
+        self.duracion.append(sum(t.get("duracion_minutos") or 0 for t in tramos))
+        self.escalas.append(sum(escalas))
+        self.escalas_max.append(max(escalas, default=0))
+        self.salida_ida.append(
+            _minutos((tramos[0].get("origen") or {}).get("hora")) if tramos else SIN_HORA
+        )
+        self.salida_vuelta.append(
+            _minutos((tramos[1].get("origen") or {}).get("hora")) if len(tramos) > 1 else SIN_HORA
+        )
+        self.aerolineas.append(tuple(dict.fromkeys(
+            (resumen.get("aerolineas_ida") or []) + (resumen.get("aerolineas_vuelta") or [])
+        )))
+
+    def __len__(self):
+        return len(self.precio)
+
+    def permutar(self, orden):
+        """Nuevas columnas con las filas en el orden de ``orden`` (indices)."""
+        nuevas = Columnas()
+        for nombre in self.__slots__:
+            actual = getattr(self, nombre)
+            valores = [actual[i] for i in orden]
+            if isinstance(actual, array):
+                setattr(nuevas, nombre, array(actual.typecode, valores))
+            else:
+                setattr(nuevas, nombre, valores)
+        return nuevas
+
+
+class ResultadosVuelos(list):
+    """Lista de opciones normalizadas con sus ``Columnas`` adjuntas."""
+
+    columnas = None  # entradas antiguas de la cache pueden no traerlas
+
+    def __init__(self, opciones=(), columnas=None):
+        super().__init__(opciones)
+        self.columnas = columnas if columnas is not None else Columnas.desde_opciones(self)
+
+
+def columnas_de(resultados):
+    """Columnas de ``resultados`` (las adjuntas o, si es una lista simple, nuevas)."""
+    columnas = getattr(resultados, "columnas", None)
+    if columnas is None or len(columnas) != len(resultados):
+        columnas = Columnas.desde_opciones(resultados)
+    return columnas
+
+
+def orden_recomendado(columnas):
+    """Indices por menor escalas -> menor duracion -> menor precio."""
+    escalas, duracion, precio = columnas.escalas, columnas.duracion, columnas.precio
+    return sorted(
+        range(len(columnas)),
+        key=lambda i: (escalas[i], duracion[i], precio[i] if precio[i] != math.inf else 0),
+    )
+
+
+def ordenar(opciones):
+    """``ResultadosVuelos`` en el orden recomendado, con columnas alineadas."""
+    columnas = columnas_de(opciones)
+    orden = orden_recomendado(columnas)
+    return ResultadosVuelos([opciones[i] for i in orden], columnas.permutar(orden))
+
+
+def filtrar(columnas, max_escalas=None, aerolineas=None, precio_min=None, precio_max=None,
+            salida_ida=(None, None), salida_vuelta=(None, None)):
+    """Indices (en el orden actual) que cumplen los filtros.
+
+    Las ventanas de salida son ``(desde, hasta)`` en minutos del dia; una
+    opcion sin hora no pasa una ventana con algun limite.
+    """
+    indices = range(len(columnas))
+    if max_escalas is not None:
+        valores = columnas.escalas_max
+        indices = [i for i in indices if valores[i] <= max_escalas]
+    if aerolineas:
+        valores = columnas.aerolineas
+        indices = [i for i in indices if not aerolineas.isdisjoint(valores[i])]
+    if precio_min is not None or precio_max is not None:
+        valores = columnas.precio
+        minimo = -math.inf if precio_min is None else precio_min
+        maximo = math.inf if precio_max is None else precio_max
+        indices = [i for i in indices if minimo <= valores[i] <= maximo]
+    for valores, (desde, hasta) in ((columnas.salida_ida, salida_ida),
+                                    (columnas.salida_vuelta, salida_vuelta)):
+        if desde is None and hasta is None:
+            continue
+        desde = 0 if desde is None else desde
+        hasta = 24 * 60 if hasta is None else hasta
+        indices = [i for i in indices if valores[i] != SIN_HORA and desde <= valores[i] <= hasta]
+    return list(indices)
+
+
+def puntajes(columnas, indices):
+    """Puntaje "mejor" por indice: precio y duracion relativos al minimo + escalas.
+
+    ``precio / precio_min + duracion / duracion_min + PESO_ESCALA * escalas``;
+    menor es mejor. Los minimos se toman sobre ``indices`` (la seleccion
+    filtrada), asi el ranking se adapta a lo que el usuario esta viendo.
+    """
+    precio, duracion, escalas = columnas.precio, columnas.duracion, columnas.escalas
+    precios = [precio[i] for i in indices if precio[i] != math.inf]
+    precio_min = min(precios, default=0) or 1
+    duracion_min = min((duracion[i] for i in indices if duracion[i] > 0), default=1)
+    return {
+        i: precio[i] / precio_min + duracion[i] / duracion_min + PESO_ESCALA * escalas[i]
+        for i in indices
+    }
+
+
+def ordenar_indices(columnas, indices, criterio):
+    """Reordena ``indices`` por ``criterio`` (ver ``CRITERIOS``); orden estable."""
+    if criterio == "mejor":
+        puntaje = puntajes(columnas, indices)
+        return sorted(indices, key=puntaje.__getitem__)
+    nombre, descendente = CRITERIOS[criterio]
+    valores = columnas.salida_ida if nombre == "salida" else getattr(columnas, nombre)
+    if nombre == "salida":
+        # Sin hora siempre al final, en ambos sentidos.
+        tope = -1 if descendente else 24 * 60
+        return sorted(indices, key=lambda i: valores[i] if valores[i] != SIN_HORA else tope,
+                      reverse=descendente)
+    return sorted(indices, key=valores.__getitem__, reverse=descendente)
+
+
+# criterio -> (columna, descendente)
+CRITERIOS = {
+    "precio": ("precio", False),
+    "-precio": ("precio", True),
+    "duracion": ("duracion", False),
+    "salida": ("salida", False),
+    "-salida": ("salida", True),
+    "mejor": (None, False),
+}
+
+
+def ranking(columnas, indices=None):
+    """Posiciones de la opcion mas barata, la mas rapida y la "mejor"."""
+    indices = list(range(len(columnas))) if indices is None else indices
+    if not indices:
+        return {"mas_barata": None, "mas_rapida": None, "mejor": None}
+    precio, duracion = columnas.precio, columnas.duracion
+    puntaje = puntajes(columnas, indices)
+    return {
+        "mas_barata": min(indices, key=precio.__getitem__),
+        "mas_rapida": min(indices, key=lambda i: (duracion[i], precio[i])),
+        "mejor": min(indices, key=puntaje.__getitem__),
+    }
@@ -0,0 +1,148 @@
+"""Calendario de tarifas: busqueda flexible de +/- N dias sobre Sabre BFM.
+
+Genera las combinaciones de fechas alrededor de la ida (y de la vuelta si
+la hay), las consulta en paralelo con un numero acotado de hilos y devuelve
+el precio mas bajo de cada celda. Cada celda pasa por
+``buscar_vuelos_sabre_con_estado``, asi que reutiliza la cache compartida
+de busquedas (y alimenta la de la busqueda normal para esas fechas).
+
+``iterar_calendario`` entrega las celdas a medida que terminan, para que la
+vista pueda enviarlas en streaming (NDJSON) sin esperar a la mas lenta.
+"""
+
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+
+from .cacheSabre import _setting_int
+from .columnasVuelos import columnas_de, ranking
+from .searchFlights import buscar_vuelos_sabre_con_estado
+
+
+def _parse_fecha(valor):
+    try:
+        return date.fromisoformat(str(valor).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def _rango(fecha, dias, minimo):
+    fechas = [fecha + timedelta(days=d) for d in range(-dias, dias + 1)]
+    return [f for f in fechas if f >= minimo]
+
+
+def generar_combinaciones(fecha_ida, fecha_vuelta, dias, hoy=None):
+    """Lista de ``(ida, vuelta)`` (vuelta None si es solo ida).
+
+    Descarta fechas pasadas y vueltas anteriores a la ida.
+    """
+    hoy = hoy or date.today()
+    idas = _rango(fecha_ida, dias, hoy)
+    if fecha_vuelta is None:
+        return [(ida, None) for ida in idas]
+    vueltas = _rango(fecha_vuelta, dias, hoy)
+    return [(ida, vuelta) for ida in idas for vuelta in vueltas if vuelta >= ida]
+
+
+def _precio_minimo(resultados):
+    columnas = columnas_de(resultados)
+    if not len(columnas):
+        return None
+    i = ranking(columnas)["mas_barata"]
+    if columnas.precio[i] == math.inf:
+        return None
+    return columnas.precio[i], resultados[i].get("moneda")
+
+
+def _buscar_celda(datos, ida, vuelta):
+    consulta = dict(datos, date=ida.isoformat(),
+                    return_date=vuelta.isoformat() if vuelta else None)
+    resultados, estado_cache = buscar_vuelos_sabre_con_estado(consulta)
+
+    celda = {
+        "ida": consulta["date"],
+        "vuelta": consulta["return_date"],
+        "precio_minimo": None,
+        "moneda": None,
+        "opciones": 0,
+        "cache": estado_cache,
+    }
+    if isinstance(resultados, dict):
+        celda["error"] = resultados.get("error")
+        return celda
+
+    celda["opciones"] = len(resultados)
+    mejor = _precio_minimo(resultados)
+    if mejor:
+        celda["precio_minimo"], celda["moneda"] = mejor
+    return celda
+
+
+def validar_datos_calendario(datos):
+    """Devuelve ``(combinaciones, None)`` o ``(None, error)``."""
+    if not datos.get("origin") or not datos.get("destination") or not datos.get("date"):
+        return None, {"error": "Faltan datos obligatorios (origin, destination, date)",
+                      "code": 400}
+
+    fecha_ida = _parse_fecha(datos.get("date"))
+    fecha_vuelta = _parse_fecha(datos["return_date"]) if datos.get("return_date") else None
+    if fecha_ida is None or (datos.get("return_date") and fecha_vuelta is None):
+        return None, {"error": "Fechas invalidas, use YYYY-MM-DD", "code": 400}
+
+    max_dias = _setting_int("SABRE_FLEX_MAX_DAYS", 3)
+    try:
+        dias = int(datos.get("dias", max_dias))
+    except (TypeError, ValueError):
+        return None, {"error": "'dias' debe ser un entero", "code": 400}
+    dias = max(0, min(dias, max_dias))
+
+    combinaciones = generar_combinaciones(fecha_ida, fecha_vuelta, dias)
+    if not combinaciones:
+        return None, {"error": "No hay fechas futuras en el rango pedido", "code": 400}
+    return combinaciones, None
+
+
+def iterar_calendario(datos, combinaciones):
+    """Genera cada celda en cuanto su busqueda termina (orden de llegada)."""
+    hilos = max(1, _setting_int("SABRE_FLEX_MAX_WORKERS", 4))
+    executor = ThreadPoolExecutor(max_workers=min(hilos, len(combinaciones)))
+    try:
+        futuros = [
+            executor.submit(_buscar_celda, datos, ida, vuelta)
+            for ida, vuelta in combinaciones
+        ]
+        for futuro in as_completed(futuros):
+            yield futuro.result()
+    finally:
+        # Si el cliente corta el stream no seguimos consultando a Sabre.
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def armar_matriz(celdas):
+    """Matriz compacta de precios minimos: filas = ida, columnas = vuelta."""
+    fechas_ida = sorted({c["ida"] for c in celdas})
+    fechas_vuelta = sorted({c["vuelta"] for c in celdas if c["vuelta"]})
+    columnas = fechas_vuelta or [None]
+    por_celda = {(c["ida"], c["vuelta"]): c["precio_minimo"] for c in celdas}
+
+    con_precio = [c for c in celdas if c["precio_minimo"] is not None]
+    mas_barata = min(con_precio, key=lambda c: c["precio_minimo"]) if con_precio else None
+    return {
+        "fechas_ida": fechas_ida,
+        "fechas_vuelta": fechas_vuelta,
+        "precios": [[por_celda.get((ida, vuelta)) for vuelta in columnas] for ida in fechas_ida],
+        "moneda": mas_barata["moneda"] if mas_barata else None,
+        "mas_barata": (
+            {"ida": mas_barata["ida"], "vuelta": mas_barata["vuelta"],
+             "precio": mas_barata["precio_minimo"]}
+            if mas_barata else None
+        ),
+    }
+
+
+def calendario_tarifas(datos):
+    """Version no streaming: devuelve solo la matriz (o un dict de error)."""
+    combinaciones, error = validar_datos_calendario(datos)
+    if error:
+        return error
+    return armar_matriz(list(iterar_calendario(datos, combinaciones)))
@@ -0,0 +1,207 @@
+"""Intentos de reserva (checkout Stripe) con cache + BD (write-through).
+
+``crear_checkout`` / ``crear_checkout_paquete`` guardaban el intent solo en
+la cache; con LocMem y varios workers la confirmacion fallaba (404) cada vez
+que caia en otro proceso. Ahora:
+
+  * ``guardar_intent`` escribe en la cache y en ``IntentoReserva``.
+  * ``recuperar_intent`` lee la cache y, si no esta, hace una busqueda por
+    ``stripe_session_id`` (indice unico) en la BD y vuelve a llenar la cache.
+  * Las filas vencidas se borran de forma perezosa: al leer una vencida y,
+    como mucho una vez cada ``BOOKING_INTENT_PURGE_INTERVAL`` segundos, al
+    guardar un intent nuevo (``expira_en`` esta indexado).
+
+La cache sigue siendo opcional y los errores de BD solo se loguean: en el
+peor caso se comporta como antes (solo cache).
+
+``confirmar_una_vez`` hace idempotente la confirmacion: doble clic, la
+pagina de exito y el webhook de Stripe pueden confirmar la misma sesion a
+la vez. El primero toma el bloqueo (``confirmando_hasta`` de la fila, con
+un UPDATE condicional que funciona entre workers) y hace el trabajo; los
+demas esperan hasta ``BOOKING_CONFIRM_WAIT`` segundos y devuelven la
+reserva guardada, sin volver a consultar Stripe ni reservar en Sabre.
+
+El bloqueo dura ``BOOKING_CONFIRM_LOCK_SECONDS`` pero un hilo lo renueva
+cada tercio de ese tiempo mientras la confirmacion sigue en curso (Sabre
+con reintentos puede tardar mas): solo vence si el worker muere.
+"""
+
+import datetime as _dt
+import json
+import logging
+import threading
+import time
+
+from .cacheSabre import _cache, _setting_int
+
+logger = logging.getLogger(__name__)
+
+TIPO_VUELO = "VUELO"
+TIPO_PAQUETE = "PAQUETE"
+
+INTENT_TTL = 60 * 60 * 24  # 24 h
+
+_CLAVES = {
+    TIPO_VUELO: "booking_intent:{sid}",
+    TIPO_PAQUETE: "paquete_intent:{sid}",
+}
+_CLAVE_PURGA = "booking_intent_purga"
+
+_ESPERA_CONFIRMACION = 0.25  # segundos entre consultas mientras otro confirma
+
+
+def _ahora():
+    from django.utils import timezone
+
+    return timezone.now()
+
+
+def purgar_vencidos():
+    """Borra los intentos vencidos. Devuelve cuantos se borraron."""
+    from .models import IntentoReserva
+
+    borrados, _ = IntentoReserva.objects.filter(expira_en__lte=_ahora()).delete()
+    return borrados
+
+
+def _purgar_si_toca():
+    intervalo = _setting_int("BOOKING_INTENT_PURGE_INTERVAL", 3600)
+    # cache.add es atomico: solo un worker por intervalo hace la purga
+    if _cache is not None and not _cache.add(_CLAVE_PURGA, 1, intervalo):
+        return
+    purgar_vencidos()
+
+
+def guardar_intent(tipo, session_id, intent, ttl=INTENT_TTL):
+    """Guarda el intent en cache y en la BD (idempotente por session_id)."""
+    if _cache is not None:
+        _cache.set(_CLAVES[tipo].format(sid=session_id), json.dumps(intent), ttl)
+    try:
+        from .models import IntentoReserva
+
+        IntentoReserva.objects.update_or_create(
+            stripe_session_id=session_id,
+            defaults={"tipo": tipo, "datos": intent,
+                      "expira_en": _ahora() + _dt.timedelta(seconds=ttl)},
+        )
+        _purgar_si_toca()
+    except Exception:
+        logger.exception("No se pudo persistir el intento de reserva %s", session_id)
+
+
+def recuperar_intent(tipo, session_id):
+    """Intent vigente de ``session_id`` (cache -> BD) o None."""
+    if not session_id:
+        return None
+    clave = _CLAVES[tipo].format(sid=session_id)
+    if _cache is not None:
+        raw = _cache.get(clave)
+        if raw:
+            return json.loads(raw)
+    try:
+        from .models import IntentoReserva
+
+        fila = IntentoReserva.objects.filter(stripe_session_id=session_id, tipo=tipo).first()
+    except Exception:
+        logger.exception("No se pudo leer el intento de reserva %s", session_id)
+        return None
+    if fila is None:
+        return None
+    restante = (fila.expira_en - _ahora()).total_seconds()
+    if restante <= 0:
+        fila.delete()
+        return None
+    if _cache is not None:
+        _cache.set(clave, json.dumps(fila.datos), int(restante))
+    return fila.datos
+
+
+def _vence_bloqueo():
+    return _ahora() + _dt.timedelta(seconds=_setting_int("BOOKING_CONFIRM_LOCK_SECONDS", 120))
+
+
+def _tomar_confirmacion(session_id):
+    """Vencimiento del bloqueo si se tomo, False si otro lo tiene, None si no hay fila."""
+    from django.db.models import Q
+
+    from .models import IntentoReserva
+
+    ahora = _ahora()
+    hasta = _vence_bloqueo()
+    tomado = (IntentoReserva.objects
+              .filter(stripe_session_id=session_id)
+              .filter(Q(confirmando_hasta__isnull=True) | Q(confirmando_hasta__lte=ahora))
+              .update(confirmando_hasta=hasta))
+    if tomado:
+        return hasta
+    if IntentoReserva.objects.filter(stripe_session_id=session_id).exists():
+        return False
+    return None
+
+
+def _mantener_confirmacion(session_id, hasta, parar):
+    """Renueva el bloqueo hasta que se active ``parar`` (corre en su propio hilo).
+
+    El UPDATE compara con el ultimo vencimiento puesto: si otra peticion se
+    quedo con el bloqueo, deja de renovar.
+    """
+    from django.db import connection
+
+    from .models import IntentoReserva
+
+    intervalo = _setting_int("BOOKING_CONFIRM_LOCK_SECONDS", 120) / 3
+    try:
+        while not parar.wait(intervalo):
+            nuevo = _vence_bloqueo()
+            if not IntentoReserva.objects.filter(
+                    stripe_session_id=session_id, confirmando_hasta=hasta,
+            ).update(confirmando_hasta=nuevo):
+                logger.warning("Se perdio el bloqueo de la confirmacion %s", session_id)
+                return
+            hasta = nuevo
+    except Exception:
+        logger.exception("No se pudo renovar el bloqueo de la confirmacion %s", session_id)
+    finally:
+        connection.close()  # el hilo abre su propia conexion
+
+
+def _liberar_confirmacion(session_id):
+    from .models import IntentoReserva
+
+    IntentoReserva.objects.filter(stripe_session_id=session_id).update(confirmando_hasta=None)
+
+
+def confirmar_una_vez(session_id, obtener_guardada, confirmar):
+    """Ejecuta ``confirmar(session_id)`` una sola vez por sesion de Stripe.
+
+    ``obtener_guardada(session_id)`` devuelve la reserva ya confirmada (o
+    None). Si otra peticion tiene el bloqueo se espera su resultado; si no
+    llega a tiempo se responde 409. Sin fila de intent (BD no disponible o
+    intent vencido) se confirma sin bloqueo, como antes.
+    """
+    limite = time.monotonic() + _setting_int("BOOKING_CONFIRM_WAIT", 30)
+    while True:
+        guardada = obtener_guardada(session_id)
+        if guardada:
+            return guardada
+        try:
+            tomado = _tomar_confirmacion(session_id)
+        except Exception:
+            logger.exception("No se pudo bloquear la confirmacion %s", session_id)
+            tomado = None
+        if tomado is not False:
+            parar = threading.Event()
+            if tomado:
+                threading.Thread(target=_mantener_confirmacion, args=(session_id, tomado, parar),
+                                 daemon=True).start()
+            try:
+                # Otra peticion pudo terminar entre la lectura y el bloqueo
+                return obtener_guardada(session_id) or confirmar(session_id)
+            finally:
+                parar.set()
+                if tomado:
+                    _liberar_confirmacion(session_id)
+        if time.monotonic() >= limite:
+            return {"error": "La reserva se esta confirmando en otra peticion; "
+                             "intente de nuevo en unos segundos", "code": 409}
+        time.sleep(_ESPERA_CONFIRMACION)
@@ -0,0 +1,105 @@
+"""JSON rapido (orjson) para los payloads grandes de Sabre.
+
+Una respuesta BFM de 200 itinerarios pesa varios MB y pasa dos veces por
+JSON en cada busqueda: al decodificar el cuerpo de Sabre y al renderizar
+los resultados normalizados. orjson hace ambas cosas en C y escribe
+directamente ``bytes`` UTF-8.
+
+orjson es opcional: si no esta instalado todo cae a la libreria estandar
+(y al renderer/parser por defecto de DRF) con el mismo resultado.
+
+La salida se mantiene identica a la de DRF: fechas, Decimal, strings lazy,
+etc. se delegan al ``JSONEncoder`` de DRF, y si orjson no puede con algun
+valor (p. ej. enteros de mas de 64 bits) se reintenta con la estandar.
+"""
+
+import json
+
+from django.http import HttpResponse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+ORJSON_DISPONIBLE = orjson is not None
+
+if orjson is not None:
+    # Fechas por el encoder de DRF (formato 'Z', milisegundos) en vez del de orjson.
+    _OPCIONES_ORJSON = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+_ENCODER_DRF = JSONEncoder()
+
+
+def _por_defecto(obj):
+    return _ENCODER_DRF.default(obj)
+
+
+def loads(data):
+    """Decodifica ``bytes``/``str`` JSON. Lanza ``ValueError`` si no es valido."""
+    if orjson is not None:
+        return orjson.loads(data)  # JSONDecodeError hereda de ValueError
+    return json.loads(data)
+
+
+def _dumps_estandar(obj):
+    return json.dumps(
+        obj, cls=JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def dumps(obj):
+    """Serializa a ``bytes`` UTF-8 compactos (mismo formato que DRF)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_por_defecto, option=_OPCIONES_ORJSON)
+        except orjson.JSONEncodeError:
+            pass
+    return _dumps_estandar(obj)
+
+
+class JSONRapidoRenderer(JSONRenderer):
+    """``JSONRenderer`` de DRF que usa orjson cuando esta disponible.
+
+    Las respuestas con indentacion (``Accept: application/json; indent=4``)
+    siguen por el renderer original.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        renderer_context = renderer_context or {}
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class JSONRapidoParser(JSONParser):
+    """``JSONParser`` de DRF que decodifica con orjson cuando esta disponible."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}") from exc
+
+
+class JSONRapidoMixin:
+    """Renderers/parsers rapidos para las ``APIView`` con payloads de Sabre."""
+
+    renderer_classes = (JSONRapidoRenderer, BrowsableAPIRenderer)
+    parser_classes = (JSONRapidoParser, FormParser, MultiPartParser)
+
+
+class JsonRapidoResponse(HttpResponse):
+    """Equivalente a ``JsonResponse(data, safe=False)`` serializado con ``dumps``."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(data), **kwargs)
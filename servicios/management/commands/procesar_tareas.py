@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from servicios.tareasFondo import procesar_pendientes, purgar_completadas
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker de la cola de tareas en segundo plano (vouchers por correo, "
+        "avisos de nuevas reservas). Procesa las tareas pendientes en lotes "
+        "y reintenta las fallidas con backoff."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--una-vez", action="store_true",
+                            help="Procesa las tareas listas y termina (útil en cron)")
+        parser.add_argument("--intervalo", type=float, default=5,
+                            help="Segundos de espera cuando no hay tareas (default 5)")
+        parser.add_argument("--workers", type=int, default=None,
+                            help="Hilos concurrentes (default TAREAS_WORKERS)")
+        parser.add_argument("--lote", type=int, default=None,
+                            help="Tareas por lote (default TAREAS_LOTE)")
+
+    def handle(self, *args, **options):
+        ultima_purga = 0.0
+        while True:
+            if time.monotonic() - ultima_purga > 3600:
+                purgar_completadas()
+                ultima_purga = time.monotonic()
+            res = procesar_pendientes(options["lote"], options["workers"])
+            if res["procesadas"]:
+                self.stdout.write(
+                    f"Tareas procesadas: {res['procesadas']} | "
+                    f"completadas: {res['completadas']} | fallidas: {res['fallidas']}"
+                )
+                continue
+            if options["una_vez"]:
+                break
+            time.sleep(options["intervalo"])
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicios', '0026_configuracionnotificaciones_reservapaquete_revisada_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntentoReserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe_session_id', models.CharField(max_length=200, unique=True, verbose_name='Sesión de Stripe')),
+                ('tipo', models.CharField(choices=[('VUELO', 'Vuelo'), ('PAQUETE', 'Paquete')], max_length=10, verbose_name='Tipo')),
+                ('datos', models.JSONField(blank=True, default=dict, verbose_name='Intento (JSON)')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('expira_en', models.DateTimeField(db_index=True, verbose_name='Expira en')),
+            ],
+            options={
+                'verbose_name': 'Intento de Reserva',
+                'verbose_name_plural': 'Intentos de Reserva',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+    ]
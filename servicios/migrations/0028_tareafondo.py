@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:22
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicios', '0027_intentoreserva'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TareaFondo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=40, verbose_name='Tipo')),
+                ('clave', models.CharField(max_length=200, unique=True, verbose_name='Clave de idempotencia')),
+                ('payload', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Datos')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_PROCESO', 'En proceso'), ('COMPLETADA', 'Completada'), ('FALLIDA', 'Fallida')], default='PENDIENTE', max_length=12, verbose_name='Estado')),
+                ('intentos', models.PositiveIntegerField(default=0, verbose_name='Intentos')),
+                ('max_intentos', models.PositiveIntegerField(default=5, verbose_name='Máximo de intentos')),
+                ('disponible_en', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Disponible desde')),
+                ('bloqueada_hasta', models.DateTimeField(blank=True, help_text='Si el worker muere, la tarea se retoma después de esta hora', null=True, verbose_name='Bloqueada hasta')),
+                ('ultimo_error', models.TextField(blank=True, verbose_name='Último error')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Última actualización')),
+            ],
+            options={
+                'verbose_name': 'Tarea en segundo plano',
+                'verbose_name_plural': 'Tareas en segundo plano',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(fields=['estado', 'disponible_en'], name='servicios_t_estado_ebfe2b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicios', '0028_tareafondo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='intentoreserva',
+            name='confirmando_hasta',
+            field=models.DateTimeField(blank=True, help_text='Bloqueo de la confirmación en curso (evita reservar dos veces)', null=True, verbose_name='Confirmando hasta'),
+        ),
+    ]
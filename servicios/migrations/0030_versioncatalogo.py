@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:44
+
+import time
+
+from django.db import migrations, models
+
+
+def crear_version(apps, schema_editor):
+    # Arranca en el reloj (ms) para no repetir ETags si la tabla se recrea
+    VersionCatalogo = apps.get_model('servicios', 'VersionCatalogo')
+    VersionCatalogo.objects.get_or_create(pk=1, defaults={'version': int(time.time() * 1000)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicios', '0029_intentoreserva_confirmando_hasta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionCatalogo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(verbose_name='Versión')),
+            ],
+            options={
+                'verbose_name': 'Versión del Catálogo',
+                'verbose_name_plural': 'Versión del Catálogo',
+            },
+        ),
+        migrations.RunPython(crear_version, migrations.RunPython.noop),
+    ]
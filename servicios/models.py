@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.core.exceptions import ValidationError
 from django.utils import timezone
@@ -400,6 +401,26 @@ class TipoViaje(models.Model):
         return self.nombre
 
 
+class PaqueteTuristicoQuerySet(models.QuerySet):
+    """Consultas de paquetes que tienen en cuenta la fecha de vigencia."""
+
+    @staticmethod
+    def condicion_vigente(prefijo=""):
+        """Q de paquete activo y no vencido (``prefijo`` p. ej. ``'paquete__'``)."""
+        return models.Q(**{f"{prefijo}activo": True}) & (
+            models.Q(**{f"{prefijo}precio_aplica_hasta__isnull": True})
+            | models.Q(**{f"{prefijo}precio_aplica_hasta__gte": timezone.localdate()})
+        )
+
+    def vigentes(self):
+        """Paquetes visibles en el catálogo: activos y con 'precio_aplica_hasta' no vencido.
+
+        Solo lee: un paquete que venció hoy deja de mostrarse aunque el barrido
+        ``desactivar_paquetes_vencidos`` todavía no lo haya desactivado.
+        """
+        return self.filter(self.condicion_vigente())
+
+
 class PaqueteTuristico(GoogleDrivePDFMixin, models.Model):
     """Modelo principal para paquetes turísticos"""
     
@@ -481,6 +502,8 @@ class PaqueteTuristico(GoogleDrivePDFMixin, models.Model):
     activo = models.BooleanField(default=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    objects = PaqueteTuristicoQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Paquete Turístico'
@@ -521,6 +544,10 @@ class PaqueteTuristico(GoogleDrivePDFMixin, models.Model):
         Solo afecta a paquetes que tienen una fecha 'precio_aplica_hasta'
         definida; los que no la tienen conservan su estado manual.
 
+        Escribe en la BD: se ejecuta en el barrido programado
+        (``manage.py desactivar_paquetes_vencidos``) y al guardar desde el
+        admin, nunca en las lecturas (que usan ``objects.vigentes()``).
+
         Retorna una tupla (desactivados, reactivados).
         """
         hoy = timezone.localdate()
@@ -537,6 +564,11 @@ class PaqueteTuristico(GoogleDrivePDFMixin, models.Model):
             precio_aplica_hasta__gte=hoy,
         ).update(activo=True)
 
+        if desactivados or reactivados:
+            # update() no dispara post_save: invalidar la cache del catálogo
+            from .cacheCatalogo import invalidar_catalogo
+            invalidar_catalogo()
+
         return desactivados, reactivados
 
 
@@ -763,3 +795,88 @@ class ReservaPaquete(models.Model):
 
     def __str__(self):
         return f"{self.localizador} - {self.paquete_titulo} ({self.estado})"
+
+
+class IntentoReserva(models.Model):
+    """Intento de reserva (checkout Stripe creado, pago aun sin confirmar).
+
+    Copia persistente del "intent" que antes vivia solo en cache: la
+    confirmacion lo busca por ``stripe_session_id`` aunque llegue a otro
+    worker o despues de un reinicio. Las filas vencidas se borran de forma
+    perezosa (ver ``intentosReserva``).
+    """
+    TIPO_CHOICES = [
+        ('VUELO', 'Vuelo'),
+        ('PAQUETE', 'Paquete'),
+    ]
+
+    stripe_session_id = models.CharField("Sesión de Stripe", max_length=200, unique=True)
+    tipo = models.CharField("Tipo", max_length=10, choices=TIPO_CHOICES)
+    datos = models.JSONField("Intento (JSON)", default=dict, blank=True)
+    fecha_creacion = models.DateTimeField("Fecha de creación", auto_now_add=True)
+    expira_en = models.DateTimeField("Expira en", db_index=True)
+    confirmando_hasta = models.DateTimeField(
+        "Confirmando hasta", null=True, blank=True,
+        help_text="Bloqueo de la confirmación en curso (evita reservar dos veces)",
+    )
+
+    class Meta:
+        ordering = ['-fecha_creacion']
+        verbose_name = "Intento de Reserva"
+        verbose_name_plural = "Intentos de Reserva"
+
+    def __str__(self):
+        return f"{self.tipo} - {self.stripe_session_id}"
+
+
+class TareaFondo(models.Model):
+    """Trabajo en segundo plano (voucher por correo, aviso de nueva reserva...).
+
+    Lo encola la peticion (``tareasFondo.encolar``) y lo ejecuta el worker
+    ``python manage.py procesar_tareas``. ``clave`` evita encolar dos veces
+    el mismo trabajo de una reserva.
+    """
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_PROCESO', 'En proceso'),
+        ('COMPLETADA', 'Completada'),
+        ('FALLIDA', 'Fallida'),
+    ]
+
+    tipo = models.CharField("Tipo", max_length=40)
+    clave = models.CharField("Clave de idempotencia", max_length=200, unique=True)
+    payload = models.JSONField("Datos", default=dict, blank=True, encoder=DjangoJSONEncoder)
+    estado = models.CharField("Estado", max_length=12, choices=ESTADO_CHOICES, default='PENDIENTE')
+    intentos = models.PositiveIntegerField("Intentos", default=0)
+    max_intentos = models.PositiveIntegerField("Máximo de intentos", default=5)
+    disponible_en = models.DateTimeField("Disponible desde", default=timezone.now)
+    bloqueada_hasta = models.DateTimeField("Bloqueada hasta", null=True, blank=True,
+                                           help_text="Si el worker muere, la tarea se retoma después de esta hora")
+    ultimo_error = models.TextField("Último error", blank=True)
+    fecha_creacion = models.DateTimeField("Fecha de creación", auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField("Última actualización", auto_now=True)
+
+    class Meta:
+        ordering = ['-fecha_creacion']
+        indexes = [models.Index(fields=['estado', 'disponible_en'])]
+        verbose_name = "Tarea en segundo plano"
+        verbose_name_plural = "Tareas en segundo plano"
+
+    def __str__(self):
+        return f"{self.tipo} - {self.clave} ({self.estado})"
+
+
+class VersionCatalogo(models.Model):
+    """Singleton con la version del catalogo (ver ``cacheCatalogo``).
+
+    Vive en la BD y no en la cache para que todos los workers vean la misma
+    version aunque la cache sea local a cada proceso.
+    """
+    version = models.BigIntegerField("Versión")
+
+    class Meta:
+        verbose_name = "Versión del Catálogo"
+        verbose_name_plural = "Versión del Catálogo"
+
+    def __str__(self):
+        return f"Catálogo v{self.version}"
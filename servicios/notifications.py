@@ -3,7 +3,7 @@ Módulo de notificaciones desacoplado.
 Contiene funciones reutilizables para enviar correos y mensajes de WhatsApp.
 """
 import os
-import requests
+from .LlamadosAPIS.Cliente_HTTP import INTEGRACION_WHATSAPP, sesion_http, timeout_http
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
 from email.mime.image import MIMEImage
@@ -98,7 +98,10 @@ def enviar_whatsapp_plantilla(numero_destino, nombre_plantilla, idioma, parametr
         print(f"   Parámetros: {parametros}")
         print("=" * 50)
         
-        response = requests.post(url, headers=headers, json=payload)
+        response = sesion_http(INTEGRACION_WHATSAPP).post(
+            url, headers=headers, json=payload,
+            timeout=timeout_http(INTEGRACION_WHATSAPP),
+        )
         
         print(f"Respuesta Status: {response.status_code}")
         print(f"Respuesta Body: {response.text}")
@@ -480,16 +483,28 @@ def enviar_correo_nueva_reserva(tipo, codigo, email_cliente, telefono_cliente,
 
 
 def notificar_nueva_reserva_async(tipo, codigo, email_cliente, telefono_cliente,
-                                  monto, moneda, detalle, detalle_extra=None):
-    """Envía la notificación de nueva reserva en un hilo de fondo (best-effort)."""
-    import threading
-
-    def _worker():
-        try:
-            enviar_correo_nueva_reserva(tipo, codigo, email_cliente,
-                                        telefono_cliente, monto, moneda,
-                                        detalle, detalle_extra)
-        except Exception:  # noqa: BLE001
-            pass
-
-    threading.Thread(target=_worker, daemon=True).start()
+                                  monto, moneda, detalle, detalle_extra=None, *, session_id):
+    """Encola la notificación de nueva reserva (la envía el worker ``procesar_tareas``).
+
+    Idempotente por tipo + sesión de Stripe: confirmar dos veces no duplica el
+    aviso. No se usa el código (PNR/localizador) porque puede venir vacío.
+    """
+    from .tareasFondo import TAREA_NOTIFICAR_RESERVA, encolar
+
+    encolar(
+        TAREA_NOTIFICAR_RESERVA,
+        {"tipo": tipo, "codigo": codigo, "email_cliente": email_cliente,
+         "telefono_cliente": telefono_cliente, "monto": monto, "moneda": moneda,
+         "detalle": detalle, "detalle_extra": detalle_extra},
+        clave=f"{TAREA_NOTIFICAR_RESERVA}:{tipo}:{session_id}",
+    )
+
+
+def tarea_notificar_nueva_reserva(**datos):
+    """Manejador de la tarea: lanza RuntimeError si el correo falló (se reintenta)."""
+    config = obtener_config_notificaciones()
+    if config and not config.notificar_reservas:
+        return
+    res = enviar_correo_nueva_reserva(**datos)
+    if not res.get('success'):
+        raise RuntimeError(res.get('message') or 'No se pudo enviar la notificación')
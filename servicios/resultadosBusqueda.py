@@ -0,0 +1,139 @@
+"""Filtrado, orden y paginacion en servidor sobre una busqueda ya cacheada.
+
+Cada busqueda en Sabre devuelve un id de sesion (``X-Search-Session``) que
+es el digest de la clave de cache de sus resultados normalizados. Con ese id
+el frontend pide paginas filtradas/ordenadas sin volver a consultar a Sabre
+ni recibir la lista completa. La sesion vive lo mismo que la entrada de
+cache (``SABRE_SEARCH_CACHE_TTL`` + ``SABRE_SEARCH_CACHE_STALE``); si ya
+expiro hay que repetir la busqueda.
+
+Filtros, orden y ranking corren sobre las columnas precalculadas de los
+resultados (``columnasVuelos``), no sobre los dicts anidados.
+
+Parametros (query string):
+  * ``max_escalas``: escalas maximas por tramo.
+  * ``aerolineas``: codigos separados por coma (alguna debe operar el itinerario).
+  * ``precio_min`` / ``precio_max``: sobre ``precio_total``.
+  * ``salida_desde`` / ``salida_hasta``: ventana HH:MM de salida de la ida.
+  * ``vuelta_desde`` / ``vuelta_hasta``: idem para la vuelta.
+  * ``orden``: ``recomendado`` (por defecto), ``precio``, ``-precio``,
+    ``duracion``, ``salida``, ``-salida`` o ``mejor`` (ver ``columnasVuelos.puntajes``).
+  * ``pagina`` (desde 1) y ``por_pagina`` (maximo ``MAX_POR_PAGINA``).
+"""
+
+import math
+import re
+
+from .cacheSabre import clave_de_digest, leer_entrada
+from .columnasVuelos import CRITERIOS, columnas_de, filtrar, ordenar_indices, ranking
+from .searchFlights import CACHE_NAMESPACE_BUSQUEDA
+
+POR_PAGINA = 20
+MAX_POR_PAGINA = 100
+
+_HORA = re.compile(r"^([01]\d|2[0-3]):[0-5]\d$")
+
+
+def _a_minutos(hora):
+    return int(hora[:2]) * 60 + int(hora[3:5]) if hora else None
+
+
+def _parse_filtros(parametros):
+    """Devuelve ``((filtros, paginacion), None)`` o ``(None, error)``.
+
+    ``filtros`` son los argumentos de ``columnasVuelos.filtrar``.
+    """
+    filtros = {}
+    try:
+        if parametros.get("max_escalas") not in (None, ""):
+            filtros["max_escalas"] = int(parametros["max_escalas"])
+        for campo in ("precio_min", "precio_max"):
+            if parametros.get(campo) not in (None, ""):
+                filtros[campo] = float(parametros[campo])
+        pagina = int(parametros.get("pagina") or 1)
+        por_pagina = int(parametros.get("por_pagina") or POR_PAGINA)
+    except (TypeError, ValueError):
+        return None, {"error": "Parametros numericos invalidos", "code": 400}
+
+    for campo in ("salida_desde", "salida_hasta", "vuelta_desde", "vuelta_hasta"):
+        valor = parametros.get(campo)
+        if valor and not _HORA.match(valor):
+            return None, {"error": f"'{campo}' debe tener formato HH:MM", "code": 400}
+    filtros["salida_ida"] = (_a_minutos(parametros.get("salida_desde")),
+                             _a_minutos(parametros.get("salida_hasta")))
+    filtros["salida_vuelta"] = (_a_minutos(parametros.get("vuelta_desde")),
+                                _a_minutos(parametros.get("vuelta_hasta")))
+
+    if parametros.get("aerolineas"):
+        filtros["aerolineas"] = {
+            a.strip().upper() for a in str(parametros["aerolineas"]).split(",") if a.strip()
+        }
+
+    orden = parametros.get("orden") or "recomendado"
+    if orden != "recomendado" and orden not in CRITERIOS:
+        return None, {"error": f"'orden' debe ser uno de: recomendado, {', '.join(CRITERIOS)}",
+                      "code": 400}
+
+    paginacion = {"orden": orden, "pagina": max(pagina, 1),
+                  "por_pagina": max(1, min(por_pagina, MAX_POR_PAGINA))}
+    return (filtros, paginacion), None
+
+
+def _facetas(columnas):
+    """Valores disponibles en la busqueda completa (para armar los filtros en la UI)."""
+    precios = [p for p in columnas.precio if p != math.inf]
+    return {
+        "aerolineas": sorted(set().union(*columnas.aerolineas)),
+        "escalas": sorted(set(columnas.escalas_max)),
+        "precio_min": min(precios, default=None),
+        "precio_max": max(precios, default=None),
+    }
+
+
+def _destacados(resultados, columnas, indices):
+    destacados = {}
+    for nombre, i in ranking(columnas, indices).items():
+        destacados[nombre] = None if i is None else {
+            "id_itinerario_unico": resultados[i].get("id_itinerario_unico"),
+            "precio_total": resultados[i].get("precio_total"),
+            "duracion_minutos": columnas.duracion[i],
+            "escalas": columnas.escalas[i],
+        }
+    return destacados
+
+
+def pagina_de_resultados(resultados, parametros, sesion_id):
+    """Filtra, ordena y pagina ``resultados`` (lista ya normalizada)."""
+    parseado, error = _parse_filtros(parametros)
+    if error:
+        return error
+    filtros, paginacion = parseado
+
+    columnas = columnas_de(resultados)
+    indices = filtrar(columnas, **filtros)
+    if paginacion["orden"] != "recomendado":
+        indices = ordenar_indices(columnas, indices, paginacion["orden"])
+
+    por_pagina = paginacion["por_pagina"]
+    inicio = (paginacion["pagina"] - 1) * por_pagina
+    return {
+        "sesion": sesion_id,
+        "total": len(indices),
+        "total_sin_filtros": len(resultados),
+        "pagina": paginacion["pagina"],
+        "por_pagina": por_pagina,
+        "paginas": math.ceil(len(indices) / por_pagina),
+        "facetas": _facetas(columnas),
+        "destacados": _destacados(resultados, columnas, indices),
+        "resultados": [resultados[i] for i in indices[inicio:inicio + por_pagina]],
+    }
+
+
+def consultar_sesion_busqueda(sesion_id, parametros):
+    """Pagina de una busqueda cacheada, o dict de error (404 si expiro)."""
+    clave = clave_de_digest(CACHE_NAMESPACE_BUSQUEDA, sesion_id)
+    resultados = leer_entrada(clave) if clave else None
+    if resultados is None:
+        return {"error": "La sesion de busqueda no existe o expiro; repita la busqueda",
+                "code": 404}
+    return pagina_de_resultados(resultados, parametros, sesion_id)
@@ -4,22 +4,84 @@ Recibe un itinerario (lista de tramos con sus segmentos) tal como lo entrega
 `procesar_respuesta` en searchFlights.py y consulta al endpoint
 `/v5/shop/flights/revalidate` de Sabre para confirmar si el vuelo sigue
 disponible para reservar.
+
+El resultado se cachea ``SABRE_REVALIDATE_CACHE_TTL`` segundos bajo la huella
+del itinerario (segmentos normalizados, fare basis y pasajeros): si otro
+usuario o pestana acaba de revalidar el mismo itinerario la respuesta es
+inmediata. Antes del checkout se pide con ``forzar=True`` para ir siempre a
+Sabre (y de paso refrescar la cache).
 """
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
-from .LlamadosAPIS.Llamado_Api_TOKEN import SabreAuthError, obtener_token_sabre
+from .cacheSabre import (
+    _setting_int,
+    construir_clave,
+    guardar_en_cache,
+    llamada_unica,
+    llamada_unica_async,
+    obtener_con_cache,
+    obtener_con_cache_async,
+)
+from .circuitoSabre import (
+    ENDPOINT_REVALIDACION,
+    CircuitoAbiertoError,
+    llamada_protegida,
+    llamada_protegida_async,
+    respuesta_degradada,
+)
+from .LlamadosAPIS.Cliente_HTTP import (
+    ERRORES_HTTP,
+    INTEGRACION_SABRE,
+    post_async,
+    sesion_http,
+)
+from .LlamadosAPIS.Llamado_Api_TOKEN import (
+    SabreAuthError,
+    obtener_token_sabre,
+    obtener_token_sabre_async,
+)
 
 SABRE_REVALIDATE_URL = "https://api.cert.platform.sabre.com/v5/shop/flights/revalidate"
+CACHE_NAMESPACE_REVALIDACION = "revalidacion"
 
 
-def _llamar_revalidate(payload, force_refresh=False):
-    token = obtener_token_sabre(force_refresh=force_refresh)
-    headers = {
+def _headers(token):
+    return {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
     }
-    return requests.post(SABRE_REVALIDATE_URL, headers=headers, json=payload, timeout=30)
+
+
+def _llamar_revalidate(payload, force_refresh=False):
+    def _llamar():
+        token = obtener_token_sabre(force_refresh=force_refresh)
+        return llamada_protegida(ENDPOINT_REVALIDACION, lambda timeout: sesion_http(INTEGRACION_SABRE).post(
+            SABRE_REVALIDATE_URL, headers=_headers(token), json=payload, timeout=timeout,
+        ))
+
+    return llamada_unica(
+        CACHE_NAMESPACE_REVALIDACION,
+        {"payload": payload, "force_refresh": force_refresh},
+        _llamar,
+    )
+
+
+async def _llamar_revalidate_async(payload, force_refresh=False):
+    async def _llamar():
+        token = await obtener_token_sabre_async(force_refresh=force_refresh)
+        return await llamada_protegida_async(ENDPOINT_REVALIDACION, lambda timeout: post_async(
+            INTEGRACION_SABRE, SABRE_REVALIDATE_URL, headers=_headers(token), json=payload, timeout=timeout,
+        ))
+
+    return await llamada_unica_async(
+        CACHE_NAMESPACE_REVALIDACION,
+        {"payload": payload, "force_refresh": force_refresh},
+        _llamar,
+    )
 
 
 def _normalizar_segmento(seg):
@@ -155,11 +217,11 @@ def _construir_payload(tramos, pasajeros):
     }
 
 
-def revalidar_itinerario(datos):
-    """Consulta Sabre Revalidate y devuelve un dict con 'disponible' True/False."""
+def _preparar_payload(datos):
+    """Devuelve ``(payload, None)`` o ``(None, error)`` si los datos no sirven."""
     tramos = datos.get("tramos") or []
     if not tramos:
-        return {
+        return None, {
             "disponible": False,
             "error": "Debe enviar al menos un tramo del itinerario",
             "code": 400,
@@ -172,59 +234,233 @@ def revalidar_itinerario(datos):
     }
 
     try:
-        payload = _construir_payload(tramos, pasajeros)
+        return _construir_payload(tramos, pasajeros), None
     except (KeyError, TypeError, ValueError) as e:
-        return {
+        return None, {
             "disponible": False,
             "error": f"Datos del itinerario incompletos: {e}",
             "code": 400,
         }
 
-    try:
-        response = _llamar_revalidate(payload)
-        if response.status_code == 401:
-            response = _llamar_revalidate(payload, force_refresh=True)
 
-        try:
-            raw = response.json()
-        except ValueError:
-            raw = {"raw_response": response.text}
-
-        if response.status_code != 200:
-            return {
-                "disponible": False,
-                "error": "Sabre rechazo la revalidacion",
-                "code": response.status_code,
-                "detalle": raw,
-            }
+def huella_itinerario(datos):
+    """Partes estables que identifican una revalidacion (base de su clave de cache).
 
-        grouped = raw.get("groupedItineraryResponse", {}) or {}
-        count = (grouped.get("statistics") or {}).get("itineraryCount", 0)
-        itinerary_groups = grouped.get("itineraryGroups") or []
-        itinerarios = itinerary_groups[0].get("itineraries", []) if itinerary_groups else []
+    Solo entra lo que cambia la respuesta de Sabre: los segmentos normalizados
+    (da igual si llegan en formato plano o enriquecido), su fare basis y la
+    mezcla de pasajeros.
+    """
+    tramos = [
+        [
+            {**_normalizar_segmento(seg), "fare_basis": seg.get("fare_basis")}
+            for seg in tramo.get("segmentos") or []
+        ]
+        for tramo in datos.get("tramos") or []
+    ]
+    pasajeros = {
+        tipo: int(datos.get(tipo, defecto) or 0)
+        for tipo, defecto in (("adults", 1), ("children", 0), ("infants", 0))
+    }
+    return {"tramos": tramos, "pasajeros": pasajeros}
 
-        if not count or not itinerarios:
-            return {
-                "disponible": False,
-                "error": "El vuelo ya no esta disponible para reserva",
-                "code": 409,
-            }
 
-        first = itinerarios[0]
-        pricing = (first.get("pricingInformation") or [{}])[0].get("fare", {})
-        total_fare = pricing.get("totalFare", {})
+def _es_resultado_cacheable(resultado):
+    # Disponible o "ya no disponible" (409) son respuestas de Sabre; los
+    # errores de red, de autenticacion o el circuito abierto no se cachean.
+    return resultado.get("disponible") is True or resultado.get("code") == 409
 
+
+def _interpretar_respuesta(response):
+    try:
+        raw = response.json()
+    except ValueError:
+        raw = {"raw_response": response.text}
+
+    if response.status_code != 200:
+        return {
+            "disponible": False,
+            "error": "Sabre rechazo la revalidacion",
+            "code": response.status_code,
+            "detalle": raw,
+        }
+
+    grouped = raw.get("groupedItineraryResponse", {}) or {}
+    count = (grouped.get("statistics") or {}).get("itineraryCount", 0)
+    itinerary_groups = grouped.get("itineraryGroups") or []
+    itinerarios = itinerary_groups[0].get("itineraries", []) if itinerary_groups else []
+
+    if not count or not itinerarios:
         return {
-            "disponible": True,
-            "mensaje": "El vuelo sigue disponible",
-            "precio_total": total_fare.get("totalPrice"),
-            "precio_base": total_fare.get("baseFareAmount"),
-            "impuestos": total_fare.get("totalTaxAmount"),
-            "moneda": total_fare.get("currency"),
-            "ultima_fecha_compra": pricing.get("lastTicketDate"),
-            "ultima_hora_compra": pricing.get("lastTicketTime"),
-            "aerolinea_validadora": pricing.get("validatingCarrierCode"),
+            "disponible": False,
+            "error": "El vuelo ya no esta disponible para reserva",
+            "code": 409,
         }
 
+    first = itinerarios[0]
+    pricing = (first.get("pricingInformation") or [{}])[0].get("fare", {})
+    total_fare = pricing.get("totalFare", {})
+
+    return {
+        "disponible": True,
+        "mensaje": "El vuelo sigue disponible",
+        "precio_total": total_fare.get("totalPrice"),
+        "precio_base": total_fare.get("baseFareAmount"),
+        "impuestos": total_fare.get("totalTaxAmount"),
+        "moneda": total_fare.get("currency"),
+        "ultima_fecha_compra": pricing.get("lastTicketDate"),
+        "ultima_hora_compra": pricing.get("lastTicketTime"),
+        "aerolinea_validadora": pricing.get("validatingCarrierCode"),
+    }
+
+
+def _consultar_revalidate(payload):
+    try:
+        response = _llamar_revalidate(payload)
+        if response.status_code == 401:
+            response = _llamar_revalidate(payload, force_refresh=True)
+        return _interpretar_respuesta(response)
+
+    except CircuitoAbiertoError as e:
+        return respuesta_degradada(e, disponible=False)
     except (requests.RequestException, SabreAuthError) as e:
         return {"disponible": False, "error": str(e), "code": 500}
+
+
+async def _consultar_revalidate_async(payload):
+    try:
+        response = await _llamar_revalidate_async(payload)
+        if response.status_code == 401:
+            response = await _llamar_revalidate_async(payload, force_refresh=True)
+        return _interpretar_respuesta(response)
+
+    except CircuitoAbiertoError as e:
+        return respuesta_degradada(e, disponible=False)
+    except (*ERRORES_HTTP, SabreAuthError) as e:
+        return {"disponible": False, "error": str(e), "code": 500}
+
+
+def revalidar_itinerario_con_estado(datos, forzar=False):
+    """Como ``revalidar_itinerario`` pero devuelve ``(resultado, estado_cache)``.
+
+    ``estado_cache`` es ``'hit'`` o ``'miss'``; con ``forzar`` siempre se
+    consulta a Sabre y el resultado reemplaza al cacheado.
+    """
+    payload, error = _preparar_payload(datos)
+    if error:
+        return error, "miss"
+
+    clave = construir_clave(CACHE_NAMESPACE_REVALIDACION, huella_itinerario(datos))
+    ttl = _setting_int("SABRE_REVALIDATE_CACHE_TTL", 60)
+    if forzar:
+        resultado = _consultar_revalidate(payload)
+        if _es_resultado_cacheable(resultado):
+            guardar_en_cache(clave, resultado, ttl)
+        return resultado, "miss"
+    return obtener_con_cache(
+        CACHE_NAMESPACE_REVALIDACION, clave, lambda: _consultar_revalidate(payload),
+        ttl=ttl, cacheable=_es_resultado_cacheable,
+    )
+
+
+def revalidar_itinerario(datos, forzar=False):
+    """Consulta Sabre Revalidate y devuelve un dict con 'disponible' True/False."""
+    resultado, _estado = revalidar_itinerario_con_estado(datos, forzar=forzar)
+    return resultado
+
+
+async def revalidar_itinerario_async(datos, forzar=False):
+    """Variante no bloqueante (ASGI) de ``revalidar_itinerario_con_estado``."""
+    payload, error = _preparar_payload(datos)
+    if error:
+        return error, "miss"
+
+    clave = construir_clave(CACHE_NAMESPACE_REVALIDACION, huella_itinerario(datos))
+    ttl = _setting_int("SABRE_REVALIDATE_CACHE_TTL", 60)
+    if forzar:
+        resultado = await _consultar_revalidate_async(payload)
+        if _es_resultado_cacheable(resultado):
+            guardar_en_cache(clave, resultado, ttl)
+        return resultado, "miss"
+    return await obtener_con_cache_async(
+        CACHE_NAMESPACE_REVALIDACION, clave,
+        lambda: _consultar_revalidate_async(payload),
+        lambda: _consultar_revalidate(payload),
+        ttl=ttl, cacheable=_es_resultado_cacheable,
+    )
+
+
+# =====================================================
+# REVALIDACION EN LOTE
+# =====================================================
+
+def _validar_lote(datos):
+    """Devuelve ``(lista de datos por itinerario, None)`` o ``(None, error)``."""
+    opciones = datos.get("opciones")
+    if not isinstance(opciones, list) or not opciones:
+        return None, {"error": "Debe enviar 'opciones' con al menos un itinerario", "code": 400}
+    maximo = max(1, _setting_int("SABRE_REVALIDATE_BATCH_MAX", 10))
+    if len(opciones) > maximo:
+        return None, {"error": f"Maximo {maximo} itinerarios por lote", "code": 400}
+
+    pasajeros = {k: datos[k] for k in ("adults", "children", "infants") if k in datos}
+    return [
+        {**pasajeros, "tramos": (opcion or {}).get("tramos") if isinstance(opcion, dict) else None}
+        for opcion in opciones
+    ], None
+
+
+def _item_lote(indice, opcion, resultado, estado_cache):
+    item = {"indice": indice, "cache": estado_cache, **resultado}
+    if isinstance(opcion, dict) and opcion.get("id_itinerario_unico"):
+        item["id_itinerario_unico"] = opcion["id_itinerario_unico"]
+    return item
+
+
+def _resumen_lote(items):
+    return {
+        "total": len(items),
+        "disponibles": sum(1 for item in items if item.get("disponible")),
+        "resultados": items,
+    }
+
+
+def revalidar_lote(datos, forzar=False):
+    """Revalida varias ``opcion`` de la busqueda en paralelo (hilos acotados).
+
+    ``datos``: ``{"opciones": [...], "adults", "children", "infants"}``. Cada
+    itinerario pasa por ``revalidar_itinerario_con_estado`` (cache por huella
+    y single-flight incluidos). Devuelve un resultado por opcion, en el
+    mismo orden, o un dict de error si el lote no es valido.
+    """
+    lote, error = _validar_lote(datos)
+    if error:
+        return error
+
+    hilos = max(1, _setting_int("SABRE_REVALIDATE_BATCH_WORKERS", 4))
+    with ThreadPoolExecutor(max_workers=min(hilos, len(lote))) as executor:
+        respuestas = list(executor.map(
+            lambda item: revalidar_itinerario_con_estado(item, forzar=forzar), lote
+        ))
+    return _resumen_lote([
+        _item_lote(i, opcion, resultado, estado)
+        for i, (opcion, (resultado, estado)) in enumerate(zip(datos["opciones"], respuestas, strict=True))
+    ])
+
+
+async def revalidar_lote_async(datos, forzar=False):
+    """Variante no bloqueante de ``revalidar_lote`` (semaforo en vez de hilos)."""
+    lote, error = _validar_lote(datos)
+    if error:
+        return error
+
+    semaforo = asyncio.Semaphore(max(1, _setting_int("SABRE_REVALIDATE_BATCH_WORKERS", 4)))
+
+    async def _revalidar(item):
+        async with semaforo:
+            return await revalidar_itinerario_async(item, forzar=forzar)
+
+    respuestas = await asyncio.gather(*(_revalidar(item) for item in lote))
+    return _resumen_lote([
+        _item_lote(i, opcion, resultado, estado)
+        for i, (opcion, (resultado, estado)) in enumerate(zip(datos["opciones"], respuestas, strict=True))
+    ])
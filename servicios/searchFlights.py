@@ -1,10 +1,42 @@
+import sys
 from datetime import datetime, timedelta
+from itertools import pairwise
 
 import requests
-from .LlamadosAPIS.Llamado_Api_TOKEN import SabreAuthError, obtener_token_sabre
+from .cacheSabre import (
+    _setting_int,
+    buscar_en_cache,
+    construir_clave,
+    digest_de_clave,
+    guardar_en_cache,
+    llamada_unica,
+    llamada_unica_async,
+    obtener_con_cache,
+    obtener_con_cache_async,
+)
+from .circuitoSabre import (
+    ENDPOINT_BUSQUEDA,
+    CircuitoAbiertoError,
+    llamada_protegida,
+    llamada_protegida_async,
+    respuesta_degradada,
+)
+from .columnasVuelos import ordenar
+from .LlamadosAPIS.Cliente_HTTP import (
+    ERRORES_HTTP,
+    INTEGRACION_SABRE,
+    post_async,
+    sesion_http,
+)
+from .LlamadosAPIS.Llamado_Api_TOKEN import (
+    SabreAuthError,
+    obtener_token_sabre,
+    obtener_token_sabre_async,
+)
 
 SABRE_URL = "https://api.cert.platform.sabre.com/v5/offers/shop" 
 PROVEEDOR_SABRE = "sabre"
+CACHE_NAMESPACE_BUSQUEDA = "busqueda"
 
 
 def _construir_ids_fuente(proveedor, id_itinerario, indice):
@@ -14,30 +46,71 @@ def _construir_ids_fuente(proveedor, id_itinerario, indice):
     return proveedor_normalizado, id_fuente, id_unico
 
 
-def _buscar_en_sabre(payload, force_refresh=False):
-    token = obtener_token_sabre(force_refresh=force_refresh)
-    headers = {
+def _headers_sabre(token):
+    return {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
     }
-    return requests.post(SABRE_URL, headers=headers, json=payload, timeout=30)
 
-def buscar_vuelos_sabre(datos):
-   
-    origen = datos.get('origin')
-    destino = datos.get('destination')
-    fecha_ida = datos.get('date')
-    fecha_vuelta = datos.get('return_date')
-    
-    # --- LÍMITE DE RESULTADOS (default 20, máximo 200) ---
-    limit = min(int(datos.get('limit', 20)), 200)
+
+def _buscar_en_sabre(payload, force_refresh=False):
+    def _llamar():
+        token = obtener_token_sabre(force_refresh=force_refresh)
+        return llamada_protegida(ENDPOINT_BUSQUEDA, lambda timeout: sesion_http(INTEGRACION_SABRE).post(
+            SABRE_URL, headers=_headers_sabre(token), json=payload, timeout=timeout,
+        ))
+
+    return llamada_unica(
+        CACHE_NAMESPACE_BUSQUEDA,
+        {"payload": payload, "force_refresh": force_refresh},
+        _llamar,
+    )
+
+
+async def _buscar_en_sabre_async(payload, force_refresh=False):
+    async def _llamar():
+        token = await obtener_token_sabre_async(force_refresh=force_refresh)
+        return await llamada_protegida_async(ENDPOINT_BUSQUEDA, lambda timeout: post_async(
+            INTEGRACION_SABRE, SABRE_URL, headers=_headers_sabre(token), json=payload, timeout=timeout,
+        ))
+
+    return await llamada_unica_async(
+        CACHE_NAMESPACE_BUSQUEDA,
+        {"payload": payload, "force_refresh": force_refresh},
+        _llamar,
+    )
+
+
+def _normalizar_parametros(datos):
+    """Parametros canonicos de la busqueda: base del payload y de la clave de cache."""
+    return {
+        "origin": (datos.get('origin') or '').strip().upper(),
+        "destination": (datos.get('destination') or '').strip().upper(),
+        "date": (datos.get('date') or '').strip(),
+        "return_date": (datos.get('return_date') or '').strip() or None,
+        "adults": int(datos.get('adults', 0)),
+        "children": int(datos.get('children', 0)),
+        "infants": int(datos.get('infants', 0)),
+        "cabin_class": (datos.get('cabin_class') or 'Y').strip().upper(),
+        # --- LÍMITE DE RESULTADOS (default 20, máximo 200) ---
+        "limit": min(int(datos.get('limit', 20)), 200),
+    }
+
+
+def _construir_payload(params):
+    origen = params["origin"]
+    destino = params["destination"]
+    fecha_ida = params["date"]
+    fecha_vuelta = params["return_date"]
+
+    limit = params["limit"]
     if limit <= 50:
         request_type = "50ITINS"
     elif limit <= 100:
         request_type = "100ITINS"
     else:
         request_type = "200ITINS"
-    
+
     # --- LÓGICA DE TRAMOS (IDA O IDA/VUELTA) ---
     tramos = [
         {
@@ -57,15 +130,15 @@ def buscar_vuelos_sabre(datos):
 
     # --- LÓGICA DE PASAJEROS ---
     pasajeros = []
-    if int(datos.get('adults', 0)) > 0:
-        pasajeros.append({"Code": "ADT", "Quantity": int(datos['adults'])})
-    if int(datos.get('children', 0)) > 0:
-        pasajeros.append({"Code": "CNN", "Quantity": int(datos['children'])})
-    if int(datos.get('infants', 0)) > 0:
-        pasajeros.append({"Code": "INF", "Quantity": int(datos['infants'])})
+    if params["adults"] > 0:
+        pasajeros.append({"Code": "ADT", "Quantity": params["adults"]})
+    if params["children"] > 0:
+        pasajeros.append({"Code": "CNN", "Quantity": params["children"]})
+    if params["infants"] > 0:
+        pasajeros.append({"Code": "INF", "Quantity": params["infants"]})
 
     # --- ESTRUCTURA EXACTA REQUERIDA ---
-    payload = {
+    return {
         "OTA_AirLowFareSearchRQ": {
             "Version": "5",
             "POS": {
@@ -81,7 +154,7 @@ def buscar_vuelos_sabre(datos):
             "OriginDestinationInformation": tramos,
             "TravelPreferences": {
                 "CabinPref": [{
-                    "Cabin": datos.get('cabin_class', 'Y'), 
+                    "Cabin": params["cabin_class"],
                     "PreferLevel": "Preferred"
                 }],
                 "TPA_Extensions": {
@@ -101,6 +174,24 @@ def buscar_vuelos_sabre(datos):
         }
     }
 
+
+def _interpretar_respuesta(response):
+    try:
+        raw_response = response.json()
+    except ValueError:
+        raw_response = {"raw_response": response.text}
+
+    if response.status_code != 200:
+        return {
+            "error": "Error en Sabre",
+            "code": response.status_code,
+            "detail": raw_response
+        }
+
+    return procesar_respuesta(raw_response, proveedor=PROVEEDOR_SABRE)
+
+
+def _consultar_sabre(payload):
     try:
         response = _buscar_en_sabre(payload)
 
@@ -108,299 +199,414 @@ def buscar_vuelos_sabre(datos):
         if response.status_code == 401:
             response = _buscar_en_sabre(payload, force_refresh=True)
 
-        try:
-            raw_response = response.json()
-        except ValueError:
-            raw_response = {"raw_response": response.text}
+        return _interpretar_respuesta(response)
 
-        if response.status_code != 200:
-            return {
-                "error": "Error en Sabre",
-                "code": response.status_code,
-                "detail": raw_response
-            }
+    except CircuitoAbiertoError as e:
+        return respuesta_degradada(e)
+    except (requests.RequestException, SabreAuthError, ValueError) as e:
+        return {"error": str(e), "code": 500}
 
-        return procesar_respuesta(raw_response, proveedor=PROVEEDOR_SABRE)
 
-    except (requests.RequestException, SabreAuthError, ValueError) as e:
+async def _consultar_sabre_async(payload):
+    try:
+        response = await _buscar_en_sabre_async(payload)
+        if response.status_code == 401:
+            response = await _buscar_en_sabre_async(payload, force_refresh=True)
+
+        return _interpretar_respuesta(response)
+
+    except CircuitoAbiertoError as e:
+        return respuesta_degradada(e)
+    except (*ERRORES_HTTP, SabreAuthError, ValueError) as e:
         return {"error": str(e), "code": 500}
 
+
+def _es_resultado_cacheable(resultado):
+    # Los errores (dict con "error") nunca se cachean.
+    return isinstance(resultado, list)
+
+
+def buscar_vuelos_sabre_con_estado(datos):
+    """Como ``buscar_vuelos_sabre`` pero devuelve ``(resultado, estado_cache)``.
+
+    ``estado_cache`` es ``'hit'``, ``'stale'`` o ``'miss'`` (ver ``cacheSabre``).
+    """
+    params = _normalizar_parametros(datos)
+    payload = _construir_payload(params)
+    return obtener_con_cache(
+        CACHE_NAMESPACE_BUSQUEDA,
+        construir_clave(CACHE_NAMESPACE_BUSQUEDA, params),
+        lambda: _consultar_sabre(payload),
+        ttl=_setting_int("SABRE_SEARCH_CACHE_TTL", 300),
+        stale=_setting_int("SABRE_SEARCH_CACHE_STALE", 600),
+        cacheable=_es_resultado_cacheable,
+    )
+
+
+def buscar_vuelos_sabre(datos):
+    resultado, _estado = buscar_vuelos_sabre_con_estado(datos)
+    return resultado
+
+
+def sesion_busqueda(datos):
+    """Id de sesion de la busqueda ``datos``: digest de la clave de sus resultados.
+
+    Permite volver a pedir los resultados cacheados (filtrados/paginados,
+    ver ``resultadosBusqueda``) sin repetir la consulta a Sabre.
+    """
+    return digest_de_clave(construir_clave(CACHE_NAMESPACE_BUSQUEDA, _normalizar_parametros(datos)))
+
+
+def buscar_vuelos_sabre_stream(datos):
+    """Busqueda para respuestas en streaming: ``(itinerarios, estado_cache)``.
+
+    ``itinerarios`` es la lista cacheada (HIT/STALE, ya ordenada), un
+    generador que normaliza y entrega cada itinerario en el orden de Sabre
+    (MISS; al agotarse guarda la lista ordenada en la cache), o un dict de
+    error si Sabre fallo antes de empezar.
+    """
+    params = _normalizar_parametros(datos)
+    payload = _construir_payload(params)
+    clave = construir_clave(CACHE_NAMESPACE_BUSQUEDA, params)
+    ttl = _setting_int("SABRE_SEARCH_CACHE_TTL", 300)
+    stale = _setting_int("SABRE_SEARCH_CACHE_STALE", 600)
+
+    servido = buscar_en_cache(
+        CACHE_NAMESPACE_BUSQUEDA, clave, lambda: _consultar_sabre(payload),
+        ttl, stale, cacheable=_es_resultado_cacheable,
+    )
+    if servido is not None:
+        return servido
+
+    try:
+        response = _buscar_en_sabre(payload)
+        if response.status_code == 401:
+            response = _buscar_en_sabre(payload, force_refresh=True)
+        if response.status_code != 200:
+            return _interpretar_respuesta(response), "miss"
+        raw_response = response.json()
+    except CircuitoAbiertoError as e:
+        return respuesta_degradada(e), "miss"
+    except (requests.RequestException, SabreAuthError, ValueError) as e:
+        return {"error": str(e), "code": 500}, "miss"
+
+    def _generar():
+        resultados = []
+        for opcion in iterar_itinerarios(raw_response, proveedor=PROVEEDOR_SABRE):
+            if ttl:
+                resultados.append(opcion)  # sin cache no se retiene nada
+            yield opcion
+        if ttl:
+            guardar_en_cache(clave, ordenar_resultados(resultados), ttl, stale)
+
+    return _generar(), "miss"
+
+
+async def buscar_vuelos_sabre_async(datos):
+    """Variante no bloqueante (ASGI) de ``buscar_vuelos_sabre_con_estado``."""
+    params = _normalizar_parametros(datos)
+    payload = _construir_payload(params)
+    return await obtener_con_cache_async(
+        CACHE_NAMESPACE_BUSQUEDA,
+        construir_clave(CACHE_NAMESPACE_BUSQUEDA, params),
+        lambda: _consultar_sabre_async(payload),
+        lambda: _consultar_sabre(payload),
+        ttl=_setting_int("SABRE_SEARCH_CACHE_TTL", 300),
+        stale=_setting_int("SABRE_SEARCH_CACHE_STALE", 600),
+        cacheable=_es_resultado_cacheable,
+    )
+
 def formatear_duracion(minutos):
     """Convierte minutos a formato legible (ej: 2h 30m)"""
     horas = minutos // 60
     mins = minutos % 60
     return f"{horas}h {mins}m"
 
+def _intern(valor):
+    return sys.intern(valor) if isinstance(valor, str) else valor
+
+
+def _punto(datos):
+    """Sub-dict origen/destino/salida/llegada con strings internados."""
+    return {
+        "aeropuerto": _intern(datos.get('airport', '')),
+        "ciudad": _intern(datos.get('city', '')),
+        "pais": _intern(datos.get('country', '')),
+        "hora": _intern(datos.get('time', '')),
+    }
+
+
+class _IndiceRespuesta:
+    """Referencias de una respuesta BFM indexadas UNA vez.
+
+    BFM repite los mismos schedules y legs en muchos itinerarios, asi que
+    todo lo que solo depende de ellos (aerolinea, salida/llegada, fechas,
+    escalas) se arma una vez por respuesta y se comparte entre opciones.
+    Por itinerario solo se construyen los dicts que cambian (clase de
+    servicio/cabina/fare basis por segmento). Los sub-dicts compartidos son
+    de solo lectura.
+    """
+
+    def __init__(self, resp):
+        self.schedules = {sch['id']: sch for sch in resp.get('scheduleDescs', [])}
+        self.legs = {leg['id']: leg for leg in resp.get('legDescs', [])}
+        self.fare_descs = {fc['id']: fc for fc in resp.get('fareComponentDescs', [])}
+        self._tramos = {}
+
+    def tramo(self, leg_ref, idx, fecha_tramo_str, fecha_base):
+        """Plantilla ``(tramo, segmentos, llegadas)`` del leg, o None si no tiene schedules."""
+        clave = (leg_ref, idx)
+        if clave not in self._tramos:
+            self._tramos[clave] = self._armar_tramo(leg_ref, idx, fecha_tramo_str, fecha_base)
+        return self._tramos[clave]
+
+    def _armar_tramo(self, leg_ref, idx, fecha_tramo_str, fecha_base):
+        leg_data = self.legs.get(leg_ref, {})
+        schedules = [self.schedules.get(s['ref'], {}) for s in leg_data.get('schedules', [])]
+        if not schedules:
+            return None
+
+        num_escalas = len(schedules) - 1
+        duracion_total = leg_data.get('elapsedTime', 0)
+        tramo = {
+            "tipo": "ida" if idx == 0 else "vuelta",
+            "fecha_salida": fecha_tramo_str,
+            "origen": _punto(schedules[0].get('departure', {})),
+            "destino": _punto(schedules[-1].get('arrival', {})),
+            "duracion_total": formatear_duracion(duracion_total),
+            "duracion_minutos": duracion_total,
+            "tiene_escalas": num_escalas > 0,
+            "numero_escalas": num_escalas,
+            "segmentos": None,
+        }
+
+        segmentos = []
+        llegadas = []
+        fecha_actual = fecha_base
+        for seg_idx, segmento_data in enumerate(schedules):
+            carrier = segmento_data.get('carrier', {})
+            salida = segmento_data.get('departure', {})
+            llegada = segmento_data.get('arrival', {})
+
+            dep_time_raw = salida.get('time', '') or ''
+            arr_time_raw = llegada.get('time', '') or ''
+            dep_time = dep_time_raw[:8] if len(dep_time_raw) >= 8 else dep_time_raw
+            arr_time = arr_time_raw[:8] if len(arr_time_raw) >= 8 else arr_time_raw
+            arr_adj = llegada.get('dateAdjustment', 0) or 0
+
+            fecha_hora_salida = None
+            fecha_hora_llegada = None
+            fecha_salida_seg = None
+            fecha_llegada_seg = None
+            if fecha_actual is not None:
+                fecha_salida_seg = fecha_actual
+                fecha_llegada_seg = fecha_actual + timedelta(days=arr_adj)
+                if dep_time:
+                    fecha_hora_salida = f"{fecha_salida_seg.isoformat()}T{dep_time}"
+                if arr_time:
+                    fecha_hora_llegada = f"{fecha_llegada_seg.isoformat()}T{arr_time}"
+                # El proximo segmento empieza desde la fecha de llegada (aprox)
+                fecha_actual = fecha_llegada_seg
+
+            punto_salida = _punto(salida)
+            punto_salida["terminal"] = salida.get('terminal')
+            punto_llegada = _punto(llegada)
+            punto_llegada["terminal"] = llegada.get('terminal')
+            punto_llegada["dia_siguiente"] = llegada.get('dateAdjustment', 0) > 0
+
+            marketing = _intern(carrier.get('marketing', ''))
+            segmentos.append({
+                "numero_segmento": seg_idx + 1,
+                "vuelo": f"{marketing}{carrier.get('marketingFlightNumber', '')}",
+                "numero_vuelo": carrier.get('marketingFlightNumber'),
+                "numero_vuelo_operador": carrier.get('operatingFlightNumber') or carrier.get('marketingFlightNumber'),
+                "clase_servicio": None,
+                "cabina": None,
+                "fare_basis": None,
+                "fecha_salida": fecha_salida_seg.isoformat() if fecha_salida_seg else None,
+                "fecha_llegada": fecha_llegada_seg.isoformat() if fecha_llegada_seg else None,
+                "fecha_hora_salida": fecha_hora_salida,
+                "fecha_hora_llegada": fecha_hora_llegada,
+                "aerolinea": {
+                    "codigo": marketing,
+                    "operada_por": _intern(carrier.get('operating', '')),
+                    "nombre_compartido": carrier.get('codeShared', ''),
+                    "alianza": _intern(carrier['alliances'].strip()) if carrier.get('alliances') else None
+                },
+                "salida": punto_salida,
+                "llegada": punto_llegada,
+                "duracion": formatear_duracion(segmento_data.get('elapsedTime', 0)),
+                "duracion_minutos": segmento_data.get('elapsedTime', 0),
+                "millas": segmento_data.get('totalMilesFlown', 0),
+                "avion": _intern(carrier.get('equipment', {}).get('code', '')),
+                "paradas_intermedias": segmento_data.get('stopCount', 0)
+            })
+            llegadas.append(llegada.get('airport'))
+
+        # Agregar info de escalas si las hay
+        if num_escalas > 0:
+            tramo["escalas"] = [
+                {
+                    "aeropuerto": actual["llegada"]["aeropuerto"],
+                    "ciudad": actual["llegada"]["ciudad"],
+                    "pais": actual["llegada"]["pais"],
+                    "hora_llegada": actual["llegada"]["hora"],
+                    "hora_salida": siguiente["salida"]["hora"],
+                }
+                for actual, siguiente in pairwise(segmentos)
+            ]
+        return tramo, segmentos, llegadas
+
+
+def _fare_info(passenger_info_list, fare_descs):
+    """``fare_info`` del itinerario, construido directamente (sin copia intermedia).
+
+    IMPORTANTE: dentro de un fareComponent, todos los vuelos comparten la
+    misma clase. Adicionalmente, fareComponents[].segments puede traer
+    entradas vacias (surface/hidden) que NO corresponden a schedules, por
+    eso NO se puede mapear secuencialmente. Se mapea por rango
+    beginAirport -> endAirport contra los schedules reales.
+    """
+    fare_info = []
+    if not passenger_info_list:
+        return fare_info
+    passenger_info = passenger_info_list[0].get('passengerInfo', {})
+    for fc in passenger_info.get('fareComponents', []):
+        code = None
+        cabin = None
+        for seg in fc.get('segments', []):
+            seg_data = seg.get('segment') or {}
+            if not code and seg_data.get('bookingCode'):
+                code = seg_data.get('bookingCode')
+            if not cabin and seg_data.get('cabinCode'):
+                cabin = seg_data.get('cabinCode')
+            if code and cabin:
+                break
+        # Datos del fareComponentDescs referenciado (fareBasis, etc.)
+        fc_desc = fare_descs.get(fc.get('ref'), {})
+        fare_info.append({
+            "begin": _intern(fc.get('beginAirport')),
+            "end": _intern(fc.get('endAirport')),
+            "fare_basis": fc_desc.get('fareBasisCode'),
+            "governing_carrier": _intern(fc_desc.get('governingCarrier')),
+            "brand_code": fc.get('brandCode') or fc_desc.get('brandCode'),
+            "cabin": cabin or fc_desc.get('cabinCode'),
+            "booking_code": code,
+            "fare_amount": fc_desc.get('fareAmount'),
+            "fare_currency": fc_desc.get('fareCurrency'),
+        })
+    return fare_info
+
+
+def iterar_itinerarios(data_json, proveedor=PROVEEDOR_SABRE):
+    """Genera cada itinerario normalizado en el orden en que Sabre lo devuelve.
+
+    Permite enviar resultados al frontend a medida que se construyen
+    (streaming) sin esperar a la lista completa. Las excepciones por datos
+    malformados se propagan; ``procesar_respuesta`` las convierte en error.
+    """
+    resp = data_json.get('groupedItineraryResponse', {})
+    itinerary_groups = resp.get('itineraryGroups', [])
+
+    if not itinerary_groups:
+        return
+
+    indice = _IndiceRespuesta(resp)
+
+    # Fechas de cada tramo (leg) segun lo solicitado en la busqueda
+    fechas_legs = []
+    for leg_desc in itinerary_groups[0].get('groupDescription', {}).get('legDescriptions', []):
+        fecha_tramo_str = leg_desc.get('departureDate')
+        try:
+            fecha = datetime.strptime(fecha_tramo_str, "%Y-%m-%d").date() if fecha_tramo_str else None
+        except (TypeError, ValueError):
+            fecha = None
+        fechas_legs.append((fecha_tramo_str, fecha))
+
+    itinerarios = itinerary_groups[0].get('itineraries', [])
+
+    for idx_itinerario, it in enumerate(itinerarios, start=1):
+        pricing_info = it['pricingInformation'][0]['fare']
+        fare = pricing_info['totalFare']
+        fare_info = _fare_info(pricing_info.get('passengerInfoList') or [], indice.fare_descs)
+
+        id_original = it.get('id')
+        proveedor_actual, id_fuente, id_unico = _construir_ids_fuente(
+            proveedor,
+            id_original,
+            idx_itinerario
+        )
+
+        opcion = {
+            "id": id_original,
+            "proveedor": proveedor_actual,
+            "id_itinerario_proveedor": id_fuente,
+            "id_itinerario_unico": id_unico,
+            "precio_total": fare.get('totalPrice'),
+            "precio_base": fare.get('baseFareAmount'),
+            "impuestos": fare.get('totalTaxAmount'),
+            "moneda": fare.get('currency'),
+            "aerolinea_validadora": pricing_info.get('validatingCarrierCode'),
+            "ultima_fecha_compra": pricing_info.get('lastTicketDate'),
+            "fare_info": fare_info,
+            "tramos": []
+        }
+
+        aerolineas_ida = set()
+        aerolineas_vuelta = set()
+        fc_idx = 0
+        for idx, leg_ref in enumerate(it.get('legs', [])):
+            fecha_tramo_str, fecha_base = fechas_legs[idx] if idx < len(fechas_legs) else (None, None)
+            plantilla = indice.tramo(leg_ref['ref'], idx, fecha_tramo_str, fecha_base)
+            if plantilla is None:
+                continue
+            plantilla_tramo, plantillas_seg, llegadas = plantilla
+
+            segmentos = []
+            for plantilla_seg, llegada in zip(plantillas_seg, llegadas):
+                segmento = plantilla_seg.copy()
+                if fc_idx < len(fare_info):
+                    fci = fare_info[fc_idx]
+                    segmento["clase_servicio"] = fci["booking_code"]
+                    segmento["cabina"] = fci["cabin"]
+                    segmento["fare_basis"] = fci["fare_basis"]
+                    # Avanzar al siguiente fareComponent cuando este segmento
+                    # llega al endAirport del fareComponent actual.
+                    if llegada and llegada == fci["end"]:
+                        fc_idx += 1
+                segmentos.append(segmento)
+
+            tramo = plantilla_tramo.copy()
+            tramo["segmentos"] = segmentos
+            opcion["tramos"].append(tramo)
+
+            destino_aerolineas = aerolineas_ida if tramo["tipo"] == "ida" else aerolineas_vuelta
+            for segmento in segmentos:
+                destino_aerolineas.add(segmento["aerolinea"]["codigo"])
+
+        tramos = opcion["tramos"]
+        opcion["resumen"] = {
+            "aerolineas_ida": list(aerolineas_ida),
+            "aerolineas_vuelta": list(aerolineas_vuelta),
+            "es_vuelo_directo_ida": len(tramos) > 0 and not tramos[0].get("tiene_escalas", True),
+            "es_vuelo_directo_vuelta": len(tramos) > 1 and not tramos[1].get("tiene_escalas", True)
+        }
+
+        yield opcion
+
+
+def ordenar_resultados(resultados):
+    """Orden para el frontend: menor escalas → menor duración → menor precio.
+
+    Devuelve un ``ResultadosVuelos`` (lista) con las columnas de orden/filtro
+    ya calculadas (ver ``columnasVuelos``).
+    """
+    return ordenar(resultados)
+
+
 def procesar_respuesta(data_json, proveedor=PROVEEDOR_SABRE):
     """Devuelve un JSON limpio y ordenado para el Frontend"""
     try:
-        resultados = []
-        resp = data_json.get('groupedItineraryResponse', {})
-        itinerary_groups = resp.get('itineraryGroups', [])
-
-        if not itinerary_groups:
-            return []
-
-        # Mapas de referencias
-        mapa_schedules = {sch['id']: sch for sch in resp.get('scheduleDescs', [])}
-        mapa_legs = {leg['id']: leg for leg in resp.get('legDescs', [])}
-        mapa_fare_descs = {fc['id']: fc for fc in resp.get('fareComponentDescs', [])}
-
-        # Fechas de cada tramo (leg) segun lo solicitado en la busqueda
-        leg_descriptions = itinerary_groups[0].get('groupDescription', {}).get('legDescriptions', [])
-
-        itinerarios = itinerary_groups[0].get('itineraries', [])
-
-        for idx_itinerario, it in enumerate(itinerarios, start=1):
-            fare = it['pricingInformation'][0]['fare']['totalFare']
-            pricing_info = it['pricingInformation'][0]['fare']
-
-            # Construir lista de fareComponents con su bookingCode representativo.
-            # IMPORTANTE: dentro de un fareComponent, todos los vuelos comparten la
-            # misma clase. Adicionalmente, fareComponents[].segments puede traer
-            # entradas vacias (surface/hidden) que NO corresponden a schedules, por
-            # eso NO se puede mapear secuencialmente. Se mapea por rango
-            # beginAirport -> endAirport contra los schedules reales.
-            fare_components_info = []
-            passenger_info_list = pricing_info.get('passengerInfoList') or []
-            if passenger_info_list:
-                passenger_info = passenger_info_list[0].get('passengerInfo', {})
-                for fc in passenger_info.get('fareComponents', []):
-                    code = None
-                    cabin = None
-                    for seg in fc.get('segments', []):
-                        seg_data = seg.get('segment') or {}
-                        if not code and seg_data.get('bookingCode'):
-                            code = seg_data.get('bookingCode')
-                        if not cabin and seg_data.get('cabinCode'):
-                            cabin = seg_data.get('cabinCode')
-                        if code and cabin:
-                            break
-                    # Datos del fareComponentDescs referenciado (fareBasis, etc.)
-                    fc_desc = mapa_fare_descs.get(fc.get('ref'), {})
-                    fare_components_info.append({
-                        'begin': fc.get('beginAirport'),
-                        'end': fc.get('endAirport'),
-                        'code': code,
-                        'cabin': cabin or fc_desc.get('cabinCode'),
-                        'fare_basis': fc_desc.get('fareBasisCode'),
-                        'governing_carrier': fc_desc.get('governingCarrier'),
-                        'brand_code': fc.get('brandCode') or fc_desc.get('brandCode'),
-                        'fare_amount': fc_desc.get('fareAmount'),
-                        'fare_currency': fc_desc.get('fareCurrency'),
-                    })
-            fc_idx = 0
-            id_original = it.get('id')
-            proveedor_actual, id_fuente, id_unico = _construir_ids_fuente(
-                proveedor,
-                id_original,
-                idx_itinerario
-            )
-            
-            opcion = {
-                "id": id_original,
-                "proveedor": proveedor_actual,
-                "id_itinerario_proveedor": id_fuente,
-                "id_itinerario_unico": id_unico,
-                "precio_total": fare.get('totalPrice'),
-                "precio_base": fare.get('baseFareAmount'),
-                "impuestos": fare.get('totalTaxAmount'),
-                "moneda": fare.get('currency'),
-                "aerolinea_validadora": pricing_info.get('validatingCarrierCode'),
-                "ultima_fecha_compra": pricing_info.get('lastTicketDate'),
-                "fare_info": [
-                    {
-                        "begin": fci['begin'],
-                        "end": fci['end'],
-                        "fare_basis": fci['fare_basis'],
-                        "governing_carrier": fci['governing_carrier'],
-                        "brand_code": fci['brand_code'],
-                        "cabin": fci['cabin'],
-                        "booking_code": fci['code'],
-                        "fare_amount": fci['fare_amount'],
-                        "fare_currency": fci['fare_currency'],
-                    }
-                    for fci in fare_components_info
-                ],
-                "tramos": []
-            }
-
-            legs_list = it.get('legs', [])
-            for idx, leg_ref in enumerate(legs_list):
-                # Buscar el legDesc correspondiente
-                leg_data = mapa_legs.get(leg_ref['ref'], {})
-                schedules = leg_data.get('schedules', [])
-                
-                if not schedules:
-                    continue
-                
-                # Información del primer y último segmento
-                primer_segmento = mapa_schedules.get(schedules[0]['ref'], {})
-                ultimo_segmento = mapa_schedules.get(schedules[-1]['ref'], {})
-                
-                num_escalas = len(schedules) - 1
-                duracion_total = leg_data.get('elapsedTime', 0)
-                
-                # Determinar tipo de tramo
-                tipo_tramo = "ida" if idx == 0 else "vuelta"
-
-                # Fecha base del tramo (desde la propia respuesta de Sabre)
-                fecha_tramo_str = None
-                if idx < len(leg_descriptions):
-                    fecha_tramo_str = leg_descriptions[idx].get('departureDate')
-                try:
-                    fecha_actual = datetime.strptime(fecha_tramo_str, "%Y-%m-%d").date() if fecha_tramo_str else None
-                except (TypeError, ValueError):
-                    fecha_actual = None
-
-                tramo = {
-                    "tipo": tipo_tramo,
-                    "fecha_salida": fecha_tramo_str,
-                    "origen": {
-                        "aeropuerto": primer_segmento.get('departure', {}).get('airport', ''),
-                        "ciudad": primer_segmento.get('departure', {}).get('city', ''),
-                        "pais": primer_segmento.get('departure', {}).get('country', ''),
-                        "hora": primer_segmento.get('departure', {}).get('time', '')
-                    },
-                    "destino": {
-                        "aeropuerto": ultimo_segmento.get('arrival', {}).get('airport', ''),
-                        "ciudad": ultimo_segmento.get('arrival', {}).get('city', ''),
-                        "pais": ultimo_segmento.get('arrival', {}).get('country', ''),
-                        "hora": ultimo_segmento.get('arrival', {}).get('time', '')
-                    },
-                    "duracion_total": formatear_duracion(duracion_total),
-                    "duracion_minutos": duracion_total,
-                    "tiene_escalas": num_escalas > 0,
-                    "numero_escalas": num_escalas,
-                    "segmentos": []
-                }
-                
-                # Procesar cada segmento del tramo
-                for seg_idx, schedule_ref in enumerate(schedules):
-                    segmento_data = mapa_schedules.get(schedule_ref['ref'], {})
-                    carrier = segmento_data.get('carrier', {})
-
-                    dep_time_raw = segmento_data.get('departure', {}).get('time', '') or ''
-                    arr_time_raw = segmento_data.get('arrival', {}).get('time', '') or ''
-                    dep_time = dep_time_raw[:8] if len(dep_time_raw) >= 8 else dep_time_raw
-                    arr_time = arr_time_raw[:8] if len(arr_time_raw) >= 8 else arr_time_raw
-                    arr_adj = segmento_data.get('arrival', {}).get('dateAdjustment', 0) or 0
-
-                    fecha_hora_salida = None
-                    fecha_hora_llegada = None
-                    fecha_salida_seg = None
-                    fecha_llegada_seg = None
-                    if fecha_actual is not None:
-                        fecha_salida_seg = fecha_actual
-                        fecha_llegada_seg = fecha_actual + timedelta(days=arr_adj)
-                        if dep_time:
-                            fecha_hora_salida = f"{fecha_salida_seg.isoformat()}T{dep_time}"
-                        if arr_time:
-                            fecha_hora_llegada = f"{fecha_llegada_seg.isoformat()}T{arr_time}"
-                        # El proximo segmento empieza desde la fecha de llegada (aprox)
-                        fecha_actual = fecha_llegada_seg
-
-                    clase_servicio = None
-                    cabina = None
-                    fare_basis_seg = None
-                    if fc_idx < len(fare_components_info):
-                        clase_servicio = fare_components_info[fc_idx].get('code')
-                        cabina = fare_components_info[fc_idx].get('cabin')
-                        fare_basis_seg = fare_components_info[fc_idx].get('fare_basis')
-                        # Avanzar al siguiente fareComponent cuando este segmento
-                        # llega al endAirport del fareComponent actual.
-                        arrival_airport = segmento_data.get('arrival', {}).get('airport')
-                        if arrival_airport and arrival_airport == fare_components_info[fc_idx].get('end'):
-                            fc_idx += 1
-
-                    segmento = {
-                        "numero_segmento": seg_idx + 1,
-                        "vuelo": f"{carrier.get('marketing', '')}{carrier.get('marketingFlightNumber', '')}",
-                        "numero_vuelo": carrier.get('marketingFlightNumber'),
-                        "numero_vuelo_operador": carrier.get('operatingFlightNumber') or carrier.get('marketingFlightNumber'),
-                        "clase_servicio": clase_servicio,
-                        "cabina": cabina,
-                        "fare_basis": fare_basis_seg,
-                        "fecha_salida": fecha_salida_seg.isoformat() if fecha_salida_seg else None,
-                        "fecha_llegada": fecha_llegada_seg.isoformat() if fecha_llegada_seg else None,
-                        "fecha_hora_salida": fecha_hora_salida,
-                        "fecha_hora_llegada": fecha_hora_llegada,
-                        "aerolinea": {
-                            "codigo": carrier.get('marketing', ''),
-                            "operada_por": carrier.get('operating', ''),
-                            "nombre_compartido": carrier.get('codeShared', ''),
-                            "alianza": carrier.get('alliances', '').strip() if carrier.get('alliances') else None
-                        },
-                        "salida": {
-                            "aeropuerto": segmento_data.get('departure', {}).get('airport', ''),
-                            "ciudad": segmento_data.get('departure', {}).get('city', ''),
-                            "pais": segmento_data.get('departure', {}).get('country', ''),
-                            "hora": segmento_data.get('departure', {}).get('time', ''),
-                            "terminal": segmento_data.get('departure', {}).get('terminal')
-                        },
-                        "llegada": {
-                            "aeropuerto": segmento_data.get('arrival', {}).get('airport', ''),
-                            "ciudad": segmento_data.get('arrival', {}).get('city', ''),
-                            "pais": segmento_data.get('arrival', {}).get('country', ''),
-                            "hora": segmento_data.get('arrival', {}).get('time', ''),
-                            "terminal": segmento_data.get('arrival', {}).get('terminal'),
-                            "dia_siguiente": segmento_data.get('arrival', {}).get('dateAdjustment', 0) > 0
-                        },
-                        "duracion": formatear_duracion(segmento_data.get('elapsedTime', 0)),
-                        "duracion_minutos": segmento_data.get('elapsedTime', 0),
-                        "millas": segmento_data.get('totalMilesFlown', 0),
-                        "avion": segmento_data.get('carrier', {}).get('equipment', {}).get('code', ''),
-                        "paradas_intermedias": segmento_data.get('stopCount', 0)
-                    }
-                    tramo["segmentos"].append(segmento)
-                
-                # Agregar info de escalas si las hay
-                if num_escalas > 0:
-                    escalas_info = []
-                    for i in range(num_escalas):
-                        seg_actual = mapa_schedules.get(schedules[i]['ref'], {})
-                        seg_siguiente = mapa_schedules.get(schedules[i + 1]['ref'], {})
-                        
-                        escala = {
-                            "aeropuerto": seg_actual.get('arrival', {}).get('airport', ''),
-                            "ciudad": seg_actual.get('arrival', {}).get('city', ''),
-                            "pais": seg_actual.get('arrival', {}).get('country', ''),
-                            "hora_llegada": seg_actual.get('arrival', {}).get('time', ''),
-                            "hora_salida": seg_siguiente.get('departure', {}).get('time', '')
-                        }
-                        escalas_info.append(escala)
-                    tramo["escalas"] = escalas_info
-                
-                opcion["tramos"].append(tramo)
-            
-            # Resumen rápido de aerolíneas
-            aerolineas_ida = set()
-            aerolineas_vuelta = set()
-            for tramo in opcion["tramos"]:
-                for seg in tramo["segmentos"]:
-                    if tramo["tipo"] == "ida":
-                        aerolineas_ida.add(seg["aerolinea"]["codigo"])
-                    else:
-                        aerolineas_vuelta.add(seg["aerolinea"]["codigo"])
-            
-            opcion["resumen"] = {
-                "aerolineas_ida": list(aerolineas_ida),
-                "aerolineas_vuelta": list(aerolineas_vuelta),
-                "es_vuelo_directo_ida": len(opcion["tramos"]) > 0 and not opcion["tramos"][0].get("tiene_escalas", True),
-                "es_vuelo_directo_vuelta": len(opcion["tramos"]) > 1 and not opcion["tramos"][1].get("tiene_escalas", True)
-            }
-            
-            resultados.append(opcion)
-
-        # --- ORDENAR: menor escalas → menor duración → menor precio ---
-        def sort_key(opcion):
-            total_escalas = sum(t.get('numero_escalas', 0) for t in opcion.get('tramos', []))
-            total_duracion = sum(t.get('duracion_minutos', 0) for t in opcion.get('tramos', []))
-            precio = opcion.get('precio_total') or 0
-            return (total_escalas, total_duracion, precio)
-        
-        resultados.sort(key=sort_key)
-        
-        return resultados
+        return ordenar_resultados(list(iterar_itinerarios(data_json, proveedor)))
     except (KeyError, TypeError, ValueError, IndexError) as e:  # pylint: disable=broad-exception-caught
-        return {"error": f"Error procesando respuesta: {str(e)}"}
\ No newline at end of file
+        return {"error": f"Error procesando respuesta: {str(e)}"}
@@ -0,0 +1,200 @@
+"""Formato compacto del mapa de asientos (``/seatmap/?formato=compacto``).
+
+El mapa normalizado repite por cada asiento un dict completo (caracteristicas,
+precio, estado...). En cabinas de fuselaje ancho eso son cientos de dicts
+casi iguales. El formato compacto los reemplaza por tablas compartidas y
+cadenas por fila:
+
+  * ``caracteristicas``: diccionario de textos de caracteristicas.
+  * ``perfiles``: combinaciones de caracteristicas (indices a ``caracteristicas``).
+  * ``tarifas``: precios/servicios distintos (monto, moneda, servicio,
+    offer_item_id, purchase_by).
+  * Por cabina, ``columnas``: las letras en orden (la tabla de columnas).
+  * Por fila, alineado con ``columnas``:
+      - ``estados``: codigos de ocupacion en run-length (``"3F1O2F"``; ``-`` =
+        no hay asiento en esa columna).
+      - ``disponibles``: bitmap entero, bit ``i`` = asiento de la columna ``i``
+        disponible.
+      - ``perfiles`` y ``tarifas``: indice por columna (``-1`` = sin asiento /
+        sin tarifa).
+
+``expandir_mapa`` es la inversa exacta (el frontend usa la misma logica,
+ver API_DOCUMENTATION.md). Las respuestas delta ya son pequenas y no se
+compactan.
+"""
+
+import re
+
+FORMATO_COMPACTO = "compacto-1"
+SIN_ASIENTO = "-"
+
+_RUN = re.compile(r"(\d+)(.)")
+
+
+def _rle(codigos):
+    """``["F", "F", "O"]`` -> ``"2F1O"``."""
+    partes = []
+    anterior, cuenta = None, 0
+    for codigo in codigos:
+        if codigo == anterior:
+            cuenta += 1
+            continue
+        if anterior is not None:
+            partes.append(f"{cuenta}{anterior}")
+        anterior, cuenta = codigo, 1
+    if anterior is not None:
+        partes.append(f"{cuenta}{anterior}")
+    return "".join(partes)
+
+
+def _des_rle(texto):
+    return [codigo for cuenta, codigo in _RUN.findall(texto) for _ in range(int(cuenta))]
+
+
+class _Tabla:
+    """Tabla de valores unicos -> indice (en orden de aparicion)."""
+
+    def __init__(self):
+        self.valores = []
+        self._indices = {}
+
+    def indice(self, valor):
+        clave = repr(valor)
+        if clave not in self._indices:
+            self._indices[clave] = len(self.valores)
+            self.valores.append(valor)
+        return self._indices[clave]
+
+
+def _letras(cabina):
+    letras = [c["letra"] for c in cabina["columnas"]]
+    for fila in cabina["filas"]:
+        for asiento in fila["asientos"]:
+            if asiento["columna"] not in letras:
+                letras.append(asiento["columna"])
+    return letras
+
+
+def _compactar_cabina(cabina, caracteristicas, perfiles, tarifas):
+    letras = _letras(cabina)
+    filas = []
+    for fila in cabina["filas"]:
+        por_columna = {a["columna"]: a for a in fila["asientos"]}
+        estados, indices_perfil, indices_tarifa, disponibles = [], [], [], 0
+        for i, letra in enumerate(letras):
+            asiento = por_columna.get(letra)
+            if asiento is None:
+                estados.append(SIN_ASIENTO)
+                indices_perfil.append(-1)
+                indices_tarifa.append(-1)
+                continue
+            codigo = asiento["estado"]
+            # Codigos de una letra (F, O, B...); cualquier otro viaja como "?"
+            estados.append(codigo if codigo and len(codigo) == 1 and codigo.isalpha() else "?")
+            if asiento["disponible"]:
+                disponibles |= 1 << i
+            indices_perfil.append(perfiles.indice(
+                [caracteristicas.indice(c) for c in asiento["caracteristicas"]]
+            ))
+            precio = asiento["precio"]
+            if precio is None and asiento["servicio"] is None:
+                indices_tarifa.append(-1)
+            else:
+                indices_tarifa.append(tarifas.indice({**(precio or {}),
+                                                      "servicio": asiento["servicio"]}))
+        filas.append({
+            "numero": fila["numero"],
+            "caracteristicas": [caracteristicas.indice(c) for c in fila["caracteristicas"]],
+            "estados": _rle(estados),
+            "disponibles": disponibles,
+            "perfiles": indices_perfil,
+            "tarifas": indices_tarifa,
+        })
+    return {
+        "codigo": cabina["codigo"],
+        "nombre": cabina["nombre"],
+        "fila_inicial": cabina["fila_inicial"],
+        "fila_final": cabina["fila_final"],
+        "columnas": letras,
+        "posiciones": {c["letra"]: c["posiciones"] for c in cabina["columnas"]},
+        "filas": filas,
+    }
+
+
+def compactar_mapa(normalizado):
+    """Mapa normalizado (``obtener_mapa_asientos``) -> formato compacto.
+
+    Los errores y las respuestas delta se devuelven sin cambios.
+    """
+    if "error" in normalizado or normalizado.get("delta") or "mapas" not in normalizado:
+        return normalizado
+    caracteristicas, perfiles, tarifas = _Tabla(), _Tabla(), _Tabla()
+    mapas = [
+        {
+            **{k: v for k, v in mapa.items() if k != "cabinas"},
+            "cabinas": [_compactar_cabina(c, caracteristicas, perfiles, tarifas)
+                        for c in mapa["cabinas"]],
+        }
+        for mapa in normalizado["mapas"]
+    ]
+    return {
+        **{k: v for k, v in normalizado.items() if k != "mapas"},
+        "formato": FORMATO_COMPACTO,
+        "caracteristicas": caracteristicas.valores,
+        "perfiles": perfiles.valores,
+        "tarifas": tarifas.valores,
+        "mapas": mapas,
+    }
+
+
+def _expandir_cabina(cabina, caracteristicas, perfiles, tarifas):
+    letras = cabina["columnas"]
+    filas = []
+    for fila in cabina["filas"]:
+        asientos = []
+        for i, estado in enumerate(_des_rle(fila["estados"])):
+            if estado == SIN_ASIENTO:
+                continue
+            tarifa = dict(tarifas[fila["tarifas"][i]]) if fila["tarifas"][i] >= 0 else {}
+            servicio = tarifa.pop("servicio", None)
+            asientos.append({
+                "id": f"{fila['numero']}{letras[i]}",
+                "columna": letras[i],
+                "fila": fila["numero"],
+                "disponible": bool(fila["disponibles"] >> i & 1),
+                "estado": None if estado == "?" else estado,
+                "caracteristicas": [caracteristicas[c] for c in perfiles[fila["perfiles"][i]]],
+                "servicio": servicio,
+                "precio": tarifa or None,
+            })
+        filas.append({
+            "numero": fila["numero"],
+            "caracteristicas": [caracteristicas[c] for c in fila["caracteristicas"]],
+            "asientos": asientos,
+        })
+    posiciones = cabina.get("posiciones") or {}
+    return {
+        "codigo": cabina["codigo"],
+        "nombre": cabina["nombre"],
+        "fila_inicial": cabina["fila_inicial"],
+        "fila_final": cabina["fila_final"],
+        "columnas": [{"letra": letra, "posiciones": posiciones[letra]}
+                     for letra in letras if letra in posiciones],
+        "filas": filas,
+    }
+
+
+def expandir_mapa(compacto):
+    """Inversa de ``compactar_mapa`` (referencia para el decoder del frontend)."""
+    if compacto.get("formato") != FORMATO_COMPACTO:
+        return compacto
+    tablas = (compacto["caracteristicas"], compacto["perfiles"], compacto["tarifas"])
+    mapas = [
+        {
+            **{k: v for k, v in mapa.items() if k != "cabinas"},
+            "cabinas": [_expandir_cabina(c, *tablas) for c in mapa["cabinas"]],
+        }
+        for mapa in compacto["mapas"]
+    ]
+    excluir = {"formato", "caracteristicas", "perfiles", "tarifas", "mapas"}
+    return {**{k: v for k, v in compacto.items() if k not in excluir}, "mapas": mapas}
@@ -12,12 +12,25 @@ MODO SANDBOX:
   estructura del API real (seatMaps, cabinCompartments, seatRows,
   priceDefinitions, offerItems, serviceDefinitions). Permite que el
   frontend ya integre la pantalla mientras Sabre habilita el PCC para
-  el endpoint Get Seats.
+  el endpoint Get Seats. Las filas de cada layout de cabina se precalculan
+  una vez y la ocupacion sale de una semilla del segmento (vuelo, fecha,
+  cabina): el mismo vuelo da siempre el mismo mapa y simularlo es barato.
+
+CACHE Y DELTAS:
+  El mapa normalizado se cachea ``SEATMAP_CACHE_TTL`` segundos por vuelo
+  (aerolinea, numero, ruta, fecha), cabina, moneda y tipos de pasajero, asi
+  que reabrir el selector o que otro pasajero lo abra no vuelve a Sabre ni a
+  normalizar la cabina. Cada mapa lleva un ``version`` (hash del estado de
+  sus asientos). Si el cliente envia ``desde_version`` recibe solo los
+  asientos cuya disponibilidad o precio cambio desde esa version
+  (``delta: true``); si la version ya no se conoce recibe el mapa completo.
 """
 
 import datetime as _dt
+import functools
+import hashlib
+import json
 import os
-import random
 import uuid
 
 import requests
@@ -27,11 +40,39 @@ try:
 except ImportError:  # pragma: no cover
     _django_settings = None
 
-from .LlamadosAPIS.Llamado_Api_TOKEN import SabreAuthError, obtener_token_sabre
+from .cacheSabre import (
+    _setting_int,
+    construir_clave,
+    guardar_en_cache,
+    leer_entrada,
+    llamada_unica,
+    llamada_unica_async,
+    obtener_con_cache,
+    obtener_con_cache_async,
+)
+from .circuitoSabre import (
+    ENDPOINT_SEATMAP,
+    CircuitoAbiertoError,
+    llamada_protegida,
+    llamada_protegida_async,
+    respuesta_degradada,
+)
+from .LlamadosAPIS.Cliente_HTTP import (
+    ERRORES_HTTP,
+    INTEGRACION_SABRE,
+    post_async,
+    sesion_http,
+)
+from .LlamadosAPIS.Llamado_Api_TOKEN import (
+    SabreAuthError,
+    obtener_token_sabre,
+    obtener_token_sabre_async,
+)
 
 SABRE_SEATMAP_URL = (
     "https://api.cert.platform.sabre.com/v3/offers/getseats/byReservationPayload"
 )
+CACHE_NAMESPACE_SEATMAP = "seatmap"
 
 
 def _sandbox_activo():
@@ -47,19 +88,49 @@ def _sandbox_activo():
     return env.strip().lower() in ("1", "true", "yes", "on")
 
 
-def _gen_id(prefijo):
-    return f"{prefijo}-{uuid.uuid4()}"
+def _gen_id(prefijo, semilla=None):
+    # Con semilla el id es deterministico: dos peticiones identicas generan el
+    # mismo payload y pueden compartir la llamada a Sabre (single-flight).
+    if semilla is None:
+        return f"{prefijo}-{uuid.uuid4()}"
+    return f"{prefijo}-{uuid.uuid5(uuid.NAMESPACE_OID, f'{semilla}|{prefijo}')}"
 
 
-def _llamar_seatmap(payload, force_refresh=False):
-    token = obtener_token_sabre(force_refresh=force_refresh)
-    headers = {
+def _headers(token):
+    return {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
         "Conversation-ID": "corpodg-seatmap",
         "X-Sabre-PseudoCityCode": "DQ2J",
     }
-    return requests.post(SABRE_SEATMAP_URL, headers=headers, json=payload, timeout=30)
+
+
+def _llamar_seatmap(payload, force_refresh=False):
+    def _llamar():
+        token = obtener_token_sabre(force_refresh=force_refresh)
+        return llamada_protegida(ENDPOINT_SEATMAP, lambda timeout: sesion_http(INTEGRACION_SABRE).post(
+            SABRE_SEATMAP_URL, headers=_headers(token), json=payload, timeout=timeout,
+        ))
+
+    return llamada_unica(
+        CACHE_NAMESPACE_SEATMAP,
+        {"payload": payload, "force_refresh": force_refresh},
+        _llamar,
+    )
+
+
+async def _llamar_seatmap_async(payload, force_refresh=False):
+    async def _llamar():
+        token = await obtener_token_sabre_async(force_refresh=force_refresh)
+        return await llamada_protegida_async(ENDPOINT_SEATMAP, lambda timeout: post_async(
+            INTEGRACION_SABRE, SABRE_SEATMAP_URL, headers=_headers(token), json=payload, timeout=timeout,
+        ))
+
+    return await llamada_unica_async(
+        CACHE_NAMESPACE_SEATMAP,
+        {"payload": payload, "force_refresh": force_refresh},
+        _llamar,
+    )
 
 
 def _normalizar_segmento(seg):
@@ -123,10 +194,13 @@ def _construir_payload(opcion, pasajeros, moneda="USD"):
     if not fare_info:
         raise ValueError("opcion sin fare_info; reejecuta la busqueda con la version nueva")
 
-    # IDs
-    seg_ids = [_gen_id("SEG") for _ in segmentos]
-    pax_ids = [_gen_id("PAX") for _ in pasajeros]
-    fc_ids = [_gen_id("FC") for _ in fare_info]
+    # IDs (derivados del contenido de la peticion)
+    semilla = construir_clave(
+        CACHE_NAMESPACE_SEATMAP, [segmentos, pasajeros, fare_info, moneda]
+    )
+    seg_ids = [_gen_id("SEG", f"{semilla}:{i}") for i in range(len(segmentos))]
+    pax_ids = [_gen_id("PAX", f"{semilla}:{i}") for i in range(len(pasajeros))]
+    fc_ids = [_gen_id("FC", f"{semilla}:{i}") for i in range(len(fare_info))]
 
     # Mapear cada segmento a su fareComponent por rango begin->end (igual que searchFlights)
     seg_to_fc = []
@@ -300,7 +374,8 @@ def _normalizar_respuesta(raw, seg_ids):
     }
 
 
-def obtener_mapa_asientos(datos):
+def _preparar(datos):
+    """Devuelve ``(payload, seg_ids, moneda, None)`` o ``(..., error)``."""
     opcion = datos.get("opcion") or {}
     pasajeros = datos.get("pasajeros") or [{"passengerType": "ADT",
                                             "givenName": "TEST",
@@ -308,60 +383,214 @@ def obtener_mapa_asientos(datos):
     moneda = datos.get("moneda") or opcion.get("moneda") or "USD"
 
     if not opcion.get("tramos"):
-        return {"error": "Debe enviar 'opcion' con sus 'tramos'", "code": 400}
+        return None, None, moneda, {"error": "Debe enviar 'opcion' con sus 'tramos'", "code": 400}
 
     try:
         payload, seg_ids, _ = _construir_payload(opcion, pasajeros, moneda)
     except (KeyError, TypeError, ValueError) as e:
-        return {"error": f"Datos incompletos: {e}", "code": 400}
+        return None, None, moneda, {"error": f"Datos incompletos: {e}", "code": 400}
+    return payload, seg_ids, moneda, None
 
-    if _sandbox_activo() or datos.get("sandbox") is True:
-        raw = _simular_respuesta_sabre(payload, seg_ids, moneda)
-        normalizado = _normalizar_respuesta(raw, seg_ids)
-        normalizado["sandbox"] = True
-        normalizado["warnings"] = []
-        return normalizado
 
+def _respuesta_sandbox(payload, seg_ids, moneda):
+    raw = _simular_respuesta_sabre(payload, seg_ids, moneda)
+    normalizado = _normalizar_respuesta(raw, seg_ids)
+    normalizado["sandbox"] = True
+    normalizado["warnings"] = []
+    return normalizado
+
+
+def _interpretar_respuesta(response, seg_ids):
+    try:
+        raw = response.json()
+    except ValueError:
+        return {"error": "Respuesta de Sabre no es JSON",
+                "code": response.status_code,
+                "raw": response.text[:500]}
+
+    if response.status_code != 200:
+        return {"error": "Sabre rechazo la peticion",
+                "code": response.status_code,
+                "detalle": raw}
+
+    errores = raw.get("errors") or []
+    # Solo errores criticos (no warnings)
+    criticos = [e for e in errores if (e.get("category") or "").upper() in
+                ("BAD_REQUEST", "SERVER_ERROR", "UNAUTHORIZED",
+                 "VALIDATION", "NOT_FOUND")]
+    if criticos and not (raw.get("response") or {}).get("seatMaps"):
+        return {"error": "Sabre no pudo generar el mapa",
+                "code": 422,
+                "detalle": criticos}
+
+    normalizado = _normalizar_respuesta(raw, seg_ids)
+    if not normalizado["mapas"]:
+        return {"error": "La aerolinea no expone mapa de asientos para este vuelo",
+                "code": 404,
+                "warnings": raw.get("warnings") or []}
+
+    normalizado["warnings"] = raw.get("warnings") or []
+    return normalizado
+
+
+def _consultar_seatmap(payload, seg_ids):
     try:
         response = _llamar_seatmap(payload)
         if response.status_code == 401:
             response = _llamar_seatmap(payload, force_refresh=True)
+        return _interpretar_respuesta(response, seg_ids)
 
-        try:
-            raw = response.json()
-        except ValueError:
-            return {"error": "Respuesta de Sabre no es JSON",
-                    "code": response.status_code,
-                    "raw": response.text[:500]}
-
-        if response.status_code != 200:
-            return {"error": "Sabre rechazo la peticion",
-                    "code": response.status_code,
-                    "detalle": raw}
-
-        errores = raw.get("errors") or []
-        # Solo errores criticos (no warnings)
-        criticos = [e for e in errores if (e.get("category") or "").upper() in
-                    ("BAD_REQUEST", "SERVER_ERROR", "UNAUTHORIZED",
-                     "VALIDATION", "NOT_FOUND")]
-        if criticos and not (raw.get("response") or {}).get("seatMaps"):
-            return {"error": "Sabre no pudo generar el mapa",
-                    "code": 422,
-                    "detalle": criticos}
-
-        normalizado = _normalizar_respuesta(raw, seg_ids)
-        if not normalizado["mapas"]:
-            return {"error": "La aerolinea no expone mapa de asientos para este vuelo",
-                    "code": 404,
-                    "warnings": raw.get("warnings") or []}
-
-        normalizado["warnings"] = raw.get("warnings") or []
-        return normalizado
-
+    except CircuitoAbiertoError as e:
+        return respuesta_degradada(e)
     except (requests.RequestException, SabreAuthError) as e:
         return {"error": str(e), "code": 500}
 
 
+async def _consultar_seatmap_async(payload, seg_ids):
+    try:
+        response = await _llamar_seatmap_async(payload)
+        if response.status_code == 401:
+            response = await _llamar_seatmap_async(payload, force_refresh=True)
+        return _interpretar_respuesta(response, seg_ids)
+
+    except CircuitoAbiertoError as e:
+        return respuesta_degradada(e)
+    except (*ERRORES_HTTP, SabreAuthError) as e:
+        return {"error": str(e), "code": 500}
+
+
+# ---------------------------------------------------------------------------
+# CACHE Y VERSIONES (deltas de disponibilidad/precio)
+# ---------------------------------------------------------------------------
+
+def _clave_mapa(payload, moneda, sandbox):
+    """Clave de cache: identidad de cada vuelo + cabina, sin ids ni nombres."""
+    vuelos = [
+        [s["bookingAirlineCode"], s["bookingFlightNumber"], s["departureAirportCode"],
+         s["arrivalAirportCode"], s["departureDate"], s["cabinCode"]]
+        for s in payload["segments"]
+    ]
+    tipos = sorted(p["passengerType"] for p in payload["passengers"])
+    return construir_clave(CACHE_NAMESPACE_SEATMAP,
+                           {"vuelos": vuelos, "pasajeros": tipos, "moneda": moneda,
+                            "sandbox": sandbox})
+
+
+def _clave_version(version):
+    return construir_clave(f"{CACHE_NAMESPACE_SEATMAP}:version", version)
+
+
+def _iterar_asientos(normalizado):
+    """``(clave, segmento_indice, asiento)`` de cada asiento del mapa."""
+    for mapa in normalizado.get("mapas") or []:
+        for cabina in mapa["cabinas"]:
+            for fila in cabina["filas"]:
+                for asiento in fila["asientos"]:
+                    yield f"{mapa['segmento_indice']}:{asiento['id']}", mapa["segmento_indice"], asiento
+
+
+def _estado_asiento(asiento):
+    return [asiento["disponible"], asiento["estado"], (asiento["precio"] or {}).get("monto")]
+
+
+def _estado_asientos(normalizado):
+    """``{"<segmento>:<asiento>": [disponible, estado, precio]}`` de un mapa."""
+    return {clave: _estado_asiento(asiento) for clave, _, asiento in _iterar_asientos(normalizado)}
+
+
+def _versionar(normalizado):
+    """Agrega ``version`` al mapa y guarda su estado para calcular deltas."""
+    if "error" in normalizado:
+        return normalizado
+    estado = _estado_asientos(normalizado)
+    raw = json.dumps(estado, sort_keys=True, separators=(",", ":"))
+    normalizado["version"] = hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+    guardar_en_cache(_clave_version(normalizado["version"]), estado,
+                     _setting_int("SEATMAP_VERSION_TTL", 900))
+    return normalizado
+
+
+def _es_mapa_cacheable(resultado):
+    return "error" not in resultado
+
+
+def _delta(normalizado, desde_version):
+    """Solo los asientos que cambiaron desde ``desde_version`` (o None si no se conoce)."""
+    anterior = leer_entrada(_clave_version(desde_version)) if desde_version else None
+    if anterior is None or "error" in normalizado:
+        return None
+
+    cambios = []
+    if desde_version != normalizado["version"]:
+        cambios = [
+            {"segmento_indice": segmento, **asiento}
+            for clave, segmento, asiento in _iterar_asientos(normalizado)
+            if anterior.get(clave) != _estado_asiento(asiento)
+        ]
+    return {
+        "delta": True,
+        "version": normalizado["version"],
+        "desde_version": desde_version,
+        "offer_id": normalizado.get("offer_id"),
+        "expira": normalizado.get("expira"),
+        "cambios": cambios,
+    }
+
+
+def _responder(normalizado, datos):
+    delta = _delta(normalizado, datos.get("desde_version"))
+    if delta is not None:
+        return delta
+    return {**normalizado, "delta": False} if "error" not in normalizado else normalizado
+
+
+def obtener_mapa_asientos(datos):
+    payload, seg_ids, moneda, error = _preparar(datos)
+    if error:
+        return error
+
+    sandbox = _sandbox_activo() or datos.get("sandbox") is True
+    if sandbox:
+        def calcular():
+            return _versionar(_respuesta_sandbox(payload, seg_ids, moneda))
+    else:
+        def calcular():
+            return _versionar(_consultar_seatmap(payload, seg_ids))
+
+    normalizado, _estado = obtener_con_cache(
+        CACHE_NAMESPACE_SEATMAP, _clave_mapa(payload, moneda, sandbox), calcular,
+        ttl=_setting_int("SEATMAP_CACHE_TTL", 60), cacheable=_es_mapa_cacheable,
+    )
+    return _responder(normalizado, datos)
+
+
+async def obtener_mapa_asientos_async(datos):
+    """Variante no bloqueante (ASGI) de ``obtener_mapa_asientos``."""
+    payload, seg_ids, moneda, error = _preparar(datos)
+    if error:
+        return error
+
+    sandbox = _sandbox_activo() or datos.get("sandbox") is True
+    if sandbox:
+        async def calcular():
+            return _versionar(_respuesta_sandbox(payload, seg_ids, moneda))
+
+        def refrescar():
+            return _versionar(_respuesta_sandbox(payload, seg_ids, moneda))
+    else:
+        async def calcular():
+            return _versionar(await _consultar_seatmap_async(payload, seg_ids))
+
+        def refrescar():
+            return _versionar(_consultar_seatmap(payload, seg_ids))
+
+    normalizado, _estado = await obtener_con_cache_async(
+        CACHE_NAMESPACE_SEATMAP, _clave_mapa(payload, moneda, sandbox), calcular, refrescar,
+        ttl=_setting_int("SEATMAP_CACHE_TTL", 60), cacheable=_es_mapa_cacheable,
+    )
+    return _responder(normalizado, datos)
+
+
 # ---------------------------------------------------------------------------
 # SANDBOX: respuesta simulada con la misma estructura que Sabre Get Seats v3
 # ---------------------------------------------------------------------------
@@ -456,8 +685,12 @@ _CABIN_LAYOUTS = {
 
 
 def _seed_para_segmento(seg):
-    """(No usado; mantenido por compatibilidad). Antes daba semilla estable."""
-    return 0
+    """Semilla estable del segmento: mismo vuelo, fecha y cabina -> misma ocupacion."""
+    identidad = "|".join(str(seg.get(k) or "") for k in (
+        "bookingAirlineCode", "bookingFlightNumber", "departureAirportCode",
+        "arrivalAirportCode", "departureDate", "cabinCode",
+    ))
+    return int.from_bytes(hashlib.sha256(identidad.encode("utf-8")).digest()[:8], "big")
 
 
 def _columna_es_ventana(col_id, columnas):
@@ -502,9 +735,70 @@ def _calc_precio(base, fila, col_id, columnas, exit_rows, bulkhead_row, currency
     return round(monto, 2)
 
 
+# Umbral sobre un byte pseudoaleatorio: 56/256 ~ 22% de asientos ocupados.
+_UMBRAL_OCUPADO = 56
+
+
+def _codigo_layout(cabin_code):
+    """Codigo de ``_CABIN_LAYOUTS`` para ``cabin_code`` (los desconocidos usan 'Y')."""
+    codigo = (cabin_code or "Y").upper()
+    return codigo if codigo in _CABIN_LAYOUTS else "Y"
+
+
+@functools.cache
+def _plantilla_cabina(codigo_layout):
+    """Filas precalculadas de un layout: todo lo que no depende del segmento.
+
+    ``(layout, filas)`` con ``filas`` = ``[(fila, row_chars,
+    [(col_id, chars, monto, svc_ref), ...]), ...]``. Se arma una sola vez
+    por layout y se comparte entre llamadas (solo lectura). Recibe el codigo
+    ya resuelto con ``_codigo_layout``: la cache queda acotada a los layouts
+    conocidos aunque el cliente envie cualquier ``cabinCode``.
+    """
+    layout = _CABIN_LAYOUTS[codigo_layout]
+    columnas = layout["columns"]
+    first_row, last_row = layout["first_row"], layout["last_row"]
+    exit_rows = {first_row + 6, last_row - 4} if (last_row - first_row) > 8 else set()
+    bulkhead_row = first_row
+
+    filas = []
+    for fila in range(first_row, last_row + 1):
+        asientos = []
+        for col in columnas:
+            col_id = col["id"]
+            monto = _calc_precio(layout["base_price"], fila, col_id, columnas,
+                                 exit_rows, bulkhead_row, None)
+            if fila in exit_rows or fila == bulkhead_row:
+                svc_ref = "SVC-SEAT-LEG"
+            elif monto is not None and monto >= 8:
+                svc_ref = "SVC-SEAT-PREF"
+            else:
+                svc_ref = "SVC-SEAT-STD"
+            asientos.append((
+                col_id,
+                _caracteristicas_asiento(col_id, fila, columnas, exit_rows, bulkhead_row),
+                monto,
+                svc_ref,
+            ))
+        row_chars = []
+        if fila in exit_rows:
+            row_chars.append(_CHAR_EXIT)
+        if fila == bulkhead_row:
+            row_chars.append(_CHAR_BULKHEAD)
+        filas.append((fila, row_chars, asientos))
+    return layout, filas
+
+
+def _ocupacion(seg, n_asientos):
+    """Un byte pseudoaleatorio por asiento, derivado de la semilla del segmento."""
+    semilla = _seed_para_segmento(seg).to_bytes(8, "big")
+    return hashlib.shake_256(semilla).digest(n_asientos)
+
+
 def _simular_respuesta_sabre(payload, seg_ids, currency):
-    rnd_global = random.Random()
-    offer_id = f"SIM-{rnd_global.randint(10**11, 10**12 - 1)}"
+    """Respuesta Get Seats simulada, estable para el mismo vuelo/fecha/cabina."""
+    semillas = [_seed_para_segmento(seg) for seg in payload["segments"]]
+    offer_id = f"SIM-{hash(tuple(semillas)) % 10**12:012d}"
     expira = (_dt.datetime.utcnow() + _dt.timedelta(hours=2)) \
         .strftime("%Y-%m-%dT%H:%M:%SZ")
 
@@ -528,47 +822,21 @@ def _simular_respuesta_sabre(payload, seg_ids, currency):
 
     for seg in payload["segments"]:
         seg_id = seg["id"]
-        rnd = random.Random()  # aleatorio en cada consulta
-        cabin_code = (seg.get("cabinCode") or "Y").upper()
-        layout = _CABIN_LAYOUTS.get(cabin_code) or _CABIN_LAYOUTS["Y"]
-
-        columnas = layout["columns"]
-        first_row = layout["first_row"]
-        last_row = layout["last_row"]
-        base_price = layout["base_price"]
-
-        # Filas de emergencia y bulkhead aleatorias pero estables
-        exit_rows = {first_row + 6, last_row - 4} if (last_row - first_row) > 8 else set()
-        bulkhead_row = first_row
+        layout, filas = _plantilla_cabina(_codigo_layout(seg.get("cabinCode")))
+        ocupacion = _ocupacion(seg, len(filas) * len(layout["columns"]))
 
         seat_rows = []
-        for fila in range(first_row, last_row + 1):
+        indice = 0
+        for fila, row_chars, asientos in filas:
             seats = []
-            for col in columnas:
-                col_id = col["id"]
-                # 22% ocupados aprox, deterministico por fila/col
-                ocupado = rnd.random() < 0.22
-                status = "T" if ocupado else "F"  # T=Taken, F=Free
-
-                chars = _caracteristicas_asiento(
-                    col_id, fila, columnas, exit_rows, bulkhead_row
-                )
-
-                monto = _calc_precio(
-                    base_price, fila, col_id, columnas,
-                    exit_rows, bulkhead_row, currency
-                )
+            for col_id, chars, monto, svc_ref in asientos:
+                ocupado = ocupacion[indice] < _UMBRAL_OCUPADO
+                indice += 1
 
                 offer_refs = []
                 if monto is not None and not ocupado:
                     pdef_id = f"PDEF-{seg_id[-6:]}-{fila}{col_id}"
                     oitem_id = f"OITEM-{seg_id[-6:]}-{fila}{col_id}"
-                    if fila in exit_rows or fila == bulkhead_row:
-                        svc_ref = "SVC-SEAT-LEG"
-                    elif monto >= 8:
-                        svc_ref = "SVC-SEAT-PREF"
-                    else:
-                        svc_ref = "SVC-SEAT-STD"
                     price_definitions.append({
                         "id": pdef_id,
                         "totalPrice": {"amount": monto},
@@ -584,18 +852,12 @@ def _simular_respuesta_sabre(payload, seg_ids, currency):
 
                 seats.append({
                     "column": col_id,
-                    "occupationStatusCode": status,
+                    "occupationStatusCode": "T" if ocupado else "F",  # T=Taken, F=Free
                     "isOperative": True,
                     "characteristics": chars,
                     "offerItemRefIds": offer_refs,
                 })
 
-            row_chars = []
-            if fila in exit_rows:
-                row_chars.append(_CHAR_EXIT)
-            if fila == bulkhead_row:
-                row_chars.append(_CHAR_BULKHEAD)
-
             seat_rows.append({
                 "row": fila,
                 "characteristics": row_chars,
@@ -607,9 +869,9 @@ def _simular_respuesta_sabre(payload, seg_ids, currency):
             "cabinCompartments": [{
                 "cabinCode": layout["cabinCode"],
                 "cabinName": layout["cabinName"],
-                "firstRow": first_row,
-                "lastRow": last_row,
-                "cabinLayout": {"columns": columnas},
+                "firstRow": layout["first_row"],
+                "lastRow": layout["last_row"],
+                "cabinLayout": {"columns": layout["columns"]},
                 "seatRows": seat_rows,
             }],
         })
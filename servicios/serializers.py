@@ -3,6 +3,16 @@ from .models import Cliente, Solicitud, Destino, Vuelo, Region, PaisRegion, Ciud
 from .notifications import enviar_whatsapp_contacto, enviar_correo_contacto
 
 
+def _conteo(obj, anotacion, consulta):
+    """Conteo anotado por el ViewSet (``anotacion``) o, si no viene, un COUNT.
+
+    Los listados anotan los conteos en su queryset (una sola consulta); el
+    COUNT por objeto queda solo para usos sueltos (detalle, acciones).
+    """
+    valor = getattr(obj, anotacion, None)
+    return consulta().count() if valor is None else valor
+
+
 class SolicitudSerializer(serializers.ModelSerializer):
     class Meta:
         model = Solicitud
@@ -152,7 +162,7 @@ class PaisRegionSerializer(serializers.ModelSerializer):
         fields = ['id', 'nombre', 'nombre_en', 'codigo_iso', 'codigo_iso3', 'capital', 'bandera_png', 'bandera_svg', 'bandera_url', 'region', 'region_nombre', 'ciudades', 'cantidad_ciudades', 'activo']
     
     def get_cantidad_ciudades(self, obj):
-        return obj.ciudades.filter(activo=True).count()
+        return _conteo(obj, 'cantidad_ciudades', lambda: obj.ciudades.filter(activo=True))
 
 
 class PaisRegionListSerializer(serializers.ModelSerializer):
@@ -166,7 +176,7 @@ class PaisRegionListSerializer(serializers.ModelSerializer):
         fields = ['id', 'nombre', 'nombre_en', 'codigo_iso', 'capital', 'bandera_url', 'region', 'region_nombre', 'cantidad_ciudades', 'activo']
     
     def get_cantidad_ciudades(self, obj):
-        return obj.ciudades.filter(activo=True).count()
+        return _conteo(obj, 'cantidad_ciudades', lambda: obj.ciudades.filter(activo=True))
 
 
 class RegionSerializer(serializers.ModelSerializer):
@@ -180,7 +190,7 @@ class RegionSerializer(serializers.ModelSerializer):
         fields = ['id', 'nombre', 'nombre_display', 'descripcion', 'imagen_url', 'activo', 'orden', 'paises', 'cantidad_paquetes']
     
     def get_cantidad_paquetes(self, obj):
-        return obj.paquetes.filter(activo=True).count()
+        return _conteo(obj, 'cantidad_paquetes', obj.paquetes.vigentes)
 
 
 class RegionListSerializer(serializers.ModelSerializer):
@@ -194,10 +204,10 @@ class RegionListSerializer(serializers.ModelSerializer):
         fields = ['id', 'nombre', 'nombre_display', 'imagen_url', 'activo', 'orden', 'cantidad_paises', 'cantidad_paquetes']
     
     def get_cantidad_paises(self, obj):
-        return obj.paises.filter(activo=True).count()
+        return _conteo(obj, 'cantidad_paises', lambda: obj.paises.filter(activo=True))
     
     def get_cantidad_paquetes(self, obj):
-        return obj.paquetes.filter(activo=True).count()
+        return _conteo(obj, 'cantidad_paquetes', obj.paquetes.vigentes)
 
 
 class AerolineaSerializer(serializers.ModelSerializer):
@@ -214,7 +224,7 @@ class AerolineaSerializer(serializers.ModelSerializer):
         ]
     
     def get_cantidad_vuelos(self, obj):
-        return obj.vuelos.count()
+        return _conteo(obj, 'cantidad_vuelos', obj.vuelos.all)
 
 
 class AeropuertoSerializer(serializers.ModelSerializer):
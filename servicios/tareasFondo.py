@@ -0,0 +1,163 @@
+"""Cola de tareas en segundo plano respaldada por la BD (``TareaFondo``).
+
+Antes el voucher por correo (PDF + SMTP) y el aviso de nueva reserva se
+lanzaban en ``threading.Thread`` sueltos: sin limite, se perdian si el
+worker moria y nunca se reintentaban. Ahora la peticion solo encola y
+responde; el worker ``python manage.py procesar_tareas`` (proceso
+``worker`` del Procfile) las ejecuta:
+
+  * ``encolar`` es idempotente por ``clave`` (una tarea por reserva y tipo).
+  * Cada tarea se toma con un UPDATE condicional (estado + intentos), asi
+    dos workers nunca ejecutan la misma; la toma dura ``TAREAS_LEASE_SECONDS``
+    y si el worker muere antes de terminar, otro la retoma al vencer (si era
+    el ultimo intento queda FALLIDA: una tarea que mata al worker no se
+    reintenta para siempre). Solo quien tiene la toma vigente registra el
+    resultado.
+  * Concurrencia acotada: ``TAREAS_WORKERS`` hilos por lote de ``TAREAS_LOTE``.
+  * Si el manejador lanza una excepcion se reintenta con backoff exponencial
+    (``TAREAS_BACKOFF_BASE`` * 2^(intento-1), maximo ``TAREAS_BACKOFF_MAX``)
+    hasta ``max_intentos``; despues queda FALLIDA (visible en el admin, desde
+    donde se puede reintentar).
+
+Los manejadores se registran en ``TAREAS`` por ruta (se importan al
+ejecutar, asi este modulo no depende de los flujos de reserva).
+"""
+
+import datetime as _dt
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .cacheSabre import _setting_int
+
+logger = logging.getLogger(__name__)
+
+TAREA_VOUCHER_VUELO = "voucher_vuelo"
+TAREA_VOUCHER_PAQUETE = "voucher_paquete"
+TAREA_NOTIFICAR_RESERVA = "notificar_reserva"
+
+# tipo -> manejador (se llama con ``**payload``)
+TAREAS = {
+    TAREA_VOUCHER_VUELO: "servicios.bookingFlight.tarea_voucher",
+    TAREA_VOUCHER_PAQUETE: "servicios.bookingPaquete.tarea_voucher",
+    TAREA_NOTIFICAR_RESERVA: "servicios.notifications.tarea_notificar_nueva_reserva",
+}
+
+PENDIENTE = "PENDIENTE"
+EN_PROCESO = "EN_PROCESO"
+COMPLETADA = "COMPLETADA"
+FALLIDA = "FALLIDA"
+
+
+def _ahora():
+    from django.utils import timezone
+
+    return timezone.now()
+
+
+def encolar(tipo, payload, clave, max_intentos=None):
+    """Encola ``tipo`` con ``payload``; si ya existe una tarea con ``clave`` la devuelve."""
+    from .models import TareaFondo
+
+    tarea, _ = TareaFondo.objects.get_or_create(
+        clave=clave,
+        defaults={
+            "tipo": tipo,
+            "payload": payload,
+            "max_intentos": max_intentos or _setting_int("TAREAS_MAX_INTENTOS", 5),
+        },
+    )
+    return tarea
+
+
+def espera_reintento(intento):
+    """Segundos antes del reintento numero ``intento`` (1, 2, ...)."""
+    base = _setting_int("TAREAS_BACKOFF_BASE", 30)
+    return min(base * 2 ** max(intento - 1, 0), _setting_int("TAREAS_BACKOFF_MAX", 3600))
+
+
+def tomar_tareas(limite):
+    """Marca EN_PROCESO hasta ``limite`` tareas listas y las devuelve."""
+    from django.db.models import Q
+
+    from .models import TareaFondo
+
+    ahora = _ahora()
+    hasta = ahora + _dt.timedelta(seconds=_setting_int("TAREAS_LEASE_SECONDS", 300))
+    candidatas = (TareaFondo.objects
+                  .filter(Q(estado=PENDIENTE, disponible_en__lte=ahora)
+                          | Q(estado=EN_PROCESO, bloqueada_hasta__lte=ahora))
+                  .order_by("disponible_en")
+                  .values_list("id", "estado", "intentos", "max_intentos")[:limite])
+    tomadas = []
+    for id_, estado, intentos, max_intentos in candidatas:
+        # Si otro worker la tomo antes, estado/intentos ya cambiaron y no actualiza nada
+        libre = TareaFondo.objects.filter(id=id_, estado=estado, intentos=intentos)
+        if estado == EN_PROCESO and intentos >= max_intentos:
+            if libre.update(estado=FALLIDA, bloqueada_hasta=None,
+                            ultimo_error="El worker no termino el ultimo intento"):
+                logger.error("Tarea %s agoto sus intentos sin terminar (toma vencida)", id_)
+            continue
+        if libre.update(estado=EN_PROCESO, intentos=intentos + 1, bloqueada_hasta=hasta):
+            tomadas.append(id_)
+    return list(TareaFondo.objects.filter(id__in=tomadas).order_by("disponible_en"))
+
+
+def ejecutar(tarea):
+    """Ejecuta una tarea ya tomada y registra el resultado. True si termino bien."""
+    from django.utils.module_loading import import_string
+
+    from .models import TareaFondo
+
+    # Si la toma vencio y otro worker la retomo, intentos ya cambio: este resultado no cuenta
+    propia = TareaFondo.objects.filter(id=tarea.id, estado=EN_PROCESO, intentos=tarea.intentos)
+    try:
+        manejador = import_string(TAREAS[tarea.tipo])
+        manejador(**tarea.payload)
+    except Exception as e:
+        logger.exception("Tarea %s (%s) fallo en el intento %s", tarea.clave, tarea.tipo, tarea.intentos)
+        if tarea.intentos >= tarea.max_intentos:
+            cambios = {"estado": FALLIDA}
+        else:
+            cambios = {"estado": PENDIENTE, "disponible_en": _ahora()
+                       + _dt.timedelta(seconds=espera_reintento(tarea.intentos))}
+        if not propia.update(bloqueada_hasta=None, ultimo_error=f"{type(e).__name__}: {e}"[:2000],
+                             **cambios):
+            logger.warning("Tarea %s: la toma vencio, se descarta el resultado", tarea.clave)
+        return False
+    if not propia.update(estado=COMPLETADA, bloqueada_hasta=None, ultimo_error=""):
+        logger.warning("Tarea %s: la toma vencio, se descarta el resultado", tarea.clave)
+    return True
+
+
+def _ejecutar_en_hilo(tarea):
+    from django.db import connection
+
+    try:
+        return ejecutar(tarea)
+    finally:
+        connection.close()  # cada hilo abre su propia conexion
+
+
+def procesar_pendientes(limite=None, workers=None):
+    """Toma un lote de tareas listas y lo ejecuta con concurrencia acotada."""
+    limite = limite or _setting_int("TAREAS_LOTE", 10)
+    workers = workers or _setting_int("TAREAS_WORKERS", 2)
+    tareas = tomar_tareas(limite)
+    if workers <= 1 or len(tareas) <= 1:
+        resultados = [ejecutar(t) for t in tareas]
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(tareas))) as pool:
+            resultados = list(pool.map(_ejecutar_en_hilo, tareas))
+    return {"procesadas": len(resultados), "completadas": sum(resultados),
+            "fallidas": len(resultados) - sum(resultados)}
+
+
+def purgar_completadas(dias=None):
+    """Borra las tareas COMPLETADA con mas de ``dias`` (``TAREAS_RETENCION_DIAS``)."""
+    from .models import TareaFondo
+
+    dias = _setting_int("TAREAS_RETENCION_DIAS", 7) if dias is None else dias
+    borradas, _ = TareaFondo.objects.filter(
+        estado=COMPLETADA, fecha_actualizacion__lt=_ahora() - _dt.timedelta(days=dias),
+    ).delete()
+    return borradas
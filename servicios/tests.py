@@ -1,29 +1,63 @@
-from django.test import TestCase, override_settings
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from decimal import Decimal
 from datetime import timedelta
+import asyncio
+import json
+import threading
+import time
+
+import requests
 
 from .models import (
     Destino, Vuelo, Region, PaisRegion, Ciudad, Aerolinea, Aeropuerto,
     PaqueteTuristico, ConfiguracionDestacados, TipoPaquete, Temporada, validate_google_drive_pdf,
-    validate_openstreetmap_url, normalize_google_drive_url,
+    validate_openstreetmap_url, normalize_google_drive_url, IntentoReserva, ReservaVuelo, TareaFondo,
+    Cliente, Solicitud, VersionCatalogo,
 )
 from .searchFlights import (
     _construir_ids_fuente, formatear_duracion, procesar_respuesta,
-    buscar_vuelos_sabre,
+    buscar_vuelos_sabre, buscar_vuelos_sabre_con_estado, _normalizar_parametros, iterar_itinerarios,
+    CACHE_NAMESPACE_BUSQUEDA,
+)
+from .cacheSabre import (
+    RespuestaCompartida, construir_clave, llamada_unica, llamada_unica_async, obtener_metricas,
 )
 from .revalidateFlight import (
     _normalizar_segmento as reval_normalizar_segmento,
     _construir_payload as reval_construir_payload,
-    revalidar_itinerario,
+    huella_itinerario, revalidar_itinerario, revalidar_itinerario_con_estado, revalidar_lote,
 )
 from .seatMapFlight import (
     _sandbox_activo, _normalizar_segmento as seat_normalizar_segmento,
     _construir_payload as seat_construir_payload,
     obtener_mapa_asientos,
+    _plantilla_cabina as seatmap_plantilla,
+    _simular_respuesta_sabre as seatmap_simular,
+)
+from .circuitoSabre import (
+    ENDPOINT_BUSQUEDA, CircuitoAbiertoError, circuito, llamada_protegida, llamada_protegida_async,
+    reiniciar_circuitos,
 )
+from .seatMapCompacto import compactar_mapa, expandir_mapa
+from .intentosReserva import (
+    TIPO_PAQUETE, TIPO_VUELO, _tomar_confirmacion, confirmar_una_vez, guardar_intent,
+    recuperar_intent,
+)
+from .bookingFlight import _guardar_reserva as guardar_reserva_vuelo, confirmar_reserva, obtener_reserva_guardada
+from .tareasFondo import TAREAS, ejecutar, encolar, espera_reintento, procesar_pendientes, tomar_tareas
+from .notifications import notificar_nueva_reserva_async
+from .columnasVuelos import columnas_de, filtrar, ordenar_indices, ranking
+from .fareCalendar import generar_combinaciones
+from .LlamadosAPIS.Cliente_HTTP import cerrar_sesiones_http, sesion_http, timeout_http
+from .LlamadosAPIS import Llamado_Api_TOKEN as token_mod
+from .LlamadosAPIS.Llamado_Api_TOKEN import limpiar_cache_token_sabre, obtener_token_sabre
 from .chatbot import _build_accion, ejecutar_tool, procesar_mensaje
 
 
@@ -336,6 +370,9 @@ class ProcesarRespuestaSortTest(TestCase):
 
 
 class BuscarVuelosSabre401RetryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
     @patch("servicios.searchFlights._buscar_en_sabre")
     def test_401_retry_con_force_refresh(self, mock_buscar):
         mock_unauthorized = MagicMock()
@@ -396,6 +433,701 @@ class BuscarVuelosSabre401RetryTest(TestCase):
         self.assertEqual(result["code"], 401)
 
 
+def _respuesta_sabre_vacia():
+    mock_ok = MagicMock()
+    mock_ok.status_code = 200
+    mock_ok.json.return_value = {
+        "groupedItineraryResponse": {
+            "itineraryGroups": [{
+                "groupDescription": {"legDescriptions": []},
+                "itineraries": []
+            }],
+            "statistics": {"itineraryCount": 0}
+        }
+    }
+    return mock_ok
+
+
+class BuscarVuelosCacheTest(TestCase):
+    DATOS = {"origin": "UIO", "destination": "MIA", "date": "2026-09-15", "adults": 1}  # noqa: RUF012
+
+    def setUp(self):
+        cache.clear()
+
+    @patch("servicios.searchFlights._buscar_en_sabre")
+    def test_misma_busqueda_normalizada_usa_cache(self, mock_buscar):
+        mock_buscar.return_value = _respuesta_sabre_vacia()
+
+        _, estado1 = buscar_vuelos_sabre_con_estado(self.DATOS)
+        _, estado2 = buscar_vuelos_sabre_con_estado(
+            {"origin": " uio", "destination": "mia", "date": "2026-09-15", "adults": "1"}
+        )
+
+        self.assertEqual((estado1, estado2), ("miss", "hit"))
+        self.assertEqual(mock_buscar.call_count, 1)
+        metricas = obtener_metricas(CACHE_NAMESPACE_BUSQUEDA)
+        self.assertEqual(metricas["hit"], 1)
+        self.assertEqual(metricas["miss"], 1)
+
+    @patch("servicios.searchFlights._buscar_en_sabre")
+    def test_errores_no_se_cachean(self, mock_buscar):
+        mock_err = MagicMock()
+        mock_err.status_code = 500
+        mock_err.json.return_value = {"error": "boom"}
+        mock_buscar.return_value = mock_err
+
+        buscar_vuelos_sabre(self.DATOS)
+        buscar_vuelos_sabre(self.DATOS)
+        self.assertEqual(mock_buscar.call_count, 2)
+
+    @patch("servicios.cacheSabre._refrescar_en_fondo")
+    @patch("servicios.searchFlights._buscar_en_sabre")
+    def test_entrada_vieja_se_sirve_y_dispara_refresco(self, mock_buscar, mock_refresco):
+        clave = construir_clave(CACHE_NAMESPACE_BUSQUEDA, _normalizar_parametros(self.DATOS))
+        cache.set(clave, {"valor": [{"id": 7}], "fresco_hasta": 0}, 60)
+
+        resultado, estado = buscar_vuelos_sabre_con_estado(self.DATOS)
+
+        self.assertEqual(estado, "stale")
+        self.assertEqual(resultado, [{"id": 7}])
+        mock_buscar.assert_not_called()
+        mock_refresco.assert_called_once()
+
+    @override_settings(SABRE_SEARCH_CACHE_TTL=0)
+    @patch("servicios.searchFlights._buscar_en_sabre")
+    def test_ttl_cero_desactiva_cache(self, mock_buscar):
+        mock_buscar.return_value = _respuesta_sabre_vacia()
+        buscar_vuelos_sabre(self.DATOS)
+        buscar_vuelos_sabre(self.DATOS)
+        self.assertEqual(mock_buscar.call_count, 2)
+
+
+class LlamadaUnicaTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @patch("servicios.searchFlights.obtener_token_sabre", return_value="tok")
+    @patch("servicios.searchFlights.sesion_http")
+    def test_peticiones_identicas_concurrentes_comparten_llamada(self, mock_sesion, _tok):
+        from .searchFlights import _buscar_en_sabre
+
+        mock_post = mock_sesion.return_value.post
+
+        liberar = threading.Event()
+
+        def _lenta(*args, **kwargs):
+            liberar.wait(2)
+            return MagicMock(status_code=200, content=b'{"ok": true}')
+
+        mock_post.side_effect = _lenta
+        resultados = []
+        hilos = [
+            threading.Thread(target=lambda: resultados.append(_buscar_en_sabre({"q": 1})))
+            for _ in range(5)
+        ]
+        for h in hilos:
+            h.start()
+        # Dar tiempo a que todos se encolen detras del primero
+        time.sleep(0.2)
+        liberar.set()
+        for h in hilos:
+            h.join(3)
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(len(resultados), 5)
+        self.assertTrue(all(r.json() == {"ok": True} for r in resultados))
+
+    def test_otro_worker_en_vuelo_reutiliza_su_respuesta(self):
+        clave = construir_clave("busqueda:vuelo", {"q": 2})
+        cache.set(f"{clave}:lock", "vuelo-1", 30)
+        cache.set(f"{clave}:respuesta:vuelo-1", RespuestaCompartida(200, "[]"), 30)
+        llamar = MagicMock()
+
+        respuesta = llamada_unica("busqueda", {"q": 2}, llamar, espera=1)
+
+        llamar.assert_not_called()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(obtener_metricas("busqueda")["coalesced"], 1)
+
+    def test_respuesta_de_un_vuelo_terminado_no_se_reutiliza(self):
+        llamar = MagicMock(return_value=RespuestaCompartida(200, "[1]"))
+        llamada_unica("busqueda", {"q": 4}, llamar, espera=1)
+        llamar.return_value = RespuestaCompartida(200, "[2]")
+
+        respuesta = llamada_unica("busqueda", {"q": 4}, llamar, espera=1)
+
+        self.assertEqual(llamar.call_count, 2)
+        self.assertEqual(respuesta.json(), [2])
+
+    def test_respuesta_no_2xx_del_lider_no_se_comparte(self):
+        clave = construir_clave("busqueda:vuelo", {"q": 5})
+        llamar = MagicMock(return_value=RespuestaCompartida(401, "{}"))
+        with patch("servicios.cacheSabre.uuid.uuid4", return_value=MagicMock(hex="vuelo-5")):
+            self.assertEqual(llamada_unica("busqueda", {"q": 5}, llamar, espera=1).status_code, 401)
+        self.assertIsNone(cache.get(f"{clave}:respuesta:vuelo-5"))
+
+        # un seguidor cuyo lider termina sin publicar hace su propia llamada
+        cache.set(f"{clave}:lock", "vuelo-6", 30)
+        llamar.return_value = RespuestaCompartida(200, "[]")
+        threading.Timer(0.1, cache.delete, args=(f"{clave}:lock",)).start()
+        self.assertEqual(llamada_unica("busqueda", {"q": 5}, llamar, espera=2).status_code, 200)
+
+    def test_error_del_lider_no_deja_candado(self):
+        llamar = MagicMock(side_effect=RuntimeError("caido"))
+        with self.assertRaises(RuntimeError):
+            llamada_unica("busqueda", {"q": 3}, llamar, espera=1)
+        clave = construir_clave("busqueda:vuelo", {"q": 3})
+        self.assertIsNone(cache.get(f"{clave}:lock"))
+
+
+@override_settings(SABRE_TOKEN_BACKGROUND_REFRESH=False, SABRE_TOKEN_REFRESH_MARGIN=60)
+class TokenSabreCompartidoTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        limpiar_cache_token_sabre()
+        self.addCleanup(limpiar_cache_token_sabre)
+
+    @patch("servicios.LlamadosAPIS.Llamado_Api_TOKEN._solicitar_token_sabre")
+    def test_otro_worker_reutiliza_el_token_de_la_cache(self, mock_solicitar):
+        mock_solicitar.return_value = ("tok-1", 3600)
+        self.assertEqual(obtener_token_sabre(), "tok-1")
+
+        # Otro proceso: cache local vacia, misma cache compartida
+        with patch.dict(token_mod._TOKEN_CACHE, token_mod._TOKEN_VACIO):
+            self.assertEqual(obtener_token_sabre(), "tok-1")
+        self.assertEqual(mock_solicitar.call_count, 1)
+
+    @patch("servicios.LlamadosAPIS.Llamado_Api_TOKEN._solicitar_token_sabre")
+    def test_401_concurrentes_renuevan_una_sola_vez(self, mock_solicitar):
+        mock_solicitar.return_value = ("tok-viejo", 3600)
+        obtener_token_sabre()
+        cache.set(token_mod.CLAVE_TOKEN, dict(cache.get(token_mod.CLAVE_TOKEN), obtained_at=0))
+        token_mod._TOKEN_CACHE["obtained_at"] = 0
+
+        def _lenta():
+            time.sleep(0.1)
+            return ("tok-nuevo", 3600)
+
+        mock_solicitar.side_effect = _lenta
+        tokens = []
+        hilos = [threading.Thread(target=lambda: tokens.append(obtener_token_sabre(force_refresh=True)))
+                 for _ in range(5)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join(3)
+
+        self.assertEqual(tokens, ["tok-nuevo"] * 5)
+        self.assertEqual(mock_solicitar.call_count, 2)
+
+    @patch("servicios.LlamadosAPIS.Llamado_Api_TOKEN._solicitar_token_sabre")
+    def test_en_el_margen_sirve_el_token_y_renueva_en_fondo(self, mock_solicitar):
+        mock_solicitar.return_value = ("tok-1", 3600)
+        obtener_token_sabre()
+        token_mod._TOKEN_CACHE["refresh_at"] = time.time() - 1
+        cache.set(token_mod.CLAVE_TOKEN, dict(token_mod._TOKEN_CACHE))
+        mock_solicitar.return_value = ("tok-2", 3600)
+
+        self.assertEqual(obtener_token_sabre(), "tok-1")  # no espera a Sabre Auth
+        limite = time.time() + 2
+        while token_mod._TOKEN_CACHE["value"] != "tok-2" and time.time() < limite:
+            time.sleep(0.02)
+        self.assertEqual(obtener_token_sabre(), "tok-2")
+        self.assertEqual(cache.get(token_mod.CLAVE_TOKEN)["value"], "tok-2")
+
+    @patch("servicios.LlamadosAPIS.Llamado_Api_TOKEN._solicitar_token_sabre")
+    def test_espera_la_renovacion_de_otro_worker(self, mock_solicitar):
+        cache.add(token_mod.CLAVE_TOKEN_CANDADO, 1, 30)
+        entrada = {"value": "tok-ajeno", "obtained_at": time.time(),
+                   "refresh_at": time.time() + 600, "expires_at": time.time() + 3600}
+        threading.Timer(0.2, lambda: cache.set(token_mod.CLAVE_TOKEN, entrada)).start()
+
+        self.assertEqual(obtener_token_sabre(), "tok-ajeno")
+        mock_solicitar.assert_not_called()
+
+
+class ClienteHTTPTest(TestCase):
+    def tearDown(self):
+        cerrar_sesiones_http()
+
+    def test_sesion_se_reutiliza_por_integracion(self):
+        self.assertIs(sesion_http("sabre"), sesion_http("sabre"))
+        self.assertIsNot(sesion_http("sabre"), sesion_http("whatsapp"))
+
+    def test_reintentos_solo_en_metodos_idempotentes(self):
+        retry = sesion_http("sabre").get_adapter("https://api.cert.platform.sabre.com").max_retries
+        self.assertIn("GET", retry.allowed_methods)
+        self.assertNotIn("POST", retry.allowed_methods)
+
+    @override_settings(HTTP_TIMEOUTS={"sabre": [2, 12]})
+    def test_timeout_configurable_por_integracion(self):
+        self.assertEqual(timeout_http("sabre"), (2, 12))
+        self.assertEqual(timeout_http("whatsapp"), (5, 15))
+
+
+@override_settings(SABRE_CIRCUIT_MIN_CALLS=4, SABRE_CIRCUIT_ERROR_RATE=0.5,
+                   SABRE_CIRCUIT_OPEN_SECONDS=30, HTTP_TIMEOUTS={"sabre": (5, 30)})
+class CircuitoSabreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        reiniciar_circuitos()
+
+    def tearDown(self):
+        reiniciar_circuitos()
+
+    def _respuesta(self, status_code):
+        response = MagicMock()
+        response.status_code = status_code
+        return response
+
+    def _fallar(self, veces):
+        for _ in range(veces):
+            with self.assertRaises(requests.Timeout):
+                llamada_protegida(ENDPOINT_BUSQUEDA, MagicMock(side_effect=requests.Timeout()))
+
+    def _semiabierto(self):
+        self._fallar(4)
+        c = circuito(ENDPOINT_BUSQUEDA)
+        c.abierto_hasta = time.time() - 1
+        cache.clear()
+        return c
+
+    def test_se_abre_con_errores_y_falla_rapido(self):
+        llamada_protegida(ENDPOINT_BUSQUEDA, lambda _t: self._respuesta(200))
+        llamada_protegida(ENDPOINT_BUSQUEDA, lambda _t: self._respuesta(404))  # 4xx no es fallo
+        self._fallar(2)
+
+        llamar = MagicMock()
+        with self.assertRaises(CircuitoAbiertoError) as ctx:
+            llamada_protegida(ENDPOINT_BUSQUEDA, llamar)
+        llamar.assert_not_called()
+        self.assertGreater(ctx.exception.reintentar_en, 0)
+
+    def test_apertura_compartida_entre_workers(self):
+        self._fallar(4)
+        # Otro proceso: sin circuitos locales, solo la apertura publicada en la cache
+        with patch.dict("servicios.circuitoSabre._CIRCUITOS", clear=True), \
+                self.assertRaises(CircuitoAbiertoError):
+            llamada_protegida(ENDPOINT_BUSQUEDA, MagicMock())
+
+    def test_semiabierto_deja_pasar_una_prueba_y_se_cierra(self):
+        c = self._semiabierto()
+
+        response = llamada_protegida(ENDPOINT_BUSQUEDA, lambda _t: self._respuesta(200))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(c.resumen()["estado"], "cerrado")
+
+    def test_error_no_http_en_la_prueba_la_libera(self):
+        c = self._semiabierto()
+        with self.assertRaises(ValueError):
+            llamada_protegida(ENDPOINT_BUSQUEDA, MagicMock(side_effect=ValueError("json")))
+        self.assertFalse(c.prueba_en_curso)
+
+        response = llamada_protegida(ENDPOINT_BUSQUEDA, lambda _t: self._respuesta(200))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(c.resumen()["estado"], "cerrado")
+
+    def test_cancelacion_en_la_prueba_async_la_libera(self):
+        c = self._semiabierto()
+
+        async def _cancelada(_timeout):
+            raise asyncio.CancelledError
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(llamada_protegida_async(ENDPOINT_BUSQUEDA, _cancelada))
+        self.assertFalse(c.prueba_en_curso)
+        self.assertTrue(c.permitir())  # la siguiente llamada vuelve a probar
+
+    def test_timeout_adaptativo_acotado(self):
+        c = circuito(ENDPOINT_BUSQUEDA)
+        self.assertEqual(c.timeout(), (5, 30))  # sin muestras: el configurado
+        for _ in range(30):
+            c.registrar(True, 2.0)
+        self.assertEqual(c.timeout(), (5, 5))  # p99*1.5=3 -> minimo 5
+        for _ in range(30):
+            c.registrar(True, 12.0)
+        self.assertEqual(c.timeout(), (5, 18))
+
+    def test_timeout_adaptativo_solo_usa_la_ventana(self):
+        c = circuito(ENDPOINT_BUSQUEDA)
+        for _ in range(30):
+            c.registrar(True, 2.0)
+        self.assertEqual(c.timeout(), (5, 5))
+        with patch("servicios.circuitoSabre.time.time", return_value=time.time() + 61):
+            self.assertEqual(c.timeout(), (5, 30))
+
+    def test_prueba_lenta_pero_exitosa_cierra_el_circuito(self):
+        def _sabre_lento(timeout):
+            # Sabre sano pero ahora tarda 8 s: con el read adaptativo de 5 s expira
+            if timeout[1] < 8:
+                raise requests.Timeout()
+            return self._respuesta(200)
+
+        c = circuito(ENDPOINT_BUSQUEDA)
+        for _ in range(30):
+            c.registrar(True, 2.0)
+        for _ in range(30):
+            with self.assertRaises(requests.Timeout):
+                llamada_protegida(ENDPOINT_BUSQUEDA, _sabre_lento)
+        self.assertEqual(c.resumen()["estado"], "abierto")
+
+        c.abierto_hasta = time.time() - 1
+        cache.clear()
+        self.assertEqual(llamada_protegida(ENDPOINT_BUSQUEDA, _sabre_lento).status_code, 200)
+        self.assertEqual(c.resumen()["estado"], "cerrado")
+
+    @patch("servicios.searchFlights.obtener_token_sabre", return_value="tok")
+    @patch("servicios.searchFlights.sesion_http")
+    def test_busqueda_degradada_responde_503(self, mock_sesion, _mock_token):
+        mock_sesion.return_value.post.side_effect = requests.ConnectionError()
+        datos = {"origin": "UIO", "destination": "MAD", "date": "2026-09-15", "adults": 1}
+        for _ in range(4):
+            self.assertEqual(buscar_vuelos_sabre(datos)["code"], 500)
+
+        resultado = buscar_vuelos_sabre(datos)
+        self.assertEqual(resultado["code"], 503)
+        self.assertTrue(resultado["degradado"])
+        self.assertEqual(mock_sesion.return_value.post.call_count, 4)
+
+
+class VistasAsyncSabreTest(TestCase):
+    RESPUESTA_VACIA = json.dumps({
+        "groupedItineraryResponse": {
+            "itineraryGroups": [{"groupDescription": {"legDescriptions": []}, "itineraries": []}],
+            "statistics": {"itineraryCount": 0},
+        }
+    })
+
+    def setUp(self):
+        cache.clear()
+
+    @patch("servicios.searchFlights._buscar_en_sabre_async", new_callable=AsyncMock)
+    async def test_busqueda_async_usa_cache_compartida(self, mock_buscar):
+        mock_buscar.return_value = RespuestaCompartida(200, self.RESPUESTA_VACIA)
+        body = {"origin": "UIO", "destination": "MIA", "date": "2026-09-15", "adults": 1}
+
+        r1 = await self.async_client.post(
+            "/api/async/buscar-vuelos-live/", body, content_type="application/json"
+        )
+        r2 = await self.async_client.post(
+            "/api/async/buscar-vuelos-live/", body, content_type="application/json"
+        )
+
+        self.assertEqual(r1.status_code, 200)
+        self.assertEqual(r1.json(), [])
+        self.assertEqual((r1["X-Cache"], r2["X-Cache"]), ("MISS", "HIT"))
+        self.assertEqual(mock_buscar.await_count, 1)
+
+    @patch("servicios.searchFlights._buscar_en_sabre_async", new_callable=AsyncMock)
+    async def test_busqueda_async_reintenta_401(self, mock_buscar):
+        mock_buscar.side_effect = [
+            RespuestaCompartida(401, "{}"),
+            RespuestaCompartida(200, self.RESPUESTA_VACIA),
+        ]
+        r = await self.async_client.post(
+            "/api/async/buscar-vuelos-live/",
+            {"origin": "UIO", "destination": "BOG", "date": "2026-09-15", "adults": 1},
+            content_type="application/json",
+        )
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(mock_buscar.await_args_list[1].kwargs, {"force_refresh": True})
+
+    async def test_busqueda_async_valida_campos(self):
+        r = await self.async_client.post(
+            "/api/async/buscar-vuelos-live/", {"origin": "UIO"}, content_type="application/json"
+        )
+        self.assertEqual(r.status_code, 400)
+
+    async def test_llamada_unica_async_comparte_corrutina(self):
+        llamadas = []
+
+        async def _llamar():
+            llamadas.append(1)
+            await asyncio.sleep(0.05)
+            return RespuestaCompartida(200, "{}")
+
+        respuestas = await asyncio.gather(
+            *(llamada_unica_async("busqueda", {"q": "async"}, _llamar) for _ in range(5))
+        )
+        self.assertEqual(len(llamadas), 1)
+        self.assertTrue(all(r.status_code == 200 for r in respuestas))
+
+
+class CalendarioTarifasTest(TestCase):
+    def test_combinaciones_solo_ida_y_descarta_pasadas(self):
+        from datetime import date
+        hoy = date(2030, 1, 10)
+        combos = generar_combinaciones(date(2030, 1, 11), None, 3, hoy=hoy)
+        self.assertEqual([c[0].day for c in combos], [10, 11, 12, 13, 14])
+        self.assertTrue(all(v is None for _, v in combos))
+
+    def test_combinaciones_ida_vuelta_sin_vuelta_antes_de_ida(self):
+        from datetime import date
+        combos = generar_combinaciones(date(2030, 5, 10), date(2030, 5, 11), 1, hoy=date(2030, 1, 1))
+        self.assertTrue(all(v >= i for i, v in combos))
+        self.assertEqual(len(combos), 8)  # 3x3 menos (11, 10)
+
+    @staticmethod
+    def _fake_busqueda(datos):
+        precio = 100 + int(datos["date"][-2:])
+        return [{"precio_total": str(precio), "moneda": "USD"}, {"precio_total": "999"}], "miss"
+
+    @patch("servicios.fareCalendar.buscar_vuelos_sabre_con_estado")
+    def test_stream_ndjson_por_celda_y_matriz_final(self, mock_buscar):
+        mock_buscar.side_effect = self._fake_busqueda
+        r = self.client.post(
+            "/api/buscar-vuelos-flexible/",
+            {"origin": "UIO", "destination": "MIA", "date": "2030-06-15", "dias": 2},
+            content_type="application/json",
+        )
+        self.assertEqual(r["Content-Type"], "application/x-ndjson")
+        lineas = [json.loads(x) for x in b"".join(r.streaming_content).splitlines()]
+
+        celdas = [x for x in lineas if x["tipo"] == "celda"]
+        self.assertEqual(len(celdas), 5)
+        self.assertEqual(lineas[-1]["tipo"], "matriz")
+        self.assertEqual(lineas[-1]["mas_barata"], {"ida": "2030-06-13", "vuelta": None, "precio": 113.0})
+        self.assertEqual(len(lineas[-1]["precios"]), 5)
+
+    @patch("servicios.fareCalendar.buscar_vuelos_sabre_con_estado")
+    def test_sin_stream_devuelve_matriz(self, mock_buscar):
+        mock_buscar.side_effect = self._fake_busqueda
+        r = self.client.post(
+            "/api/buscar-vuelos-flexible/?stream=0",
+            {"origin": "UIO", "destination": "MIA", "date": "2030-06-15",
+             "return_date": "2030-06-20", "dias": 1},
+            content_type="application/json",
+        )
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["fechas_vuelta"], ["2030-06-19", "2030-06-20", "2030-06-21"])
+        self.assertEqual(mock_buscar.call_count, 9)
+
+    def test_fecha_invalida_400(self):
+        r = self.client.post(
+            "/api/buscar-vuelos-flexible/",
+            {"origin": "UIO", "destination": "MIA", "date": "15/06/2030"},
+            content_type="application/json",
+        )
+        self.assertEqual(r.status_code, 400)
+
+
+class BusquedaStreamingTest(TestCase):
+    BODY = {"origin": "UIO", "destination": "MIA", "date": "2026-09-15", "adults": 1}  # noqa: RUF012
+
+    def setUp(self):
+        cache.clear()
+        self.sabre = ProcesarRespuestaSortTest._make_sabre_response(self, [
+            {"precio_total": "500", "escalas": 1, "duracion": 200},
+            {"precio_total": "600", "escalas": 0, "duracion": 150},
+        ])
+
+    def test_iterar_itinerarios_es_perezoso_y_en_orden_sabre(self):
+        gen = iterar_itinerarios(self.sabre)
+        self.assertEqual(next(gen)["id"], 0)
+        self.assertEqual(next(gen)["id"], 1)
+
+    @patch("servicios.searchFlights._buscar_en_sabre")
+    def test_ndjson_un_itinerario_por_linea_y_luego_cachea(self, mock_buscar):
+        mock_buscar.return_value = MagicMock(status_code=200, json=MagicMock(return_value=self.sabre))
+
+        r = self.client.post("/api/buscar-vuelos-live/?stream=ndjson", self.BODY,
+                             content_type="application/json")
+        self.assertEqual(r["Content-Type"], "application/x-ndjson")
+        self.assertEqual(r["X-Cache"], "MISS")
+        lineas = [json.loads(x) for x in b"".join(r.streaming_content).splitlines()]
+        self.assertEqual([x["tipo"] for x in lineas], ["itinerario", "itinerario", "fin"])
+        self.assertEqual(lineas[0]["itinerario"]["id"], 0)
+        self.assertEqual(lineas[-1]["total"], 2)
+
+        # La lista quedo cacheada y ordenada para la respuesta normal
+        r2 = self.client.post("/api/buscar-vuelos-live/", self.BODY, content_type="application/json")
+        self.assertEqual(r2["X-Cache"], "HIT")
+        self.assertEqual([o["id"] for o in r2.json()], [1, 0])
+        self.assertEqual(mock_buscar.call_count, 1)
+
+    @patch("servicios.searchFlights._buscar_en_sabre")
+    def test_sse(self, mock_buscar):
+        mock_buscar.return_value = MagicMock(status_code=200, json=MagicMock(return_value=self.sabre))
+        r = self.client.post("/api/buscar-vuelos-live/", dict(self.BODY, stream="sse"),
+                             content_type="application/json")
+        self.assertEqual(r["Content-Type"], "text/event-stream")
+        cuerpo = b"".join(r.streaming_content).decode()
+        self.assertEqual(cuerpo.count("event: itinerario"), 2)
+        self.assertIn('event: fin\ndata: {"total":2,"sesion":', cuerpo)
+
+    @patch("servicios.searchFlights._buscar_en_sabre")
+    def test_error_de_sabre_no_abre_stream(self, mock_buscar):
+        mock_buscar.return_value = MagicMock(status_code=500, json=MagicMock(return_value={}))
+        r = self.client.post("/api/buscar-vuelos-live/?stream=ndjson", self.BODY,
+                             content_type="application/json")
+        self.assertEqual(r.status_code, 500)
+        self.assertFalse(r.streaming)
+
+
+class SesionBusquedaTest(TestCase):
+    BODY = {"origin": "UIO", "destination": "MIA", "date": "2026-09-15", "adults": 1}  # noqa: RUF012
+
+    def setUp(self):
+        cache.clear()
+        self.sabre = ProcesarRespuestaSortTest._make_sabre_response(self, [
+            {"precio_total": "500", "escalas": 1, "duracion": 200},
+            {"precio_total": "300", "escalas": 0, "duracion": 150},
+            {"precio_total": "900", "escalas": 0, "duracion": 120},
+        ])
+
+    def _buscar(self, mock_buscar, url="/api/buscar-vuelos-live/"):
+        mock_buscar.return_value = MagicMock(status_code=200, json=MagicMock(return_value=self.sabre))
+        return self.client.post(url, self.BODY, content_type="application/json")
+
+    @patch("servicios.searchFlights._buscar_en_sabre")
+    def test_get_filtra_ordena_y_pagina_sin_volver_a_sabre(self, mock_buscar):
+        sesion = self._buscar(mock_buscar)["X-Search-Session"]
+
+        r = self.client.get(f"/api/buscar-vuelos-live/{sesion}/?orden=-precio&por_pagina=2")
+        self.assertEqual(r.status_code, 200)
+        data = r.json()
+        self.assertEqual([o["precio_total"] for o in data["resultados"]], ["900", "500"])
+        self.assertEqual((data["total"], data["paginas"]), (3, 2))
+        self.assertEqual(data["facetas"]["escalas"], [0, 1])
+        self.assertEqual(data["destacados"]["mas_barata"]["precio_total"], "300")
+
+        r = self.client.get(f"/api/buscar-vuelos-live/{sesion}/?max_escalas=0&precio_max=500")
+        self.assertEqual([o["precio_total"] for o in r.json()["resultados"]], ["300"])
+        self.assertEqual(mock_buscar.call_count, 1)
+
+    @patch("servicios.searchFlights._buscar_en_sabre")
+    def test_post_con_por_pagina_devuelve_primera_pagina(self, mock_buscar):
+        r = self._buscar(mock_buscar, "/api/buscar-vuelos-live/?por_pagina=1")
+        data = r.json()
+        self.assertEqual(data["sesion"], r["X-Search-Session"])
+        self.assertEqual(len(data["resultados"]), 1)
+        self.assertEqual(data["total_sin_filtros"], 3)
+
+    @patch("servicios.searchFlights._buscar_en_sabre")
+    def test_parametros_invalidos(self, mock_buscar):
+        sesion = self._buscar(mock_buscar)["X-Search-Session"]
+        r = self.client.get(f"/api/buscar-vuelos-live/{sesion}/?salida_desde=25:00")
+        self.assertEqual(r.status_code, 400)
+        r = self.client.get(f"/api/buscar-vuelos-live/{sesion}/?orden=barato")
+        self.assertEqual(r.status_code, 400)
+
+    def test_sesion_inexistente_es_404(self):
+        r = self.client.get(f"/api/buscar-vuelos-live/{'0' * 32}/")
+        self.assertEqual(r.status_code, 404)
+        r = self.client.get("/api/buscar-vuelos-live/no-es-un-id/")
+        self.assertEqual(r.status_code, 404)
+
+
+class ColumnasVuelosTest(TestCase):
+    def setUp(self):
+        self.resultados = procesar_respuesta(ProcesarRespuestaSortTest._make_sabre_response(self, [
+            {"precio_total": "500", "escalas": 1, "duracion": 200},
+            {"precio_total": "300", "escalas": 0, "duracion": 150},
+            {"precio_total": "900", "escalas": 0, "duracion": 60},
+        ]))
+
+    def test_procesar_respuesta_adjunta_columnas_alineadas(self):
+        columnas = self.resultados.columnas
+        self.assertEqual([o["id"] for o in self.resultados], [2, 1, 0])
+        self.assertEqual(list(columnas.precio), [900.0, 300.0, 500.0])
+        self.assertEqual(list(columnas.duracion), [60, 150, 200])
+        self.assertEqual(list(columnas.escalas_max), [0, 0, 1])
+        self.assertEqual(list(columnas.salida_ida), [600, 600, 600])
+        self.assertEqual(columnas.aerolineas[0], ("AA",))
+
+    def test_columnas_viajan_con_la_cache(self):
+        cache.set("columnas-test", self.resultados)
+        copia = cache.get("columnas-test")
+        self.assertEqual(copia, self.resultados)
+        self.assertEqual(list(copia.columnas.precio), list(self.resultados.columnas.precio))
+
+    def test_filtrar_y_ranking(self):
+        columnas = self.resultados.columnas
+        self.assertEqual(filtrar(columnas, max_escalas=0, precio_max=500), [1])
+        self.assertEqual(filtrar(columnas, salida_ida=(11 * 60, None)), [])
+        self.assertEqual(ranking(columnas), {"mas_barata": 1, "mas_rapida": 0, "mejor": 1})
+
+    def test_lista_simple_sin_columnas(self):
+        columnas = columnas_de(list(self.resultados))
+        self.assertEqual(ordenar_indices(columnas, [0, 1, 2], "-precio"), [0, 2, 1])
+
+
+class NormalizadorLegsCompartidosTest(TestCase):
+    """Itinerarios que comparten leg reutilizan la plantilla, no los datos de tarifa."""
+
+    def _respuesta(self):
+        def _itinerario(iid, booking_code):
+            return {
+                "id": iid,
+                "legs": [{"ref": 1}],
+                "pricingInformation": [{"fare": {
+                    "totalFare": {"totalPrice": "100", "currency": "USD"},
+                    "passengerInfoList": [{"passengerInfo": {"fareComponents": [{
+                        "ref": 1, "beginAirport": "UIO", "endAirport": "MIA",
+                        "segments": [{"segment": {"bookingCode": booking_code, "cabinCode": "Y"}}],
+                    }]}}],
+                }}],
+            }
+
+        return {"groupedItineraryResponse": {
+            "scheduleDescs": [{
+                "id": 1, "elapsedTime": 240,
+                "departure": {"airport": "UIO", "time": "10:00:00-05:00"},
+                "arrival": {"airport": "MIA", "time": "15:00:00-05:00"},
+                "carrier": {"marketing": "AA", "marketingFlightNumber": 1000},
+            }],
+            "legDescs": [{"id": 1, "elapsedTime": 240, "schedules": [{"ref": 1}]}],
+            "fareComponentDescs": [{"id": 1, "fareBasisCode": "YLOW"}],
+            "itineraryGroups": [{
+                "groupDescription": {"legDescriptions": [{"departureDate": "2026-09-15"}]},
+                "itineraries": [_itinerario(1, "Y"), _itinerario(2, "M")],
+            }],
+        }}
+
+    def test_clase_por_itinerario_con_leg_compartido(self):
+        uno, dos = iterar_itinerarios(self._respuesta())
+        seg_uno = uno["tramos"][0]["segmentos"][0]
+        seg_dos = dos["tramos"][0]["segmentos"][0]
+
+        self.assertEqual(seg_uno["clase_servicio"], "Y")
+        self.assertEqual(seg_dos["clase_servicio"], "M")
+        self.assertEqual(seg_uno["fare_basis"], "YLOW")
+        self.assertIsNot(seg_uno, seg_dos)
+        self.assertIsNot(uno["tramos"][0], dos["tramos"][0])
+        self.assertEqual(seg_uno["fecha_hora_salida"], "2026-09-15T10:00:00")
+        self.assertEqual(uno["fare_info"][0]["booking_code"], "Y")
+
+
+class JSONRapidoTest(TestCase):
+    DATOS = {  # noqa: RUF012
+        "precio": Decimal("10.50"), "fecha": timezone.now(),
+        "ciudad": "Bogotá", 1: [None, True],
+    }
+
+    def test_renderer_igual_al_de_drf(self):
+        from rest_framework.renderers import JSONRenderer
+
+        from .jsonRapido import JSONRapidoRenderer
+
+        self.assertEqual(JSONRapidoRenderer().render(self.DATOS), JSONRenderer().render(self.DATOS))
+
+    def test_sin_orjson_usa_libreria_estandar(self):
+        from . import jsonRapido
+
+        with patch.object(jsonRapido, "orjson", None):
+            self.assertEqual(jsonRapido.loads(b'{"a": [1]}'), {"a": [1]})
+            self.assertEqual(jsonRapido.dumps({"a": "ñ"}), '{"a":"ñ"}'.encode())
+
+    def test_respuesta_compartida_decodifica_bytes(self):
+        respuesta = RespuestaCompartida(200, '{"ciudad": "Bogotá"}'.encode())
+        self.assertEqual(respuesta.json(), {"ciudad": "Bogotá"})
+        self.assertEqual(respuesta.text, '{"ciudad": "Bogotá"}')
+
+    def test_json_invalido_en_busqueda_es_400(self):
+        r = self.client.post("/api/buscar-vuelos-live/", "{no json", content_type="application/json")
+        self.assertEqual(r.status_code, 400)
+
+
 # ============================================================
 # TESTS DE REVALIDATE FLIGHT
 # ============================================================
@@ -489,6 +1221,9 @@ class RevalidateConstruirPayloadTest(TestCase):
 
 
 class RevalidarItinerarioTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
     def test_sin_tramos_retorna_error(self):
         result = revalidar_itinerario({"tramos": []})
         self.assertFalse(result["disponible"])
@@ -534,6 +1269,116 @@ class RevalidarItinerarioTest(TestCase):
         self.assertEqual(mock_llamar.call_count, 2)
 
 
+ITINERARIO_REVALIDACION = {
+    "tramos": [{"segmentos": [{
+        "origen": "UIO", "destino": "MIA", "aerolinea": {"codigo": "AA"},
+        "numero_vuelo": 1000, "clase_servicio": "Y", "fare_basis": "YLOW",
+        "fecha_hora_salida": "2026-09-15T10:00:00",
+        "fecha_hora_llegada": "2026-09-15T15:00:00",
+    }]}],
+    "adults": 1,
+}
+
+
+def _respuesta_revalidate(status_code=200):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = {"groupedItineraryResponse": {
+        "statistics": {"itineraryCount": 1},
+        "itineraryGroups": [{"itineraries": [{"pricingInformation": [
+            {"fare": {"totalFare": {"totalPrice": "500", "currency": "USD"}}}
+        ]}]}],
+    }}
+    return response
+
+
+class RevalidacionCacheTest(TestCase):
+    DATOS = ITINERARIO_REVALIDACION
+
+    def setUp(self):
+        cache.clear()
+
+    def test_huella_independiente_del_formato(self):
+        plano = {"tramos": [{"segmentos": [{
+            **self.DATOS["tramos"][0]["segmentos"][0],
+            "aerolinea": None, "aerolinea_marketing": "AA",
+        }]}], "adults": "1"}
+        self.assertEqual(huella_itinerario(plano), huella_itinerario(self.DATOS))
+
+        otra_tarifa = json.loads(json.dumps(self.DATOS))
+        otra_tarifa["tramos"][0]["segmentos"][0]["fare_basis"] = "YFLEX"
+        self.assertNotEqual(huella_itinerario(otra_tarifa), huella_itinerario(self.DATOS))
+        self.assertNotEqual(huella_itinerario({**self.DATOS, "children": 1}),
+                            huella_itinerario(self.DATOS))
+
+    @patch("servicios.revalidateFlight._llamar_revalidate")
+    def test_revalidacion_reciente_sale_de_cache(self, mock_llamar):
+        mock_llamar.return_value = _respuesta_revalidate()
+
+        primero, estado_1 = revalidar_itinerario_con_estado(self.DATOS)
+        segundo, estado_2 = revalidar_itinerario_con_estado(self.DATOS)
+
+        self.assertEqual((estado_1, estado_2), ("miss", "hit"))
+        self.assertEqual(primero, segundo)
+        self.assertEqual(mock_llamar.call_count, 1)
+
+    @patch("servicios.revalidateFlight._llamar_revalidate")
+    def test_forzar_consulta_sabre_y_refresca(self, mock_llamar):
+        mock_llamar.return_value = _respuesta_revalidate()
+        revalidar_itinerario(self.DATOS)
+
+        resultado, estado = revalidar_itinerario_con_estado(self.DATOS, forzar=True)
+
+        self.assertEqual(estado, "miss")
+        self.assertTrue(resultado["disponible"])
+        self.assertEqual(mock_llamar.call_count, 2)
+
+    @patch("servicios.revalidateFlight._llamar_revalidate")
+    def test_errores_no_se_cachean(self, mock_llamar):
+        mock_llamar.side_effect = [requests.ConnectionError("caido"), _respuesta_revalidate()]
+
+        self.assertEqual(revalidar_itinerario(self.DATOS)["code"], 500)
+        self.assertTrue(revalidar_itinerario(self.DATOS)["disponible"])
+
+
+class RevalidarLoteTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(SABRE_REVALIDATE_BATCH_MAX=2)
+    def test_lote_vacio_o_demasiado_grande(self):
+        self.assertEqual(revalidar_lote({"opciones": []})["code"], 400)
+        opcion = {"tramos": ITINERARIO_REVALIDACION["tramos"]}
+        self.assertEqual(revalidar_lote({"opciones": [opcion] * 3})["code"], 400)
+
+    @patch("servicios.revalidateFlight._llamar_revalidate")
+    def test_resultado_por_opcion_en_orden(self, mock_llamar):
+        mock_llamar.return_value = _respuesta_revalidate()
+        opciones = [
+            {"id_itinerario_unico": "sabre:1", "tramos": ITINERARIO_REVALIDACION["tramos"]},
+            {"id_itinerario_unico": "sabre:2", "tramos": []},
+            {"id_itinerario_unico": "sabre:3", "tramos": ITINERARIO_REVALIDACION["tramos"]},
+        ]
+
+        resultado = revalidar_lote({"opciones": opciones, "adults": 1})
+
+        self.assertEqual(resultado["total"], 3)
+        self.assertEqual(resultado["disponibles"], 2)
+        items = resultado["resultados"]
+        self.assertEqual([i["id_itinerario_unico"] for i in items], ["sabre:1", "sabre:2", "sabre:3"])
+        self.assertEqual(items[1]["code"], 400)
+        # Mismo itinerario dos veces: una sola consulta a Sabre (cache/single-flight)
+        self.assertLessEqual(mock_llamar.call_count, 2)
+
+    @patch("servicios.views.revalidar_lote")
+    def test_vista_lote(self, mock_lote):
+        mock_lote.return_value = {"total": 0, "disponibles": 0, "resultados": []}
+        response = self.client.post("/api/revalidar-vuelos/", {"opciones": [{}]},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(mock_lote.call_args.kwargs["forzar"])
+
+
 # ============================================================
 # TESTS DE SEAT MAP FLIGHT
 # ============================================================
@@ -629,8 +1474,19 @@ class SeatConstruirPayloadTest(TestCase):
         with self.assertRaises(ValueError):
             seat_construir_payload(opcion, [{"passengerType": "ADT"}], "USD")
 
+    def test_payload_identico_genera_mismos_ids(self):
+        pasajeros = [{"passengerType": "ADT", "givenName": "TEST", "surname": "TEST"}]
+        p1, seg1, pax1 = seat_construir_payload(self._make_opcion(), pasajeros, "USD")
+        p2, seg2, pax2 = seat_construir_payload(self._make_opcion(), pasajeros, "USD")
+        self.assertEqual((seg1, pax1), (seg2, pax2))
+        self.assertEqual(p1, p2)
+        self.assertNotEqual(seg1[0], pax1[0])
+
 
 class ObtenerMapaAsientosTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
     @override_settings(SEATMAP_SANDBOX=True)
     def test_sin_opcion_retorna_error(self):
         result = obtener_mapa_asientos({"opcion": {}})
@@ -664,10 +1520,669 @@ class ObtenerMapaAsientosTest(TestCase):
         self.assertIsInstance(result["mapas"], list)
 
 
+OPCION_SEATMAP = {
+    "tramos": [{"segmentos": [{
+        "origen": "UIO", "destino": "MIA", "aerolinea": {"codigo": "AA"},
+        "numero_vuelo": 1000, "clase_servicio": "Y", "cabina": "Y", "fare_basis": "YLF7R",
+        "fecha_hora_salida": "2026-09-15T10:00:00",
+        "fecha_hora_llegada": "2026-09-15T15:00:00",
+    }]}],
+    "fare_info": [{"end": "MIA", "governing_carrier": "AA", "fare_amount": "500",
+                   "fare_currency": "USD", "cabin": "Y"}],
+    "moneda": "USD",
+}
+
+
+@override_settings(SEATMAP_SANDBOX=False)
+class SeatMapCacheDeltaTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _respuesta(self, estado_10b="F", precio_10a="25.00"):
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {"response": {
+            "offerId": "OFFER-1",
+            "priceDefinitions": [{"id": "P1", "totalPrice": {"amount": precio_10a},
+                                  "currencyCode": "USD"}],
+            "offerItems": [{"id": "O1", "priceDefinitionRef": "P1"}],
+            "seatMaps": [{"segmentRef": "S1", "cabinCompartments": [{
+                "cabinCode": "Y",
+                "seatRows": [{"row": 10, "seats": [
+                    {"column": "A", "occupationStatusCode": "F", "offerItemRefIds": ["O1"]},
+                    {"column": "B", "occupationStatusCode": estado_10b},
+                    {"column": "C", "occupationStatusCode": "F"},
+                ]}],
+            }]}],
+        }}
+        return response
+
+    @patch("servicios.seatMapFlight._llamar_seatmap")
+    def test_cache_compartida_entre_pasajeros(self, mock_llamar):
+        mock_llamar.return_value = self._respuesta()
+        primero = obtener_mapa_asientos({"opcion": OPCION_SEATMAP, "pasajeros": [
+            {"passengerType": "ADT", "givenName": "ANA", "surname": "PEREZ"}]})
+        segundo = obtener_mapa_asientos({"opcion": OPCION_SEATMAP, "pasajeros": [
+            {"passengerType": "ADT", "givenName": "LUIS", "surname": "MORA"}]})
+
+        self.assertEqual(mock_llamar.call_count, 1)
+        self.assertFalse(primero["delta"])
+        self.assertEqual(primero["version"], segundo["version"])
+
+    @patch("servicios.seatMapFlight._llamar_seatmap")
+    def test_delta_solo_asientos_cambiados(self, mock_llamar):
+        mock_llamar.side_effect = [self._respuesta(), self._respuesta("O", "30.00")]
+        version = obtener_mapa_asientos({"opcion": OPCION_SEATMAP})["version"]
+
+        sin_cambios = obtener_mapa_asientos({"opcion": OPCION_SEATMAP, "desde_version": version})
+        self.assertTrue(sin_cambios["delta"])
+        self.assertEqual(sin_cambios["cambios"], [])
+
+        with patch("servicios.seatMapFlight.obtener_con_cache",
+                   side_effect=lambda _ns, _clave, calcular, **_kw: (calcular(), "miss")):
+            delta = obtener_mapa_asientos({"opcion": OPCION_SEATMAP, "desde_version": version})
+
+        self.assertTrue(delta["delta"])
+        self.assertNotEqual(delta["version"], version)
+        self.assertEqual(sorted(a["id"] for a in delta["cambios"]), ["10A", "10B"])
+
+    @patch("servicios.seatMapFlight._llamar_seatmap")
+    def test_version_desconocida_devuelve_mapa_completo(self, mock_llamar):
+        mock_llamar.return_value = self._respuesta()
+        result = obtener_mapa_asientos({"opcion": OPCION_SEATMAP, "desde_version": "no-existe"})
+        self.assertFalse(result["delta"])
+        self.assertIn("mapas", result)
+
+
+class SeatMapSandboxTest(TestCase):
+    def _payload(self, fecha="2026-09-15"):
+        opcion = json.loads(json.dumps(OPCION_SEATMAP))
+        opcion["tramos"][0]["segmentos"][0]["fecha_hora_salida"] = f"{fecha}T10:00:00"
+        payload, seg_ids, _ = seat_construir_payload(opcion, [{"passengerType": "ADT"}])
+        return payload, seg_ids
+
+    def _ocupados(self, payload, seg_ids):
+        raw = seatmap_simular(payload, seg_ids, "USD")
+        filas = raw["response"]["seatMaps"][0]["cabinCompartments"][0]["seatRows"]
+        return [f"{f['row']}{a['column']}" for f in filas for a in f["seats"]
+                if a["occupationStatusCode"] == "T"]
+
+    def test_mismo_vuelo_misma_ocupacion(self):
+        payload, seg_ids = self._payload()
+        ocupados = self._ocupados(payload, seg_ids)
+        self.assertTrue(ocupados)
+        self.assertEqual(ocupados, self._ocupados(payload, seg_ids))
+        self.assertNotEqual(ocupados, self._ocupados(*self._payload("2026-09-16")))
+
+    def test_plantilla_se_calcula_una_vez(self):
+        payload, seg_ids = self._payload()
+        seatmap_simular(payload, seg_ids, "USD")
+        antes = seatmap_plantilla.cache_info().misses
+        seatmap_simular(payload, seg_ids, "USD")
+        self.assertEqual(seatmap_plantilla.cache_info().misses, antes)
+
+    def test_cabin_codes_desconocidos_no_crecen_la_cache(self):
+        from .seatMapFlight import _CABIN_LAYOUTS
+
+        payload, seg_ids = self._payload()
+        for codigo in ("ZZ1", "zz2", "??", "", "y"):
+            for seg in payload["segments"]:
+                seg["cabinCode"] = codigo
+            seatmap_simular(payload, seg_ids, "USD")
+        self.assertLessEqual(seatmap_plantilla.cache_info().currsize, len(_CABIN_LAYOUTS))
+
+
+@override_settings(SEATMAP_SANDBOX=True)
+class SeatMapCompactoTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_ida_y_vuelta_exacta(self):
+        mapa = obtener_mapa_asientos({"opcion": OPCION_SEATMAP})
+        compacto = compactar_mapa(mapa)
+
+        self.assertEqual(compacto["formato"], "compacto-1")
+        self.assertEqual(expandir_mapa(compacto), mapa)
+        self.assertLess(len(json.dumps(compacto)), len(json.dumps(mapa)) / 2)
+
+    def test_delta_y_errores_sin_cambios(self):
+        delta = {"delta": True, "version": "v2", "cambios": []}
+        self.assertIs(compactar_mapa(delta), delta)
+        error = {"error": "x", "code": 404}
+        self.assertIs(compactar_mapa(error), error)
+
+    def test_vista_con_formato_compacto(self):
+        response = self.client.post("/api/seatmap/?formato=compacto", {"opcion": OPCION_SEATMAP},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        cuerpo = response.json()
+        self.assertEqual(cuerpo["formato"], "compacto-1")
+        self.assertIsInstance(cuerpo["mapas"][0]["cabinas"][0]["filas"][0]["estados"], str)
+
+
 # ============================================================
 # TESTS DE VIEWSETS (catálogo)
 # ============================================================
 
+class IntentoReservaTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_recupera_desde_bd_si_la_cache_no_lo_tiene(self):
+        guardar_intent(TIPO_VUELO, "cs_test_1", {"booking_ref": "CDG-1"})
+        cache.clear()  # confirm llega a otro worker / reinicio
+
+        self.assertEqual(recuperar_intent(TIPO_VUELO, "cs_test_1"), {"booking_ref": "CDG-1"})
+        # la lectura vuelve a llenar la cache
+        with self.assertNumQueries(0):
+            self.assertEqual(recuperar_intent(TIPO_VUELO, "cs_test_1")["booking_ref"], "CDG-1")
+
+    def test_tipo_distinto_no_encuentra_el_intent(self):
+        guardar_intent(TIPO_VUELO, "cs_test_2", {"x": 1})
+        cache.clear()
+        self.assertIsNone(recuperar_intent(TIPO_PAQUETE, "cs_test_2"))
+
+    def test_intent_vencido_se_borra_al_leer(self):
+        guardar_intent(TIPO_PAQUETE, "cs_test_3", {"x": 1})
+        IntentoReserva.objects.update(expira_en=timezone.now() - timedelta(seconds=1))
+        cache.clear()
+
+        self.assertIsNone(recuperar_intent(TIPO_PAQUETE, "cs_test_3"))
+        self.assertFalse(IntentoReserva.objects.exists())
+
+    def test_guardar_purga_vencidos_una_vez_por_intervalo(self):
+        guardar_intent(TIPO_VUELO, "cs_viejo", {"x": 1})
+        IntentoReserva.objects.update(expira_en=timezone.now() - timedelta(seconds=1))
+        cache.clear()
+
+        guardar_intent(TIPO_VUELO, "cs_nuevo", {"x": 2})
+        self.assertEqual(list(IntentoReserva.objects.values_list("stripe_session_id", flat=True)),
+                         ["cs_nuevo"])
+
+    def test_voucher_lee_la_reserva_confirmada_de_la_bd(self):
+        reserva = {"confirmationId": "ABC123", "booking": {}}
+        ReservaVuelo.objects.create(pnr="ABC123", stripe_session_id="cs_test_4", datos=reserva)
+
+        self.assertEqual(obtener_reserva_guardada("ABC123"), reserva)
+        self.assertEqual(obtener_reserva_guardada("cs_test_4"), reserva)
+        self.assertIsNone(obtener_reserva_guardada("NOEXISTE"))
+
+
+class VoucherCondicionalTest(TestCase):
+    """GET del voucher con ETag del contenido de la reserva: 304 sin volver a renderizar."""
+
+    def setUp(self):
+        cache.clear()
+        self.reserva = ReservaVuelo.objects.create(
+            pnr="ABC123", stripe_session_id="cs_voucher",
+            datos={"confirmationId": "ABC123", "booking": {}})
+
+    @patch("servicios.bookingDocs.render_voucher_html", return_value="<html>voucher</html>")
+    def test_voucher_vuelo_304_sin_renderizar(self, render):
+        url = "/api/booking/voucher/?pnr=ABC123"
+        primera = self.client.get(url)
+        self.assertEqual(primera.status_code, 200)
+        self.assertEqual(primera["Cache-Control"], "private, no-cache")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=primera["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(render.call_count, 1)
+        # otro formato u otra reserva -> otro ETag
+        self.assertNotEqual(self.client.get(url + "&doc=boletos")["ETag"], primera["ETag"])
+        cache.clear()
+        self.reserva.datos = {"confirmationId": "ABC123", "booking": {"estado": "emitido"}}
+        self.reserva.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=primera["ETag"]).status_code, 200)
+
+    @patch("servicios.paqueteDocs.render_voucher_paquete_html", return_value="<html>paquete</html>")
+    @patch("servicios.views.obtener_reserva_paquete_guardada",
+           return_value={"localizador": "CDGPK-1", "paquete": {}})
+    def test_voucher_paquete_304_sin_renderizar(self, _obtener, render):
+        url = "/api/paquetes/booking/voucher/?loc=CDGPK-1"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(render.call_count, 1)
+
+
+class ConfirmacionIdempotenteTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        guardar_intent(TIPO_VUELO, "cs_conf", {"booking_ref": "CDG-1"})
+
+    def test_segunda_confirmacion_devuelve_la_reserva_guardada(self):
+        def _confirmar(session_id):
+            reserva = {"confirmationId": "PNR001", "booking": {}}
+            guardar_reserva_vuelo(session_id, reserva)
+            return reserva
+
+        with patch("servicios.bookingFlight._confirmar_reserva", side_effect=_confirmar) as mock:
+            primera = confirmar_reserva("cs_conf")
+            segunda = confirmar_reserva("cs_conf")
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(primera, segunda)
+        # el bloqueo se libera al terminar
+        self.assertIsNone(IntentoReserva.objects.get().confirmando_hasta)
+
+    @patch("servicios.intentosReserva.time.sleep")
+    def test_concurrente_espera_el_resultado_del_primero(self, _sleep):
+        IntentoReserva.objects.update(confirmando_hasta=timezone.now() + timedelta(minutes=1))
+        reserva = {"confirmationId": "PNR002"}
+        obtener = MagicMock(side_effect=[None, None, reserva])
+        confirmar = MagicMock()
+
+        self.assertEqual(confirmar_una_vez("cs_conf", obtener, confirmar), reserva)
+        confirmar.assert_not_called()
+
+    @override_settings(BOOKING_CONFIRM_WAIT=0)
+    def test_si_el_otro_no_termina_a_tiempo_responde_409(self):
+        IntentoReserva.objects.update(confirmando_hasta=timezone.now() + timedelta(minutes=1))
+        res = confirmar_una_vez("cs_conf", lambda sid: None, MagicMock())
+        self.assertEqual(res["code"], 409)
+
+    def test_bloqueo_vencido_se_retoma(self):
+        IntentoReserva.objects.update(confirmando_hasta=timezone.now() - timedelta(seconds=1))
+        confirmar = MagicMock(return_value={"confirmationId": "PNR003"})
+        self.assertEqual(confirmar_una_vez("cs_conf", lambda sid: None, confirmar)["confirmationId"],
+                         "PNR003")
+        confirmar.assert_called_once_with("cs_conf")
+
+    def test_sin_intent_en_bd_confirma_sin_bloqueo(self):
+        confirmar = MagicMock(return_value={"error": "No se encontro", "code": 404})
+        self.assertEqual(confirmar_una_vez("cs_otro", lambda sid: None, confirmar)["code"], 404)
+        confirmar.assert_called_once()
+
+
+class ConfirmacionLargaTest(TransactionTestCase):
+    """El hilo que renueva el bloqueo usa su propia conexion: hace falta commit real."""
+
+    @override_settings(BOOKING_CONFIRM_LOCK_SECONDS=1)
+    def test_confirmacion_mas_larga_que_el_bloqueo_lo_conserva(self):
+        guardar_intent(TIPO_VUELO, "cs_larga", {"booking_ref": "CDG-2"})
+        retomado = []
+
+        def _confirmar(session_id):
+            time.sleep(1.5)  # Sabre lento: pasa del vencimiento original
+            retomado.append(_tomar_confirmacion(session_id))
+            return {"confirmationId": "PNR004"}
+
+        res = confirmar_una_vez("cs_larga", lambda sid: None, _confirmar)
+        self.assertEqual(res["confirmationId"], "PNR004")
+        self.assertEqual(retomado, [False])
+        self.assertIsNone(IntentoReserva.objects.get().confirmando_hasta)
+
+
+LLAMADAS_TAREA_PRUEBA = []
+
+
+def _tarea_prueba(valor, fallar=False):
+    LLAMADAS_TAREA_PRUEBA.append(valor)
+    if fallar:
+        raise RuntimeError("SMTP caido")
+
+
+@override_settings(TAREAS_BACKOFF_BASE=30, TAREAS_BACKOFF_MAX=3600, TAREAS_WORKERS=1)
+@patch.dict(TAREAS, {"prueba": "servicios.tests._tarea_prueba"})
+class TareaFondoTest(TestCase):
+    def setUp(self):
+        LLAMADAS_TAREA_PRUEBA.clear()
+
+    def test_encolar_es_idempotente_por_clave(self):
+        a = encolar("prueba", {"valor": 1}, clave="prueba:cs_1")
+        b = encolar("prueba", {"valor": 2}, clave="prueba:cs_1")
+        self.assertEqual(a.id, b.id)
+        self.assertEqual(TareaFondo.objects.count(), 1)
+
+    def test_procesa_y_completa(self):
+        encolar("prueba", {"valor": 1}, clave="prueba:ok")
+        self.assertEqual(procesar_pendientes(), {"procesadas": 1, "completadas": 1, "fallidas": 0})
+        self.assertEqual(LLAMADAS_TAREA_PRUEBA, [1])
+        self.assertEqual(TareaFondo.objects.get().estado, "COMPLETADA")
+        # una tarea completada no se vuelve a ejecutar
+        self.assertEqual(procesar_pendientes()["procesadas"], 0)
+
+    def test_fallo_reintenta_con_backoff_y_luego_queda_fallida(self):
+        encolar("prueba", {"valor": 1, "fallar": True}, clave="prueba:ko", max_intentos=2)
+        with self.assertLogs("servicios.tareasFondo", "ERROR"):
+            procesar_pendientes()
+        tarea = TareaFondo.objects.get()
+        self.assertEqual((tarea.estado, tarea.intentos), ("PENDIENTE", 1))
+        self.assertIn("SMTP caido", tarea.ultimo_error)
+        self.assertGreater(tarea.disponible_en, timezone.now() + timedelta(seconds=25))
+        # todavia no toca
+        self.assertEqual(procesar_pendientes()["procesadas"], 0)
+
+        TareaFondo.objects.update(disponible_en=timezone.now())
+        with self.assertLogs("servicios.tareasFondo", "ERROR"):
+            procesar_pendientes()
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos), ("FALLIDA", 2))
+        self.assertEqual(espera_reintento(1), 30)
+        self.assertEqual(espera_reintento(20), 3600)
+
+    def test_tarea_de_worker_caido_se_retoma_al_vencer_la_toma(self):
+        encolar("prueba", {"valor": 1}, clave="prueba:lease")
+        TareaFondo.objects.update(estado="EN_PROCESO", intentos=1,
+                                  bloqueada_hasta=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(procesar_pendientes()["procesadas"], 0)
+
+        TareaFondo.objects.update(bloqueada_hasta=timezone.now() - timedelta(seconds=1))
+        procesar_pendientes()
+        self.assertEqual(TareaFondo.objects.get().estado, "COMPLETADA")
+
+    def test_toma_vencida_en_el_ultimo_intento_queda_fallida(self):
+        encolar("prueba", {"valor": 1}, clave="prueba:oom", max_intentos=2)
+        # el worker murio (OOM, SIGKILL) durante el ultimo intento
+        TareaFondo.objects.update(estado="EN_PROCESO", intentos=2,
+                                  bloqueada_hasta=timezone.now() - timedelta(seconds=1))
+        with self.assertLogs("servicios.tareasFondo", "ERROR"):
+            self.assertEqual(procesar_pendientes()["procesadas"], 0)
+        tarea = TareaFondo.objects.get()
+        self.assertEqual((tarea.estado, tarea.intentos), ("FALLIDA", 2))
+        self.assertEqual(LLAMADAS_TAREA_PRUEBA, [])
+
+    def test_resultado_tardio_no_pisa_al_worker_que_la_retomo(self):
+        encolar("prueba", {"valor": 1, "fallar": True}, clave="prueba:tarde")
+        [tarea] = tomar_tareas(1)
+        # la toma vence y otro worker la retoma antes de que este termine
+        TareaFondo.objects.update(bloqueada_hasta=timezone.now() - timedelta(seconds=1))
+        [retomada] = tomar_tareas(1)
+        self.assertEqual(retomada.intentos, 2)
+
+        with self.assertLogs("servicios.tareasFondo", "WARNING"):
+            self.assertFalse(ejecutar(tarea))
+        actual = TareaFondo.objects.get()
+        self.assertEqual((actual.estado, actual.intentos), ("EN_PROCESO", 2))
+        self.assertIsNotNone(actual.bloqueada_hasta)
+
+        tarea.payload = {"valor": 1}
+        with self.assertLogs("servicios.tareasFondo", "WARNING"):
+            self.assertTrue(ejecutar(tarea))
+        self.assertEqual(TareaFondo.objects.get().estado, "EN_PROCESO")
+
+    def test_notificar_nueva_reserva_encola_en_vez_de_lanzar_hilo(self):
+        for _ in range(2):
+            notificar_nueva_reserva_async("vuelo", "ABC123", "a@b.com", "", Decimal("10.50"),
+                                          "USD", "UIO-MIA", session_id="cs_1")
+        tarea = TareaFondo.objects.get()
+        self.assertEqual(tarea.clave, "notificar_reserva:vuelo:cs_1")
+        self.assertEqual(tarea.payload["monto"], "10.50")
+        self.assertNotIn("session_id", tarea.payload)
+
+    def test_reservas_sin_pnr_notifican_cada_una(self):
+        from .bookingFlight import _guardar_reserva_bd
+
+        for sid in ("cs_sin_pnr_1", "cs_sin_pnr_2"):
+            _guardar_reserva_bd(sid, {"booking": {}}, {"contacto": {"email": "a@b.com"}})
+        self.assertEqual(TareaFondo.objects.filter(tipo="notificar_reserva").count(), 2)
+
+    def test_fallo_al_encolar_no_impide_registrar_al_cliente(self):
+        from .bookingPaquete import _guardar_reserva_bd
+
+        with patch("servicios.tareasFondo.encolar", side_effect=RuntimeError("bd")), \
+                self.assertLogs("servicios.bookingPaquete", "ERROR"):
+            _guardar_reserva_bd("cs_paq", {"localizador": "CDGPK-1"},
+                                {"contacto": {"email": "c@d.com"}})
+        self.assertTrue(Cliente.objects.filter(email="c@d.com").exists())
+
+
+@override_settings(CATALOGO_CACHE_TTL=0)
+class QueryCountTest(TestCase):
+    """Cada listado hace un número fijo de consultas, sin importar cuántas filas devuelva."""
+
+    # (url, consultas esperadas)
+    LISTADOS = (
+        ("/api/regiones/", 1),
+        ("/api/regiones/arbol/", 4),  # + version del catalogo
+        ("/api/regiones/{region}/", 3),
+        ("/api/regiones/{region}/paises/", 2),
+        ("/api/regiones/{region}/paquetes/", 2),
+        ("/api/paises-region/", 1),
+        ("/api/paises-region/{pais}/", 2),
+        ("/api/paises-region/{pais}/ciudades/", 2),
+        ("/api/paises-region/{pais}/paquetes/", 2),
+        ("/api/ciudades/", 1),
+        ("/api/aerolineas/", 1),
+        ("/api/aerolineas/{aerolinea}/vuelos/", 2),
+        ("/api/aeropuertos/", 1),
+        ("/api/vuelos/", 3),  # + version y resumen de fecha_actualizacion para el ETag
+        ("/api/vuelos/destacados/", 3),
+        ("/api/destinos/", 3),  # + version y resumen de fecha_actualizacion para el ETag
+        ("/api/destinos/destacados/", 3),
+        ("/api/paquetes/", 3),  # + version y resumen de fecha_actualizacion para el ETag
+        ("/api/paquetes/destacados/", 3),
+        ("/api/paquetes/por_region/", 2),
+        ("/api/clientes/", 2),
+        ("/api/tipos-paquete/", 1),
+        ("/api/temporadas/", 1),
+    )
+
+    def setUp(self):
+        self.region = Region.objects.create(nombre="caribe", orden=1)
+        self.aerolinea = Aerolinea.objects.create(nombre="Copa", codigo_iata="CM")
+        self.n = 0
+        self._agregar(2)
+        self.client.get("/api/vuelos/destacados/")  # crea ConfiguracionDestacados
+
+    def _agregar(self, cantidad):
+        for _ in range(cantidad):
+            self.n += 1
+            pais = PaisRegion.objects.create(region=self.region, nombre=f"Pais {self.n}",
+                                             codigo_iso=f"P{self.n}")
+            self.pais = pais
+            ciudad = Ciudad.objects.create(pais=pais, nombre=f"Ciudad {self.n}",
+                                           codigo_ciudad=f"C{self.n:02d}")
+            aerolinea = Aerolinea.objects.create(nombre=f"Aero {self.n}", codigo_iata=f"A{self.n}")
+            origen = Aeropuerto.objects.create(codigo_iata=f"O{self.n:02d}", nombre="Origen",
+                                               pais=pais, ciudad=ciudad)
+            destino = Aeropuerto.objects.create(codigo_iata=f"D{self.n:02d}", nombre="Destino",
+                                                pais=pais)
+            for aero in (aerolinea, self.aerolinea):
+                Vuelo.objects.create(aerolinea=aero, origen=origen, destino=destino,
+                                     duracion="1h", precio=Decimal(100), destacado=True)
+            Destino.objects.create(nombre=f"Destino {self.n}", pais=pais, ciudad=ciudad,
+                                   descripcion="", imagen_url="https://example.com/img.jpg",
+                                   precio_desde=Decimal(100), destacado=True)
+            PaqueteTuristico.objects.create(
+                titulo=f"Paquete {self.n}", region=self.region, pais_destino=pais,
+                ciudad_destino=ciudad, aerolinea=aerolinea, precio=Decimal(500),
+                duracion_noches=3, salidas="Quito", imagen_url="https://example.com/img.jpg",
+                descripcion_corta="", destacado=True,
+            )
+            cliente = Cliente.objects.create(nombre_completo="Cliente", telefono="099",
+                                             email=f"c{self.n}@example.com")
+            Solicitud.objects.create(cliente=cliente, mensaje="Hola")
+
+    def _urls(self):
+        ids = {"region": self.region.pk, "pais": self.pais.pk, "aerolinea": self.aerolinea.pk}
+        return {url.format(**ids): consultas for url, consultas in self.LISTADOS}
+
+    def test_listados_con_consultas_constantes(self):
+        for cantidad in (0, 5):
+            self._agregar(cantidad)
+            for url, consultas in self._urls().items():
+                with self.subTest(url=url, filas=self.n), self.assertNumQueries(consultas):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_conteos_anotados(self):
+        regiones = self.client.get("/api/regiones/").json()
+        self.assertEqual(regiones[0]["cantidad_paises"], 2)
+        self.assertEqual(regiones[0]["cantidad_paquetes"], 2)
+        aerolinea = next(a for a in self.client.get("/api/aerolineas/").json()
+                         if a["codigo_iata"] == "CM")
+        self.assertEqual(aerolinea["cantidad_vuelos"], 2)
+        pais = self.client.get("/api/paises-region/").json()[0]
+        self.assertEqual(pais["cantidad_ciudades"], 1)
+        # fuera de un listado anotado se sigue contando
+        self.assertEqual(self.client.get("/api/aerolineas/buscar_iata/?codigo=CM").json()["cantidad_vuelos"], 2)
+
+
+class CatalogoCacheTest(TestCase):
+    """Respuestas del catálogo cacheadas por versión, con ETag/Last-Modified y 304."""
+
+    URL = "/api/paises-region/"
+
+    def setUp(self):
+        cache.clear()
+        self.region = Region.objects.create(nombre="caribe", orden=1)
+        self.pais = PaisRegion.objects.create(region=self.region, nombre="México", codigo_iso="MX")
+
+    def test_segundo_get_sale_de_cache(self):
+        primera = self.client.get(self.URL)
+        self.assertEqual(primera["X-Cache"], "MISS")
+        with self.assertNumQueries(1):  # solo la version del catalogo
+            segunda = self.client.get(self.URL)
+        self.assertEqual(segunda["X-Cache"], "HIT")
+        self.assertEqual(segunda.content, primera.content)
+        self.assertEqual(segunda["ETag"], primera["ETag"])
+        self.assertEqual(segunda["Cache-Control"], "no-cache")
+        self.assertIn("Last-Modified", segunda)
+
+    def test_query_params_en_la_clave(self):
+        self.client.get(self.URL)
+        self.assertEqual(self.client.get(self.URL, {"region": self.region.pk})["X-Cache"], "MISS")
+
+    def test_if_none_match_y_if_modified_since_responden_304(self):
+        primera = self.client.get(self.URL)
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=primera["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        response = self.client.get(self.URL, HTTP_IF_MODIFIED_SINCE=primera["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH='"otro"').status_code, 200)
+
+    def test_guardar_en_el_admin_invalida(self):
+        primera = self.client.get(self.URL)
+        self.pais.capital = "Ciudad de México"
+        self.pais.save()
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=primera["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()[0]["capital"], "Ciudad de México")
+
+    def test_api_navegable_no_se_cachea(self):
+        self.client.get(self.URL, HTTP_ACCEPT="text/html")
+        self.assertNotIn("X-Cache", self.client.get(self.URL, HTTP_ACCEPT="text/html"))
+
+    @override_settings(CATALOGO_CACHE_TTL=0)
+    def test_etag_por_fecha_actualizacion_sin_serializar(self):
+        destino = Destino.objects.create(nombre="Cancún", descripcion="", precio_desde=Decimal(100),
+                                         imagen_url="https://example.com/img.jpg")
+        url = f"/api/destinos/{destino.pk}/"
+        for ruta, consultas in ((url, 2), ("/api/destinos/", 2)):  # + version
+            etag = self.client.get(ruta)["ETag"]
+            with self.subTest(ruta=ruta), self.assertNumQueries(consultas), \
+                    patch("servicios.views.DestinoSerializer.to_representation") as serializar:
+                response = self.client.get(ruta, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+            serializar.assert_not_called()
+
+        etag = self.client.get(url)["ETag"]
+        destino.precio_desde = Decimal(90)
+        destino.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_etag_por_fecha_se_guarda_en_la_cache(self):
+        destino = Destino.objects.create(nombre="Cancún", descripcion="", precio_desde=Decimal(100),
+                                         imagen_url="https://example.com/img.jpg")
+        url = f"/api/destinos/{destino.pk}/"
+        primera = self.client.get(url)
+        segunda = self.client.get(url)
+        self.assertEqual(segunda["X-Cache"], "HIT")
+        self.assertEqual(segunda["ETag"], primera["ETag"])
+
+    def test_version_en_la_bd_la_comparten_los_workers(self):
+        self.client.get(self.URL)
+        # Otro worker invalida: su cache local no es esta, pero la version es la misma fila
+        VersionCatalogo.objects.update(version=F("version") + 1)
+        self.assertEqual(self.client.get(self.URL)["X-Cache"], "MISS")
+
+    def test_hit_pasa_por_los_permisos_de_drf(self):
+        from rest_framework.permissions import IsAuthenticated
+
+        from .views import PaisRegionViewSet
+
+        self.assertEqual(self.client.get(self.URL)["X-Cache"], "MISS")
+        with patch.object(PaisRegionViewSet, "permission_classes", [IsAuthenticated]):
+            response = self.client.get(self.URL)
+        self.assertIn(response.status_code, (401, 403))
+        self.assertNotIn("X-Cache", response)
+        self.assertEqual(self.client.get(self.URL)["X-Cache"], "HIT")
+
+    @override_settings(CATALOGO_CACHE_TTL=0)
+    def test_ttl_cero_desactiva(self):
+        self.client.get(self.URL)
+        response = self.client.get(self.URL)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertIn("ETag", response)
+
+
+class ArbolGeograficoTest(TestCase):
+    """/api/regiones/arbol/: tres consultas, cache versionada e invalidación por señales."""
+
+    URL = "/api/regiones/arbol/"
+
+    def setUp(self):
+        cache.clear()
+        self.caribe = Region.objects.create(nombre="caribe", orden=1)
+        Region.objects.create(nombre="europa", orden=2, activo=False)
+        self.pais = PaisRegion.objects.create(region=self.caribe, nombre="México", codigo_iso="MX",
+                                              bandera_png="https://flagcdn.com/w320/mx.png")
+        PaisRegion.objects.create(region=self.caribe, nombre="Cuba", activo=False)
+        self.cancun = Ciudad.objects.create(pais=self.pais, nombre="Cancún", codigo_ciudad="CUN")
+        Ciudad.objects.create(pais=self.pais, nombre="México DF", codigo_ciudad="MEX", es_capital=True)
+        self.paquete = self._paquete()
+        self._paquete(precio_aplica_hasta=timezone.localdate() - timedelta(days=1))
+
+    def _paquete(self, **extra):
+        return PaqueteTuristico.objects.create(
+            titulo="Cancún", region=self.caribe, pais_destino=self.pais,
+            ciudad_destino=self.cancun, precio=Decimal(500), duracion_noches=3, salidas="Quito",
+            imagen_url="https://example.com/img.jpg", descripcion_corta="", **extra,
+        )
+
+    def test_arbol_con_conteos(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Cache"], "MISS")
+        arbol = response.json()
+        self.assertEqual([r["nombre"] for r in arbol], ["caribe"])
+        region = arbol[0]
+        self.assertEqual(region["nombre_display"], "Caribe")
+        self.assertEqual((region["cantidad_paises"], region["cantidad_paquetes"]), (1, 1))
+        pais = region["paises"][0]
+        self.assertEqual(pais["bandera_url"], "https://flagcdn.com/w320/mx.png")
+        self.assertEqual((pais["cantidad_ciudades"], pais["cantidad_paquetes"]), (2, 1))
+        # capital primero; el paquete vencido no cuenta
+        self.assertEqual([(c["codigo_ciudad"], c["cantidad_paquetes"]) for c in pais["ciudades"]],
+                         [("MEX", 0), ("CUN", 1)])
+
+    def test_tres_consultas_y_luego_cache(self):
+        with self.assertNumQueries(4):  # + version del catalogo
+            self.client.get(self.URL)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.URL)
+        self.assertEqual(response["X-Cache"], "HIT")
+
+    def test_guardar_o_borrar_invalida(self):
+        self.client.get(self.URL)
+        self.cancun.nombre = "Cancún Centro"
+        self.cancun.save()
+        response = self.client.get(self.URL)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertIn("Cancún Centro", response.content.decode())
+        self.paquete.delete()
+        self.assertEqual(self.client.get(self.URL).json()[0]["cantidad_paquetes"], 0)
+
+    def test_sincronizar_vigencia_invalida(self):
+        self.client.get(self.URL)
+        PaqueteTuristico.objects.filter(pk=self.paquete.pk).update(
+            precio_aplica_hasta=timezone.localdate() - timedelta(days=1))
+        PaqueteTuristico.sincronizar_vigencia()
+        self.assertEqual(self.client.get(self.URL)["X-Cache"], "MISS")
+
+
 class DestinoViewSetFilterTest(TestCase):
     def setUp(self):
         self.region = Region.objects.create(nombre="sudamerica", orden=1)
@@ -749,6 +2264,31 @@ class PaqueteTuristicoViewSetFilterTest(TestCase):
         qs = PaqueteTuristico.objects.filter(activo=True, temporada__nombre__iexact="Temporada Alta")
         self.assertEqual(qs.count(), 1)
 
+    def _vencer_p1(self):
+        PaqueteTuristico.objects.filter(pk=self.p1.pk).update(
+            precio_aplica_hasta=timezone.localdate() - timedelta(days=1))
+
+    def test_vigentes_excluye_vencidos_aunque_sigan_activos(self):
+        self.assertEqual(list(PaqueteTuristico.objects.vigentes()), [self.p1])
+        self._vencer_p1()
+        self.assertFalse(PaqueteTuristico.objects.vigentes().exists())
+
+    def test_lecturas_del_catalogo_no_escriben(self):
+        self._vencer_p1()
+        ConfiguracionDestacados.load()  # crearla sube la version del catalogo
+        for url in ("/api/paquetes/", "/api/paquetes/destacados/", "/api/paquetes/por_region/",
+                    f"/api/regiones/{self.region.pk}/paquetes/"):
+            with CaptureQueriesContext(connection) as ctx:
+                r = self.client.get(url)
+            self.assertEqual(r.status_code, 200)
+            self.assertNotIn("Punta Cana", r.content.decode())
+            self.assertFalse(any(q["sql"].lstrip().upper().startswith("UPDATE")
+                                 for q in ctx.captured_queries), url)
+        # el barrido programado es el que actualiza 'activo'
+        self.p1.refresh_from_db()
+        self.assertTrue(self.p1.activo)
+        self.assertEqual(PaqueteTuristico.sincronizar_vigencia(), (1, 0))
+
 
 class VueloViewSetFilterTest(TestCase):
     def setUp(self):
@@ -22,8 +22,16 @@ urlpatterns = [
     path('', include(router.urls)),
     path('contacto/', views.contacto, name='contacto'),
     path('buscar-vuelos-live/', views.BuscadorVuelosSabreView.as_view(), name='buscar_vuelos_live'),
+    path('buscar-vuelos-live/<str:sesion>/', views.BuscadorVuelosSesionView.as_view(), name='buscar_vuelos_sesion'),
+    path('buscar-vuelos-flexible/', views.CalendarioTarifasView.as_view(), name='buscar_vuelos_flexible'),
     path('revalidar-vuelo/', views.RevalidarVueloView.as_view(), name='revalidar_vuelo'),
+    path('revalidar-vuelos/', views.RevalidarLoteView.as_view(), name='revalidar_vuelos'),
     path('seatmap/', views.SeatMapView.as_view(), name='seatmap'),
+    # Variantes async (ASGI): mismo contrato, sin bloquear un worker por llamada a Sabre
+    path('async/buscar-vuelos-live/', views.BuscadorVuelosSabreAsyncView.as_view(), name='buscar_vuelos_live_async'),
+    path('async/revalidar-vuelo/', views.RevalidarVueloAsyncView.as_view(), name='revalidar_vuelo_async'),
+    path('async/revalidar-vuelos/', views.RevalidarLoteAsyncView.as_view(), name='revalidar_vuelos_async'),
+    path('async/seatmap/', views.SeatMapAsyncView.as_view(), name='seatmap_async'),
     path('booking/checkout/', views.BookingCheckoutView.as_view(), name='booking_checkout'),
     path('booking/confirm/',  views.BookingConfirmView.as_view(),  name='booking_confirm'),
     path('booking/webhook/',  views.StripeWebhookView.as_view(),   name='booking_webhook'),
@@ -35,6 +43,7 @@ urlpatterns = [
     path('chatbot/', views.ChatbotView.as_view(), name='chatbot'),
     path('health/', views.health_check, name='health_check'),
     path('admin-notificaciones/', views.admin_notificaciones, name='admin_notificaciones'),
+    path('admin-metricas-cache/', views.admin_metricas_cache, name='admin_metricas_cache'),
     path('seed/', views.seed_database, name='seed_database'),
     # Endpoints AJAX para admin
     path('admin-ajax/paises-por-region/<int:region_id>/', views.paises_por_region, name='ajax_paises'),
@@ -1,9 +1,16 @@
 from rest_framework import viewsets, status
-from django.db.models import Count, Q
+from django.db.models import Count, Prefetch, Q
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework.views import APIView
-from .searchFlights import buscar_vuelos_sabre
-from .revalidateFlight import revalidar_itinerario
+from . import jsonRapido
+from .jsonRapido import JSONRapidoMixin, JsonRapidoResponse
+from .resultadosBusqueda import consultar_sesion_busqueda, pagina_de_resultados
+from .searchFlights import buscar_vuelos_sabre_con_estado, buscar_vuelos_sabre_stream, sesion_busqueda
+from .revalidateFlight import revalidar_itinerario_con_estado, revalidar_lote
 from .seatMapFlight import obtener_mapa_asientos
+from .seatMapCompacto import compactar_mapa
+from .arbolGeografico import arbol_geografico
+from .cacheCatalogo import CatalogoCacheMixin, etag_fuerte, marcar_etag, no_modificado
 from .bookingFlight import crear_checkout, confirmar_reserva, obtener_reserva_guardada
 from .bookingPaquete import (
     crear_checkout_paquete, confirmar_reserva_paquete,
@@ -26,7 +33,7 @@ from .serializers import (
 
 class ClienteViewSet(viewsets.ModelViewSet):
     """ViewSet para ver y editar clientes"""
-    queryset = Cliente.objects.all()
+    queryset = Cliente.objects.prefetch_related('solicitudes')
     serializer_class = ClienteSerializer
 
 
@@ -68,9 +75,32 @@ def contacto(request):
     }, status=status.HTTP_400_BAD_REQUEST)
 
 
-class DestinoViewSet(viewsets.ModelViewSet):
+# Relaciones que leen los serializers; se cargan con select_related para que
+# los listados hagan un número constante de consultas (ver QueryCountTest).
+_VUELO_RELACIONES = ('aerolinea', 'origen__pais', 'origen__ciudad', 'destino__pais', 'destino__ciudad')
+_PAQUETE_RELACIONES = ('region', 'pais_destino', 'ciudad_destino', 'aerolinea',
+                       'tipo_paquete', 'temporada', 'tipo_viaje')
+
+
+def _paises_con_conteos(queryset):
+    """Anota 'cantidad_ciudades' (la lee PaisRegion*Serializer)."""
+    return queryset.select_related('region').annotate(
+        cantidad_ciudades=Count('ciudades', filter=Q(ciudades__activo=True)),
+    )
+
+
+def _regiones_con_conteos(queryset):
+    """Anota 'cantidad_paises' y 'cantidad_paquetes' (paquetes vigentes) para Region*Serializer."""
+    return queryset.annotate(
+        cantidad_paises=Count('paises', filter=Q(paises__activo=True), distinct=True),
+        cantidad_paquetes=Count('paquetes', distinct=True,
+                                filter=PaqueteTuristico.objects.condicion_vigente('paquetes__')),
+    )
+
+
+class DestinoViewSet(CatalogoCacheMixin, viewsets.ModelViewSet):
     """ViewSet para destinos turísticos"""
-    queryset = Destino.objects.filter(activo=True)
+    queryset = Destino.objects.filter(activo=True).select_related('pais', 'ciudad')
     serializer_class = DestinoSerializer
 
     def get_queryset(self):
@@ -97,7 +127,7 @@ class DestinoViewSet(viewsets.ModelViewSet):
             configuracion=config,
             destino__activo=True,
             destino__destacado=True
-        ).select_related('destino')
+        ).select_related('destino__pais', 'destino__ciudad')
         
         ordenados = []
         ordered_ids = []
@@ -113,9 +143,9 @@ class DestinoViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class VueloViewSet(viewsets.ModelViewSet):
+class VueloViewSet(CatalogoCacheMixin, viewsets.ModelViewSet):
     """ViewSet para vuelos"""
-    queryset = Vuelo.objects.filter(disponible=True)
+    queryset = Vuelo.objects.filter(disponible=True).select_related(*_VUELO_RELACIONES)
     serializer_class = VueloSerializer
     
     def get_queryset(self):
@@ -145,7 +175,7 @@ class VueloViewSet(viewsets.ModelViewSet):
             configuracion=config,
             vuelo__disponible=True,
             vuelo__destacado=True
-        ).select_related('vuelo')
+        ).select_related(*(f'vuelo__{r}' for r in _VUELO_RELACIONES))
         
         ordenados = []
         ordered_ids = []
@@ -165,16 +195,23 @@ class VueloViewSet(viewsets.ModelViewSet):
 # VIEWSETS PARA PAQUETES TURÍSTICOS
 # =====================================================
 
-class RegionViewSet(viewsets.ReadOnlyModelViewSet):
+class RegionViewSet(CatalogoCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet para regiones (solo lectura)"""
     
     # 1. OPTIMIZACIÓN DE CONSULTA (SQL):
-    # Usamos annotate para que la base de datos cuente los países y paquetes.
-    # Esto evita traer los objetos a memoria.
-    queryset = Region.objects.annotate(
-        total_paises=Count('paises', distinct=True),
-        total_paquetes=Count('paquetes', distinct=True)
-    ).filter(activo=True).order_by('orden')
+    # Usamos annotate para que la base de datos cuente los países y paquetes
+    # (los serializers leen 'cantidad_*' en vez de hacer un COUNT por región).
+    queryset = Region.objects.filter(activo=True).order_by('orden')
+
+    def get_queryset(self):
+        queryset = _regiones_con_conteos(super().get_queryset())
+        if self.action == 'retrieve':
+            # Detalle: países anidados con sus ciudades
+            queryset = queryset.prefetch_related(Prefetch(
+                'paises',
+                queryset=_paises_con_conteos(PaisRegion.objects.all()).prefetch_related('ciudades'),
+            ))
+        return queryset
     
     # 2. SELECCIÓN DINÁMICA DE SERIALIZER:
     def get_serializer_class(self):
@@ -184,25 +221,37 @@ class RegionViewSet(viewsets.ReadOnlyModelViewSet):
         # Si es para ver un detalle (api/regiones/1/), usa el pesado
         return RegionSerializer
 
+    @action(detail=False, methods=['get'])
+    def arbol(self, request):
+        """Árbol región -> países -> ciudades con conteos de paquetes vigentes.
+
+        Se arma con tres consultas y se sirve desde la cache ya serializado
+        (ver arbolGeografico.py); cambia al guardar regiones, países,
+        ciudades o paquetes.
+        """
+        contenido, estado_cache = arbol_geografico(version=self._version_catalogo())
+        response = HttpResponse(contenido, content_type='application/json')
+        response["X-Cache"] = estado_cache.upper()
+        return response
+
     @action(detail=True, methods=['get'])
     def paises(self, request, pk=None):
         """Obtener países de una región específica"""
         region = self.get_object()
-        paises = region.paises.filter(activo=True)
+        paises = _paises_con_conteos(region.paises.filter(activo=True))
         serializer = PaisRegionListSerializer(paises, many=True)
         return Response(serializer.data)
     
     @action(detail=True, methods=['get'])
     def paquetes(self, request, pk=None):
         """Obtener paquetes de una región específica"""
-        PaqueteTuristico.sincronizar_vigencia()
         region = self.get_object()
-        paquetes = region.paquetes.filter(activo=True)
+        paquetes = region.paquetes.vigentes().select_related(*_PAQUETE_RELACIONES)
         serializer = PaqueteTuristicoListSerializer(paquetes, many=True)
         return Response(serializer.data)
 
 
-class PaisRegionViewSet(viewsets.ReadOnlyModelViewSet):
+class PaisRegionViewSet(CatalogoCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet para países/destinos de regiones (solo lectura)"""
     queryset = PaisRegion.objects.filter(activo=True)
     
@@ -212,7 +261,9 @@ class PaisRegionViewSet(viewsets.ReadOnlyModelViewSet):
         return PaisRegionListSerializer
     
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = _paises_con_conteos(super().get_queryset())
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related('ciudades')
         region_id = self.request.query_params.get('region', None)
         if region_id:
             queryset = queryset.filter(region_id=region_id)
@@ -222,23 +273,22 @@ class PaisRegionViewSet(viewsets.ReadOnlyModelViewSet):
     def ciudades(self, request, pk=None):
         """Obtener ciudades de un país específico"""
         pais = self.get_object()
-        ciudades = pais.ciudades.filter(activo=True)
+        ciudades = pais.ciudades.filter(activo=True).select_related('pais__region')
         serializer = CiudadSerializer(ciudades, many=True)
         return Response(serializer.data)
     
     @action(detail=True, methods=['get'])
     def paquetes(self, request, pk=None):
         """Obtener paquetes de un país específico"""
-        PaqueteTuristico.sincronizar_vigencia()
         pais = self.get_object()
-        paquetes = pais.paquetes.filter(activo=True)
+        paquetes = pais.paquetes.vigentes().select_related(*_PAQUETE_RELACIONES)
         serializer = PaqueteTuristicoListSerializer(paquetes, many=True)
         return Response(serializer.data)
 
 
-class CiudadViewSet(viewsets.ReadOnlyModelViewSet):
+class CiudadViewSet(CatalogoCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet para ciudades (solo lectura)"""
-    queryset = Ciudad.objects.filter(activo=True)
+    queryset = Ciudad.objects.filter(activo=True).select_related('pais__region')
     serializer_class = CiudadSerializer
     
     def get_queryset(self):
@@ -256,13 +306,13 @@ class CiudadViewSet(viewsets.ReadOnlyModelViewSet):
         return queryset
 
 
-class AerolineaViewSet(viewsets.ReadOnlyModelViewSet):
+class AerolineaViewSet(CatalogoCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet para aerolíneas (solo lectura)"""
     queryset = Aerolinea.objects.filter(activo=True)
     serializer_class = AerolineaSerializer
     
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().annotate(cantidad_vuelos=Count('vuelos'))
         pais = self.request.query_params.get('pais', None)
         search = self.request.query_params.get('search', None)
         
@@ -280,7 +330,7 @@ class AerolineaViewSet(viewsets.ReadOnlyModelViewSet):
     def vuelos(self, request, pk=None):
         """Obtener vuelos de una aerolínea específica"""
         aerolinea = self.get_object()
-        vuelos = aerolinea.vuelos.filter(disponible=True)
+        vuelos = aerolinea.vuelos.filter(disponible=True).select_related(*_VUELO_RELACIONES)
         serializer = VueloSerializer(vuelos, many=True)
         return Response(serializer.data)
     
@@ -303,9 +353,9 @@ class AerolineaViewSet(viewsets.ReadOnlyModelViewSet):
             return Response({'error': f'Aerolínea con código IATA "{codigo}" no encontrada'}, status=404)
 
 
-class AeropuertoViewSet(viewsets.ReadOnlyModelViewSet):
+class AeropuertoViewSet(CatalogoCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet para aeropuertos (solo lectura)"""
-    queryset = Aeropuerto.objects.filter(activo=True)
+    queryset = Aeropuerto.objects.filter(activo=True).select_related('ciudad', 'pais__region')
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -371,21 +421,21 @@ class AeropuertoViewSet(viewsets.ReadOnlyModelViewSet):
         })
 
 
-class TipoPaqueteViewSet(viewsets.ReadOnlyModelViewSet):
+class TipoPaqueteViewSet(CatalogoCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet para tipos de paquete (solo lectura)"""
     queryset = TipoPaquete.objects.filter(activo=True)
     serializer_class = TipoPaqueteSerializer
 
 
-class TemporadaViewSet(viewsets.ReadOnlyModelViewSet):
+class TemporadaViewSet(CatalogoCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet para temporadas (solo lectura)"""
     queryset = Temporada.objects.filter(activo=True)
     serializer_class = TemporadaSerializer
 
 
-class PaqueteTuristicoViewSet(viewsets.ReadOnlyModelViewSet):
+class PaqueteTuristicoViewSet(CatalogoCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet para paquetes turísticos (solo lectura)"""
-    queryset = PaqueteTuristico.objects.filter(activo=True)
+    queryset = PaqueteTuristico.objects.select_related(*_PAQUETE_RELACIONES)
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -393,10 +443,9 @@ class PaqueteTuristicoViewSet(viewsets.ReadOnlyModelViewSet):
         return PaqueteTuristicoListSerializer
     
     def get_queryset(self):
-        # Sincronizar el estado según la fecha de vigencia (desactiva vencidos, reactiva vigentes)
-        PaqueteTuristico.sincronizar_vigencia()
-
-        queryset = super().get_queryset()
+        # Activos y no vencidos (la fecha se evalúa en cada petición, sin escribir;
+        # el barrido 'desactivar_paquetes_vencidos' sincroniza el campo 'activo')
+        queryset = super().get_queryset().vigentes()
         
         # Filtrar por región
         region_id = self.request.query_params.get('region', None)
@@ -438,16 +487,13 @@ class PaqueteTuristicoViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'])
     def destacados(self, request):
         """Obtener paquetes destacados (ordenados según admin general y limitados)"""
-        # Sincronizar el estado según la fecha de vigencia (desactiva vencidos, reactiva vigentes)
-        PaqueteTuristico.sincronizar_vigencia()
-
         config = ConfiguracionDestacados.load()
         
         ordenados_qs = OrdenPaqueteDestacado.objects.filter(
+            PaqueteTuristico.objects.condicion_vigente('paquete__'),
             configuracion=config,
-            paquete__activo=True,
             paquete__destacado=True
-        ).select_related('paquete')
+        ).select_related(*(f'paquete__{r}' for r in _PAQUETE_RELACIONES))
         
         ordenados = []
         ordered_ids = []
@@ -465,26 +511,70 @@ class PaqueteTuristicoViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'])
     def por_region(self, request):
         """Obtener paquetes agrupados por región"""
-        # Sincronizar el estado según la fecha de vigencia (desactiva vencidos, reactiva vigentes)
-        PaqueteTuristico.sincronizar_vigencia()
-
-        regiones = Region.objects.filter(activo=True)
+        # Máximo 6 paquetes por región, precargados en una sola consulta
+        regiones = _regiones_con_conteos(Region.objects.filter(activo=True)).prefetch_related(Prefetch(
+            'paquetes',
+            queryset=PaqueteTuristico.objects.vigentes().select_related(*_PAQUETE_RELACIONES)[:6],
+            to_attr='paquetes_vigentes',
+        ))
         resultado = []
         
         for region in regiones:
-            paquetes = region.paquetes.filter(activo=True)[:6]  # Máximo 6 por región
-            if paquetes.exists():
+            if region.paquetes_vigentes:
                 resultado.append({
                     'region': RegionListSerializer(region).data,
-                    'paquetes': PaqueteTuristicoListSerializer(paquetes, many=True).data
+                    'paquetes': PaqueteTuristicoListSerializer(region.paquetes_vigentes, many=True).data
                 })
         
         return Response(resultado)
     
-class BuscadorVuelosSabreView(APIView):
+_STREAM_CONTENT_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+def _evento_stream(formato, tipo, datos):
+    """Una línea NDJSON ({"tipo": ..., **datos}) o un evento SSE."""
+    if formato == "sse":
+        return b"event: " + tipo.encode() + b"\ndata: " + jsonRapido.dumps(datos) + b"\n\n"
+    return jsonRapido.dumps({"tipo": tipo, **datos}) + b"\n"
+
+
+def _respuesta_busqueda_stream(data, formato):
+    itinerarios, estado_cache = buscar_vuelos_sabre_stream(data)
+    if isinstance(itinerarios, dict):
+        return Response(itinerarios, status=itinerarios.get("code", 500))
+    sesion = sesion_busqueda(data)
+
+    def _eventos():
+        total = 0
+        try:
+            for opcion in itinerarios:
+                total += 1
+                yield _evento_stream(formato, "itinerario", {"itinerario": opcion})
+        except (KeyError, TypeError, ValueError, IndexError) as e:
+            yield _evento_stream(formato, "error", {"error": f"Error procesando respuesta: {e}"})
+            return
+        yield _evento_stream(formato, "fin", {"total": total, "sesion": sesion})
+
+    response = StreamingHttpResponse(_eventos(), content_type=_STREAM_CONTENT_TYPES[formato])
+    response["X-Cache"] = estado_cache.upper()
+    response["X-Search-Session"] = sesion
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+class BuscadorVuelosSabreView(JSONRapidoMixin, APIView):
     """
     Endpoint para buscar vuelos en tiempo real usando Sabre BFM.
     Llama a tu archivo searchFlights.py
+
+    Con ?stream=ndjson o ?stream=sse (o "stream" en el body) los itinerarios
+    se envían uno a uno a medida que se normalizan, en el orden de Sabre.
+
+    La cabecera X-Search-Session identifica los resultados cacheados; con
+    ella BuscadorVuelosSesionView devuelve páginas filtradas sin volver a
+    Sabre. Si la búsqueda trae ?por_pagina=N (o "por_pagina" en el body) la
+    respuesta ya es la primera página en ese mismo formato.
     """
     def post(self, request):
         # Datos que vienen del frontend
@@ -497,18 +587,55 @@ class BuscadorVuelosSabreView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Llamada a tu archivo searchFlights.py
-        resultados = buscar_vuelos_sabre(data)
+        formato = str(request.query_params.get("stream") or data.get("stream") or "").lower()
+        if formato in _STREAM_CONTENT_TYPES:
+            return _respuesta_busqueda_stream(data, formato)
+
+        # Llamada a tu archivo searchFlights.py (pasa por la cache compartida)
+        resultados, estado_cache = buscar_vuelos_sabre_con_estado(data)
 
         # Manejo de errores
         if isinstance(resultados, dict) and "error" in resultados:
             codigo = resultados.get("code", 500)
             return Response(resultados, status=codigo)
 
-        return Response(resultados, status=status.HTTP_200_OK)
+        sesion = sesion_busqueda(data)
+        if request.query_params.get("por_pagina") or data.get("por_pagina"):
+            cuerpo = data.dict() if hasattr(data, "dict") else data
+            parametros = {**cuerpo, **request.query_params.dict()}
+            resultados = pagina_de_resultados(resultados, parametros, sesion)
+            if "error" in resultados:
+                return Response(resultados, status=resultados.pop("code"))
+
+        response = Response(resultados, status=status.HTTP_200_OK)
+        response["X-Cache"] = estado_cache.upper()
+        response["X-Search-Session"] = sesion
+        return response
+
+
+class BuscadorVuelosSesionView(JSONRapidoMixin, APIView):
+    """Filtra, ordena y pagina los resultados cacheados de una búsqueda.
+
+    GET /api/buscar-vuelos-live/<sesion>/?max_escalas=0&aerolineas=AA,LA
+        &precio_max=800&salida_desde=06:00&orden=precio&pagina=2&por_pagina=20
+
+    No consulta a Sabre: si la sesión expiró responde 404 y el frontend debe
+    repetir la búsqueda. Parámetros en servicios/resultadosBusqueda.py.
+    """
+
+    def get(self, request, sesion):
+        resultado = consultar_sesion_busqueda(sesion, request.query_params)
+        if "error" in resultado:
+            return Response(resultado, status=resultado.pop("code"))
+        return Response(resultado, status=status.HTTP_200_OK)
+
 
+def _forzar_revalidacion(query_params, data):
+    valor = query_params.get("forzar") or data.get("forzar")
+    return str(valor).lower() in ("true", "1", "t", "yes")
 
-class RevalidarVueloView(APIView):
+
+class RevalidarVueloView(JSONRapidoMixin, APIView):
     """Confirma si un itinerario sigue disponible para reservar.
 
     Body esperado:
@@ -534,6 +661,10 @@ class RevalidarVueloView(APIView):
 
     Tambien acepta directamente el objeto "opcion" devuelto por la busqueda
     (usa los subcampos salida/llegada/aerolinea/vuelo).
+
+    Las revalidaciones recientes del mismo itinerario salen de la cache
+    (cabecera X-Cache). Antes del checkout enviar "forzar": true (o ?forzar=1)
+    para consultar siempre a Sabre.
     """
 
     def post(self, request):
@@ -544,14 +675,38 @@ class RevalidarVueloView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        resultado = revalidar_itinerario(data)
+        resultado, estado_cache = revalidar_itinerario_con_estado(
+            data, forzar=_forzar_revalidacion(request.query_params, data)
+        )
         codigo = resultado.pop("code", None)
         if resultado.get("disponible"):
-            return Response(resultado, status=status.HTTP_200_OK)
-        return Response(resultado, status=codigo or status.HTTP_409_CONFLICT)
+            response = Response(resultado, status=status.HTTP_200_OK)
+        else:
+            response = Response(resultado, status=codigo or status.HTTP_409_CONFLICT)
+        response["X-Cache"] = estado_cache.upper()
+        return response
+
+
+class RevalidarLoteView(JSONRapidoMixin, APIView):
+    """Revalida varios itinerarios en una sola llamada (p. ej. los primeros
+    resultados de la búsqueda).
 
+    Body: {"adults": 1, "children": 0, "infants": 0, "forzar": false,
+           "opciones": [ {...opcion de la busqueda...}, ... ]}
+    Máximo SABRE_REVALIDATE_BATCH_MAX opciones; se consultan en paralelo
+    (SABRE_REVALIDATE_BATCH_WORKERS). Responde 200 con un resultado por
+    opción en el mismo orden, cada uno con su "disponible".
+    """
 
-class SeatMapView(APIView):
+    def post(self, request):
+        data = request.data or {}
+        resultado = revalidar_lote(data, forzar=_forzar_revalidacion(request.query_params, data))
+        if "error" in resultado:
+            return Response(resultado, status=resultado.pop("code"))
+        return Response(resultado, status=status.HTTP_200_OK)
+
+
+class SeatMapView(JSONRapidoMixin, APIView):
     """Devuelve el mapa de asientos de un itinerario via Sabre Get Seats.
 
     Body esperado:
@@ -560,8 +715,12 @@ class SeatMapView(APIView):
       "pasajeros": [
         {"passengerType":"ADT", "givenName":"JUAN", "surname":"PEREZ"}
       ],
-      "moneda": "USD"                  // opcional
+      "moneda": "USD",                 // opcional
+      "desde_version": "..."           // opcional: solo asientos cambiados
     }
+
+    Con ?formato=compacto los asientos viajan en tablas y cadenas por fila
+    (ver servicios/seatMapCompacto.py).
     """
 
     def post(self, request):
@@ -575,9 +734,153 @@ class SeatMapView(APIView):
         codigo = resultado.pop("code", None)
         if codigo and codigo != 200:
             return Response(resultado, status=codigo)
+        if request.query_params.get("formato") == "compacto":
+            resultado = compactar_mapa(resultado)
         return Response(resultado, status=status.HTTP_200_OK)
 
 
+# =====================================================
+# VARIANTES ASYNC (ASGI) DE BÚSQUEDA / REVALIDACIÓN / SEATMAP
+# =====================================================
+# Mismo contrato que las vistas de arriba, pero la espera a Sabre no ocupa
+# un worker: bajo ASGI (uvicorn) un proceso atiende cientos de búsquedas
+# concurrentes. Son vistas Django puras porque APIView de DRF es síncrona.
+
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from .revalidateFlight import revalidar_itinerario_async, revalidar_lote_async
+from .searchFlights import buscar_vuelos_sabre_async
+from .seatMapFlight import obtener_mapa_asientos_async
+
+
+def _leer_json(request):
+    try:
+        data = jsonRapido.loads(request.body or b"{}")
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class BuscadorVuelosSabreAsyncView(View):
+    """Versión async de BuscadorVuelosSabreView."""
+
+    async def post(self, request):
+        data = _leer_json(request)
+        if not data or not data.get("origin") or not data.get("destination") or not data.get("date"):
+            return JsonResponse(
+                {"error": "Faltan datos obligatorios (origin, destination, date)"},
+                status=400,
+            )
+
+        resultados, estado_cache = await buscar_vuelos_sabre_async(data)
+        if isinstance(resultados, dict) and "error" in resultados:
+            return JsonRapidoResponse(resultados, status=resultados.get("code", 500))
+
+        response = JsonRapidoResponse(resultados)
+        response["X-Cache"] = estado_cache.upper()
+        response["X-Search-Session"] = sesion_busqueda(data)
+        return response
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class RevalidarVueloAsyncView(View):
+    """Versión async de RevalidarVueloView."""
+
+    async def post(self, request):
+        data = _leer_json(request) or {}
+        if not data.get("tramos"):
+            return JsonResponse(
+                {"disponible": False, "error": "Faltan los tramos del itinerario"},
+                status=400,
+            )
+
+        resultado, estado_cache = await revalidar_itinerario_async(
+            data, forzar=_forzar_revalidacion(request.GET, data)
+        )
+        codigo = resultado.pop("code", None)
+        response = JsonRapidoResponse(
+            resultado, status=200 if resultado.get("disponible") else codigo or 409
+        )
+        response["X-Cache"] = estado_cache.upper()
+        return response
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class RevalidarLoteAsyncView(View):
+    """Versión async de RevalidarLoteView."""
+
+    async def post(self, request):
+        data = _leer_json(request) or {}
+        resultado = await revalidar_lote_async(data, forzar=_forzar_revalidacion(request.GET, data))
+        if "error" in resultado:
+            return JsonRapidoResponse(resultado, status=resultado.pop("code"))
+        return JsonRapidoResponse(resultado)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class SeatMapAsyncView(View):
+    """Versión async de SeatMapView."""
+
+    async def post(self, request):
+        data = _leer_json(request) or {}
+        if not (data.get("opcion") or {}).get("tramos"):
+            return JsonResponse({"error": "Falta 'opcion' con sus 'tramos'"}, status=400)
+
+        resultado = await obtener_mapa_asientos_async(data)
+        codigo = resultado.pop("code", None)
+        if codigo and codigo != 200:
+            return JsonRapidoResponse(resultado, status=codigo)
+        if request.GET.get("formato") == "compacto":
+            resultado = compactar_mapa(resultado)
+        return JsonRapidoResponse(resultado)
+
+
+# =====================================================
+# CALENDARIO DE TARIFAS (búsqueda flexible ±N días)
+# =====================================================
+from .fareCalendar import armar_matriz, iterar_calendario, validar_datos_calendario
+
+
+def _flag(valor, default=True):
+    if valor is None:
+        return default
+    return str(valor).strip().lower() not in ("0", "false", "no", "off")
+
+
+class CalendarioTarifasView(APIView):
+    """Precio más bajo por combinación de fechas alrededor de la búsqueda.
+
+    Body: el mismo de /buscar-vuelos-live/ más "dias" (default y máximo
+    SABRE_FLEX_MAX_DAYS). Por defecto responde NDJSON: una línea
+    {"tipo": "celda", ...} por combinación en cuanto termina, y una última
+    {"tipo": "matriz", ...}. Con ?stream=0 devuelve solo la matriz en JSON.
+    """
+
+    def post(self, request):
+        data = request.data.dict() if hasattr(request.data, "dict") else dict(request.data)
+        combinaciones, error = validar_datos_calendario(data)
+        if error:
+            return Response(error, status=error.pop("code"))
+
+        if not _flag(request.query_params.get("stream", data.get("stream"))):
+            return Response(armar_matriz(list(iterar_calendario(data, combinaciones))))
+
+        def _lineas():
+            celdas = []
+            for celda in iterar_calendario(data, combinaciones):
+                celdas.append(celda)
+                yield jsonRapido.dumps({"tipo": "celda", **celda}) + b"\n"
+            yield jsonRapido.dumps({"tipo": "matriz", **armar_matriz(celdas)}) + b"\n"
+
+        response = StreamingHttpResponse(_lineas(), content_type="application/x-ndjson")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # que nginx no acumule el stream
+        return response
+
+
 # =====================================================
 # BOOKING (Stripe Checkout + Sabre createBooking)
 # =====================================================
@@ -652,8 +955,8 @@ class BookingVoucherView(APIView):
     GET  /api/booking/voucher/?session_id=cs_test_...&format=pdf
     GET  /api/booking/voucher/?pnr=ABCDEF&format=html&doc=boletos
     POST /api/booking/voucher/   body: { reserva: {...}, format: "pdf"|"html", doc: "voucher"|"boletos" }
-         (renderiza directamente la reserva enviada por el frontend,
-          útil si la cache del backend ya expiró)
+         (renderiza directamente la reserva enviada por el frontend; el GET
+          ya lee de la BD si la cache expiró, se mantiene por compatibilidad)
 
     format:
       - 'html' (default) -> documento HTML listo para imprimir (window.print()).
@@ -677,11 +980,14 @@ class BookingVoucherView(APIView):
         reserva = obtener_reserva_guardada(clave)
         if not reserva:
             return Response(
-                {"error": "Reserva no encontrada o expirada. "
-                          "Reenvía la reserva por POST para regenerar el documento."},
+                {"error": "Reserva no encontrada."},
                 status=status.HTTP_404_NOT_FOUND,
             )
-        return self._responder(reserva, formato, doc)
+        # ETag del contenido de la reserva: al refrescar la página del voucher
+        # se responde 304 sin volver a renderizar el HTML/PDF
+        etag = etag_fuerte(reserva, formato, doc)
+        return (no_modificado(request, etag, privado=True)
+                or marcar_etag(self._responder(reserva, formato, doc), etag, privado=True))
 
     def post(self, request):
         data = request.data or {}
@@ -793,11 +1099,12 @@ class PaqueteVoucherView(APIView):
         reserva = obtener_reserva_paquete_guardada(clave)
         if not reserva:
             return Response(
-                {"error": "Reserva no encontrada o expirada. "
-                          "Reenvía la reserva por POST para regenerar el documento."},
+                {"error": "Reserva no encontrada."},
                 status=status.HTTP_404_NOT_FOUND,
             )
-        return self._responder(reserva, formato)
+        etag = etag_fuerte(reserva, formato)
+        return (no_modificado(request, etag, privado=True)
+                or marcar_etag(self._responder(reserva, formato), etag, privado=True))
 
     def post(self, request):
         data = request.data or {}
@@ -966,6 +1273,23 @@ def admin_notificaciones(request):
     })
 
 
+@staff_member_required
+def admin_metricas_cache(request):
+    """Contadores de la cache compartida de Sabre (hit/miss/stale/coalesced)
+    y estado de los circuit breakers de este worker."""
+    from .cacheSabre import obtener_metricas
+    from .circuitoSabre import estado_circuitos
+    from .revalidateFlight import CACHE_NAMESPACE_REVALIDACION
+    from .searchFlights import CACHE_NAMESPACE_BUSQUEDA
+    from .seatMapFlight import CACHE_NAMESPACE_SEATMAP
+    metricas = {
+        ns: obtener_metricas(ns)
+        for ns in (CACHE_NAMESPACE_BUSQUEDA, CACHE_NAMESPACE_REVALIDACION, CACHE_NAMESPACE_SEATMAP)
+    }
+    metricas["circuitos"] = estado_circuitos()
+    return JsonResponse(metricas)
+
+
 # =====================================================
 # DASHBOARD DEL ADMIN (métricas de reservas y negocio)
 # =====================================================
@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parents[2]
+if str(RAIZ) not in sys.path:
+    sys.path.insert(0, str(RAIZ))
+sys.path.insert(0, str(Path(__file__).parent))
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "corpodg.settings")
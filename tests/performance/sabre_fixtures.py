@@ -0,0 +1,168 @@
+"""Fixtures de respuestas Sabre BFM (groupedItineraryResponse) para benchmarks.
+
+Si existe ``fixtures/bfm_<N>.json`` (una respuesta real grabada de Sabre
+con N itinerarios, p. ej. capturada con ``--benchmark`` contra CERT) se usa
+esa. Si no, se genera una respuesta sintetica deterministica con la misma
+forma que BFM v5: schedules y legs compartidos entre itinerarios, ida y
+vuelta, escalas, fareComponents con segmentos vacios (surface) y
+fareComponentDescs referenciados.
+"""
+
+import json
+import random
+from itertools import pairwise
+from pathlib import Path
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+TAMANOS = (50, 100, 200)
+
+_AEROPUERTOS = [
+    ("UIO", "UIO", "EC"), ("GYE", "GYE", "EC"), ("BOG", "BOG", "CO"),
+    ("PTY", "PTY", "PA"), ("MIA", "MIA", "US"), ("JFK", "NYC", "US"),
+    ("MAD", "MAD", "ES"), ("LIM", "LIM", "PE"), ("MEX", "MEX", "MX"),
+    ("ATL", "ATL", "US"),
+]
+_AEROLINEAS = ["AA", "AV", "CM", "LA", "IB", "DL", "UA", "AM"]
+
+
+def _hora(rng):
+    return f"{rng.randint(0, 23):02d}:{rng.choice(['00', '15', '30', '45'])}:00-05:00"
+
+
+def _schedule(rng, sid, origen, destino):
+    carrier = rng.choice(_AEROLINEAS)
+    numero = rng.randint(100, 9999)
+    return {
+        "id": sid,
+        "frequency": "SMTWTFS",
+        "stopCount": 0,
+        "eTicketable": True,
+        "totalMilesFlown": rng.randint(300, 4000),
+        "elapsedTime": rng.randint(60, 540),
+        "departure": {"airport": origen[0], "city": origen[1], "country": origen[2],
+                      "time": _hora(rng), "terminal": str(rng.randint(1, 3))},
+        "arrival": {"airport": destino[0], "city": destino[1], "country": destino[2],
+                    "time": _hora(rng), "terminal": str(rng.randint(1, 3)),
+                    "dateAdjustment": rng.choice([0, 0, 0, 1])},
+        "carrier": {"marketing": carrier, "marketingFlightNumber": numero,
+                    "operating": carrier, "operatingFlightNumber": numero,
+                    "equipment": {"code": rng.choice(["738", "320", "789", "E90"]),
+                                  "typeForFirstLeg": "N", "typeForLastLeg": "N"},
+                    "alliances": rng.choice(["", "OW ", "SA ", "ST "])},
+    }
+
+
+def generar_respuesta_bfm(n_itinerarios, ida_vuelta=True, seed=None):
+    """Respuesta BFM sintetica con ``n_itinerarios`` opciones."""
+    rng = random.Random(seed if seed is not None else n_itinerarios)
+    origen, destino = _AEROPUERTOS[0], _AEROPUERTOS[6]
+    conexiones = [a for a in _AEROPUERTOS if a not in (origen, destino)]
+
+    schedules, legs, fare_descs = [], [], []
+
+    def _nuevo_leg(desde, hasta):
+        escalas = rng.choice([0, 1, 1, 2])
+        puntos = [desde] + rng.sample(conexiones, escalas) + [hasta]
+        refs = []
+        for a, b in pairwise(puntos):
+            sid = len(schedules) + 1
+            schedules.append(_schedule(rng, sid, a, b))
+            refs.append({"ref": sid})
+        lid = len(legs) + 1
+        legs.append({
+            "id": lid,
+            "elapsedTime": sum(schedules[r["ref"] - 1]["elapsedTime"] for r in refs) + 90 * escalas,
+            "schedules": refs,
+        })
+        return lid, puntos
+
+    # BFM reutiliza legs entre itinerarios: ~n/3 legs por direccion
+    legs_ida = [_nuevo_leg(origen, destino) for _ in range(max(n_itinerarios // 3, 1))]
+    legs_vuelta = [_nuevo_leg(destino, origen) for _ in range(max(n_itinerarios // 3, 1))]
+
+    for i in range(20):
+        fare_descs.append({
+            "id": i + 1,
+            "fareBasisCode": f"{rng.choice('YBMHKLQV')}{rng.choice(['LF', 'OW', 'RT'])}{i}EC",
+            "governingCarrier": rng.choice(_AEROLINEAS),
+            "cabinCode": "Y",
+            "fareAmount": round(rng.uniform(80, 900), 2),
+            "fareCurrency": "USD",
+            "brandCode": rng.choice([None, "BASIC", "MAIN", "FLEX"]),
+        })
+
+    def _fare_component(puntos):
+        segmentos = []
+        for _ in puntos[1:]:
+            segmentos.append({"segment": {"bookingCode": rng.choice("YBMHKLQV"),
+                                          "cabinCode": "Y", "mealCode": "M",
+                                          "seatsAvailable": rng.randint(1, 9)}})
+        # Entradas vacias tipo surface/hidden que NO corresponden a schedules
+        if rng.random() < 0.2:
+            segmentos.insert(0, {"surface": True})
+        return {"ref": rng.randint(1, len(fare_descs)), "beginAirport": puntos[0][0],
+                "endAirport": puntos[-1][0], "segments": segmentos,
+                "brandCode": rng.choice([None, "MAIN"])}
+
+    itinerarios = []
+    for idx in range(n_itinerarios):
+        lid_ida, puntos_ida = rng.choice(legs_ida)
+        leg_refs = [{"ref": lid_ida, "departureDateAdjustment": 0}]
+        componentes = [_fare_component(puntos_ida)]
+        if ida_vuelta:
+            lid_vuelta, puntos_vuelta = rng.choice(legs_vuelta)
+            leg_refs.append({"ref": lid_vuelta, "departureDateAdjustment": 0})
+            componentes.append(_fare_component(puntos_vuelta))
+        total = round(rng.uniform(250, 2500), 2)
+        itinerarios.append({
+            "id": idx + 1,
+            "pricingSource": "ADVJR1",
+            "legs": leg_refs,
+            "pricingInformation": [{
+                "pricingSubsource": "MIP",
+                "fare": {
+                    "validatingCarrierCode": rng.choice(_AEROLINEAS),
+                    "vita": True,
+                    "lastTicketDate": "2026-09-10",
+                    "lastTicketTime": "23:59",
+                    "passengerInfoList": [{"passengerInfo": {
+                        "passengerType": "ADT", "passengerNumber": 1,
+                        "fareComponents": componentes,
+                    }}],
+                    "totalFare": {"totalPrice": total, "totalTaxAmount": round(total * 0.18, 2),
+                                  "currency": "USD", "baseFareAmount": round(total * 0.82, 2),
+                                  "baseFareCurrency": "USD", "equivalentAmount": total,
+                                  "equivalentCurrency": "USD"},
+                },
+            }],
+        })
+
+    leg_descriptions = [{"departureDate": "2026-09-15", "departureLocation": origen[0],
+                         "arrivalLocation": destino[0]}]
+    if ida_vuelta:
+        leg_descriptions.append({"departureDate": "2026-09-22",
+                                 "departureLocation": destino[0],
+                                 "arrivalLocation": origen[0]})
+
+    return {
+        "groupedItineraryResponse": {
+            "version": "6.1.0",
+            "messages": [],
+            "statistics": {"itineraryCount": n_itinerarios},
+            "scheduleDescs": schedules,
+            "legDescs": legs,
+            "fareComponentDescs": fare_descs,
+            "itineraryGroups": [{
+                "groupDescription": {"legDescriptions": leg_descriptions},
+                "itineraries": itinerarios,
+            }],
+        }
+    }
+
+
+def cargar_respuesta_bfm(n_itinerarios):
+    """Respuesta grabada ``fixtures/bfm_<N>.json`` o, si no existe, la sintetica."""
+    ruta = FIXTURES_DIR / f"bfm_{n_itinerarios}.json"
+    if ruta.exists():
+        return json.loads(ruta.read_text(encoding="utf-8"))
+    return generar_respuesta_bfm(n_itinerarios)
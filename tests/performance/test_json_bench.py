@@ -0,0 +1,56 @@
+"""Benchmarks de JSON: libreria estandar/DRF contra orjson (``servicios.jsonRapido``).
+
+Mide por tamano de respuesta BFM las dos pasadas JSON de una busqueda:
+
+* ``decode``: cuerpo crudo de Sabre -> dict (``response.json()``).
+* ``render``: resultados normalizados -> bytes de la respuesta HTTP.
+
+La diferencia de medias entre ``estandar`` y ``orjson`` de un mismo grupo es
+la CPU ahorrada por peticion. Las variantes orjson se omiten si la libreria
+no esta instalada.
+"""
+
+import json
+
+import django
+import pytest
+from sabre_fixtures import TAMANOS, cargar_respuesta_bfm
+
+django.setup()
+
+from rest_framework.renderers import JSONRenderer
+
+from servicios import jsonRapido
+from servicios.searchFlights import procesar_respuesta
+
+IMPLEMENTACIONES = [
+    "estandar",
+    pytest.param("orjson", marks=pytest.mark.skipif(
+        not jsonRapido.ORJSON_DISPONIBLE, reason="orjson no instalado")),
+]
+
+
+@pytest.mark.parametrize("implementacion", IMPLEMENTACIONES)
+@pytest.mark.parametrize("n_itinerarios", TAMANOS)
+def test_decode_respuesta_sabre(benchmark, n_itinerarios, implementacion):
+    cuerpo = json.dumps(cargar_respuesta_bfm(n_itinerarios)).encode("utf-8")
+    decodificar = json.loads if implementacion == "estandar" else jsonRapido.loads
+    benchmark.group = f"decode-{n_itinerarios}"
+    benchmark.extra_info["bytes"] = len(cuerpo)
+
+    data = benchmark(decodificar, cuerpo)
+
+    assert "groupedItineraryResponse" in data
+
+
+@pytest.mark.parametrize("implementacion", IMPLEMENTACIONES)
+@pytest.mark.parametrize("n_itinerarios", TAMANOS)
+def test_render_resultados(benchmark, n_itinerarios, implementacion):
+    resultados = procesar_respuesta(cargar_respuesta_bfm(n_itinerarios))
+    renderer = JSONRenderer() if implementacion == "estandar" else jsonRapido.JSONRapidoRenderer()
+    benchmark.group = f"render-{n_itinerarios}"
+
+    contenido = benchmark(renderer.render, resultados)
+
+    benchmark.extra_info["bytes"] = len(contenido)
+    assert json.loads(contenido) == json.loads(JSONRenderer().render(resultados))
@@ -0,0 +1,41 @@
+"""Benchmarks del normalizador de respuestas BFM (``procesar_respuesta``).
+
+Ejecutar::
+
+    pytest tests/performance --benchmark-only
+
+Mide el tiempo de parseo con pytest-benchmark y registra el pico de memoria
+(tracemalloc) en ``extra_info`` para cada tamano de respuesta.
+"""
+
+import tracemalloc
+
+import django
+import pytest
+from sabre_fixtures import TAMANOS, cargar_respuesta_bfm
+
+django.setup()
+
+from servicios.searchFlights import procesar_respuesta
+
+
+def _pico_memoria_kib(data):
+    tracemalloc.start()
+    try:
+        procesar_respuesta(data)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(pico / 1024, 1)
+
+
+@pytest.mark.parametrize("n_itinerarios", TAMANOS)
+def test_procesar_respuesta(benchmark, n_itinerarios):
+    data = cargar_respuesta_bfm(n_itinerarios)
+
+    resultados = benchmark(procesar_respuesta, data)
+
+    assert isinstance(resultados, list)
+    assert len(resultados) == n_itinerarios
+    benchmark.extra_info["itinerarios"] = n_itinerarios
+    benchmark.extra_info["pico_memoria_kib"] = _pico_memoria_kib(data)
@@ -0,0 +1,27 @@
+"""Benchmarks de la consulta paginada sobre una busqueda cacheada.
+
+Filtro + orden + ranking de ``pagina_de_resultados`` sobre las columnas
+precalculadas por ``procesar_respuesta`` (``columnasVuelos``).
+"""
+
+import django
+import pytest
+from sabre_fixtures import TAMANOS, cargar_respuesta_bfm
+
+django.setup()
+
+from servicios.resultadosBusqueda import pagina_de_resultados
+from servicios.searchFlights import procesar_respuesta
+
+CONSULTA = {"max_escalas": "1", "precio_max": "2000", "salida_desde": "06:00",
+            "orden": "mejor", "por_pagina": "20"}
+
+
+@pytest.mark.parametrize("n_itinerarios", TAMANOS)
+def test_pagina_de_resultados(benchmark, n_itinerarios):
+    resultados = procesar_respuesta(cargar_respuesta_bfm(n_itinerarios))
+
+    pagina = benchmark(pagina_de_resultados, resultados, CONSULTA, "sesion")
+
+    assert pagina["total_sin_filtros"] == n_itinerarios
+    assert len(pagina["resultados"]) <= 20
@@ -0,0 +1,44 @@
+"""Benchmarks del mapa de asientos simulado (SEATMAP_SANDBOX).
+
+En pruebas de carga contra staging el simulador debe costar poco para que
+se mida nuestro codigo: layouts precalculados + ocupacion por semilla.
+"""
+
+import django
+import pytest
+
+django.setup()
+
+from servicios.seatMapCompacto import compactar_mapa
+from servicios.seatMapFlight import _construir_payload, _respuesta_sandbox
+
+OPCION = {
+    "tramos": [
+        {"segmentos": [{
+            "origen": "UIO", "destino": "MIA", "aerolinea": {"codigo": "AA"},
+            "numero_vuelo": 1000, "clase_servicio": "Y", "cabina": cabina,
+            "fecha_hora_salida": "2026-09-15T10:00:00",
+            "fecha_hora_llegada": "2026-09-15T15:00:00",
+        }]}
+        for cabina in ("Y", "W", "C")
+    ],
+    "fare_info": [{"end": "MIA", "governing_carrier": "AA", "fare_amount": "500"}],
+}
+PASAJEROS = [{"passengerType": "ADT", "givenName": "TEST", "surname": "TEST"}]
+
+
+@pytest.fixture(scope="module")
+def payload():
+    return _construir_payload(OPCION, PASAJEROS)
+
+
+def test_mapa_sandbox(benchmark, payload):
+    cuerpo, seg_ids, _ = payload
+    mapa = benchmark(_respuesta_sandbox, cuerpo, seg_ids, "USD")
+    assert len(mapa["mapas"]) == 3
+
+
+def test_mapa_sandbox_compacto(benchmark, payload):
+    cuerpo, seg_ids, _ = payload
+    compacto = benchmark(lambda: compactar_mapa(_respuesta_sandbox(cuerpo, seg_ids, "USD")))
+    assert compacto["formato"] == "compacto-1"